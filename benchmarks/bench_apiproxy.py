@@ -0,0 +1,222 @@
+"""接口代理基准测试：机器人直连开放平台与经中继代理调用的回复延迟、上游连接数与access_token获取次数
+
+在临时目录中启动模拟开放平台（openapi_stub.py，HTTPS自签名证书）与开启接口代理的服务端，
+N个机器人各自并发发送R次回复请求（另有不计入结果的预热请求），分别测试：
+  direct        每个机器人独立的httpx客户端（长连接）与独立获取的access_token（现状）
+  direct_fresh  每次回复新建连接（未复用连接的机器人进程，每次都完成TLS握手）
+  proxy         机器人经 /ws/{secret} 发送 {"op": "api"} 帧，由中继共享连接池与access_token
+
+用法:
+  python benchmarks/bench_apiproxy.py --bots 200 --requests 10 --latency-ms 5
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import shutil
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+import httpx
+import websockets
+
+from benchmarks.loadtest import free_port, percentiles, process_usage
+from benchmarks.restart import LAUNCHER, wait_listeners
+
+CONFIG_TEMPLATE = """服务端信息:
+  ip: "127.0.0.1"
+  port: {port}
+  workers: 1
+日志等级:
+  leave: "WARNING"
+  format: "fast"
+接口代理:
+  enable: true
+  base_url: "{base_url}"
+  token_url: "{base_url}/app/getAppAccessToken"
+  max_connections: {max_connections}
+  max_keepalive: {max_connections}
+  pool_shards: {pool_shards}
+  max_concurrency: {max_concurrency}
+  ca_file: "{ca_file}"
+"""
+
+MODES = ("direct", "direct_fresh", "proxy")
+
+
+def reply_body(bot: int, n: int) -> dict:
+    return {"content": f"reply {n}", "msg_type": 0, "msg_id": f"bench-{bot}-{n}", "msg_seq": n}
+
+
+async def fetch_token(client: httpx.AsyncClient, base_url: str, appid: str, secret: str) -> str:
+    response = await client.post(f"{base_url}/app/getAppAccessToken", json={"appId": appid, "clientSecret": secret})
+    return response.json()["access_token"]
+
+
+async def run_direct(args, base_url: str, ca_file: str, fresh: bool) -> list:
+    """现状：机器人各自获取access_token并直连开放平台"""
+    latencies = []
+    context = ssl.create_default_context(cafile=ca_file)
+
+    async def bot(i: int):
+        appid, secret = str(100000 + i), f"bench-bot-{i}"
+        async with httpx.AsyncClient(verify=context) as client:
+            token = await fetch_token(client, base_url, appid, secret)
+            headers = {"Authorization": f"QQBot {token}", "X-Union-Appid": appid}
+            for n in range(-args.warmup, args.requests):
+                url = f"{base_url}/v2/groups/group-{i}/messages"
+                started = time.perf_counter()
+                if fresh:
+                    async with httpx.AsyncClient(verify=context) as once:
+                        response = await once.post(url, json=reply_body(i, n), headers=headers)
+                else:
+                    response = await client.post(url, json=reply_body(i, n), headers=headers)
+                if n >= 0:
+                    latencies.append(time.perf_counter() - started)
+                response.raise_for_status()
+
+    await asyncio.gather(*(bot(i) for i in range(args.bots)))
+    return latencies
+
+
+async def run_proxy(args, port: int) -> list:
+    """经中继的接口代理调用"""
+    latencies = []
+    counter = itertools.count(1)
+
+    async def bot(i: int):
+        appid, secret = str(100000 + i), f"bench-bot-{i}"
+        uri = f"ws://127.0.0.1:{port}/ws/{secret}?appid={appid}"
+        async with websockets.connect(uri, ping_interval=None, max_size=None) as ws:
+            for n in range(-args.warmup, args.requests):
+                request_id = next(counter)
+                frame = {"op": "api", "id": request_id, "method": "POST",
+                         "path": f"/v2/groups/group-{i}/messages", "body": reply_body(i, n)}
+                started = time.perf_counter()
+                await ws.send(json.dumps(frame))
+                while True:
+                    message = json.loads(await ws.recv())
+                    if isinstance(message, dict) and message.get("op") == "api" and message.get("id") == request_id:
+                        break
+                if n >= 0:
+                    latencies.append(time.perf_counter() - started)
+                if message.get("status") != 200:
+                    raise RuntimeError(f"接口代理调用失败: {message}")
+
+    await asyncio.gather(*(bot(i) for i in range(args.bots)))
+    return latencies
+
+
+async def stub_stats(base_url: str, ca_file: str) -> dict:
+    async with httpx.AsyncClient(verify=ssl.create_default_context(cafile=ca_file)) as client:
+        return (await client.get(f"{base_url}/_stub/stats")).json()
+
+
+def start(command, directory: Path, verbose: bool) -> subprocess.Popen:
+    return subprocess.Popen(command, cwd=directory, stdout=subprocess.DEVNULL,
+                            stderr=None if verbose else subprocess.DEVNULL)
+
+
+def stop(process: subprocess.Popen):
+    if process.poll() is None:
+        process.kill()
+    process.wait()
+
+
+async def measure(args, directory: Path, mode: str) -> dict:
+    """每种模式使用全新的模拟开放平台，连接数与token获取次数互不干扰"""
+    stub_port = free_port()
+    base_url = f"https://127.0.0.1:{stub_port}"
+    ca_file = str(directory / "cert" / "stub.crt")
+    processes = [start([sys.executable, str(REPO_ROOT / "benchmarks" / "openapi_stub.py"), "--port", str(stub_port),
+                        "--tls", "--cert-dir", str(directory / "cert"), "--latency-ms", str(args.latency_ms)],
+                       directory, args.verbose)]
+    try:
+        await wait_listeners(stub_port, 1)
+        relay = None
+        if mode == "proxy":
+            port = free_port()
+            (directory / "setconfig.yaml").write_text(CONFIG_TEMPLATE.format(
+                port=port, base_url=base_url, ca_file=ca_file, max_connections=args.max_connections,
+                max_concurrency=args.max_concurrency, pool_shards=args.pool_shards,
+            ), encoding="utf-8")
+            (directory / "server.py").write_text(
+                LAUNCHER.format(repo=str(REPO_ROOT), main=str(REPO_ROOT / "main.py")), encoding="utf-8")
+            relay = start([sys.executable, str(directory / "server.py")], directory, args.verbose)
+            processes.append(relay)
+            await wait_listeners(port, 1)
+        before = process_usage(relay.pid if relay else None)
+        started = time.perf_counter()
+        if mode == "proxy":
+            latencies = await run_proxy(args, port)
+        else:
+            latencies = await run_direct(args, base_url, ca_file, mode == "direct_fresh")
+        elapsed = time.perf_counter() - started
+        after = process_usage(relay.pid if relay else None)
+        upstream = await stub_stats(base_url, ca_file)
+        result = {
+            "latency_ms": percentiles(latencies),
+            "throughput": round(len(latencies) / elapsed, 1),
+            # 减去读取统计本身的一个连接
+            "upstream_connections": upstream["connections"] - 1,
+            "token_fetches": upstream["token_fetches"],
+            "unauthorized": upstream["unauthorized"],
+        }
+        if relay:
+            result["relay_cpu_s"] = round(after["cpu"] - before["cpu"], 2)
+        return result
+    finally:
+        for process in processes:
+            stop(process)
+
+
+async def run(args) -> dict:
+    directory = Path(tempfile.mkdtemp(prefix="qqwebhook-apiproxy-"))
+    try:
+        results = {}
+        for mode in args.modes:
+            results[mode] = result = await measure(args, directory, mode)
+            print(f"{mode:>13}: p50 {result['latency_ms']['p50']:.2f} ms，p99 {result['latency_ms']['p99']:.2f} ms，"
+                  f"上游连接 {result['upstream_connections']}，获取token {result['token_fetches']} 次",
+                  file=sys.stderr)
+        return {
+            "bots": args.bots,
+            "requests_per_bot": args.requests,
+            "upstream_latency_ms": args.latency_ms,
+            "results": results,
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bots", type=int, default=200, help="机器人数量")
+    parser.add_argument("--requests", type=int, default=10, help="每个机器人的回复次数")
+    parser.add_argument("--warmup", type=int, default=1, help="每个机器人不计入结果的预热请求数（首次调用包含建立连接）")
+    parser.add_argument("--latency-ms", type=float, default=5, help="模拟开放平台的接口处理耗时（毫秒）")
+    parser.add_argument("--max-connections", type=int, default=100, help="中继连接池上限")
+    parser.add_argument("--pool-shards", type=int, default=16, help="中继HTTP/1.1连接池分片数")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="中继每个机器人的并发上限")
+    parser.add_argument("--modes", type=lambda value: value.split(","), default=list(MODES),
+                        help="测试模式，逗号分隔（direct,direct_fresh,proxy）")
+    parser.add_argument("--output", help="结果写入JSON文件")
+    parser.add_argument("--verbose", action="store_true", help="显示服务端日志")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""请求体内存基准测试：混入超大请求体时服务端常驻内存（RSS）与在途请求体字节数峰值
+
+在临时目录中以独立配置启动服务端，一个WebSocket客户端接收事件，
+并发发送正常大小的事件与一定比例的超大请求体（分块传输，每块之间短暂停顿，模拟慢速或恶意客户端），
+期间持续采样服务端RSS。分别以请求体上限 --max-kb（默认配置）与一个足以容纳全部请求体的上限（相当于不限制）运行，
+输出RSS峰值、/stats 中的在途字节数峰值与被拒绝的请求数。
+
+用法:
+  python benchmarks/bench_body.py --requests 400 --concurrency 32 --large-mb 8 --large-ratio 0.1
+"""
+import argparse
+import asyncio
+import json
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+import websockets
+
+from benchmarks.loadtest import free_port, process_usage
+from benchmarks.payloads import message_event
+from benchmarks.restart import LAUNCHER, wait_listeners
+
+CONFIG_TEMPLATE = """服务端信息:
+  ip: "127.0.0.1"
+  port: {port}
+  workers: 1
+日志等级:
+  leave: "ERROR"
+  format: "fast"
+事件去重:
+  enable: false
+请求体:
+  max_kb: {max_kb}
+监控指标:
+  public: true
+"""
+
+SECRET = "bench-body"
+# 超大请求体每次写入的块大小与块间停顿
+CHUNK_SIZE = 64 << 10
+CHUNK_PAUSE = 0.001
+
+
+async def post(port: int, body: bytes, chunked: bool) -> int:
+    """发送一个Webhook请求，返回状态码（服务端提前应答时停止发送）"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        head = f"POST /webhook?secret={SECRET} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n"
+        if not chunked:
+            writer.write(f"{head}Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        else:
+            writer.write(f"{head}Transfer-Encoding: chunked\r\n\r\n".encode())
+            for offset in range(0, len(body), CHUNK_SIZE):
+                if reader.at_eof() or writer.is_closing():
+                    break
+                part = body[offset:offset + CHUNK_SIZE]
+                writer.write(b"%x\r\n%s\r\n" % (len(part), part))
+                await writer.drain()
+                await asyncio.sleep(CHUNK_PAUSE)
+            else:
+                writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        status = await reader.readline()
+        return int(status.split()[1])
+    except (ConnectionError, IndexError, ValueError):
+        # 服务端拒绝后关闭连接
+        return 413
+    finally:
+        writer.close()
+
+
+async def sample_rss(pid: int, stop: asyncio.Event, samples: list):
+    while not stop.is_set():
+        samples.append(process_usage(pid)["rss"])
+        await asyncio.sleep(0.05)
+
+
+async def stats(port: int) -> dict:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /stats HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n")
+    data = await reader.read()
+    writer.close()
+    return json.loads(data.split(b"\r\n\r\n", 1)[1])
+
+
+async def measure(args, max_kb: int) -> dict:
+    port = free_port()
+    directory = Path(tempfile.mkdtemp(prefix="qqwebhook-body-"))
+    (directory / "setconfig.yaml").write_text(CONFIG_TEMPLATE.format(port=port, max_kb=max_kb), encoding="utf-8")
+    (directory / "server.py").write_text(
+        LAUNCHER.format(repo=str(REPO_ROOT), main=str(REPO_ROOT / "main.py")), encoding="utf-8")
+    server = subprocess.Popen([sys.executable, str(directory / "server.py")], cwd=directory,
+                              stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL)
+    try:
+        await wait_listeners(port, 1)
+        rng = random.Random(args.seed)
+        large = b'{"op": 0, "id": "large", "d": {"content": "' + b"x" * (args.large_mb << 20) + b'"}}'
+        plan = [rng.random() < args.large_ratio for _ in range(args.requests)]
+        async with websockets.connect(f"ws://127.0.0.1:{port}/ws/{SECRET}", max_size=None,
+                                      ping_interval=None) as ws:
+            received = 0
+
+            async def consume():
+                nonlocal received
+                async for _ in ws:
+                    received += 1
+
+            consumer = asyncio.ensure_future(consume())
+            await asyncio.sleep(0.5)
+            baseline = process_usage(server.pid)["rss"]
+            stop = asyncio.Event()
+            samples = []
+            sampler = asyncio.ensure_future(sample_rss(server.pid, stop, samples))
+            semaphore = asyncio.Semaphore(args.concurrency)
+            statuses = {}
+
+            async def send(i: int, is_large: bool):
+                async with semaphore:
+                    body = large if is_large else message_event(args.event_size, event_id=f"body-{i}")
+                    status = await post(port, body, chunked=is_large)
+                    statuses[status] = statuses.get(status, 0) + 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(send(i, is_large) for i, is_large in enumerate(plan)))
+            elapsed = time.perf_counter() - started
+            await asyncio.sleep(0.5)
+            stop.set()
+            await sampler
+            consumer.cancel()
+        body = (await stats(port))["body"]
+        return {
+            "max_kb": max_kb,
+            "large_requests": sum(plan),
+            "statuses": statuses,
+            "events_received": received,
+            "elapsed_s": round(elapsed, 2),
+            "rss_baseline_mb": round(baseline / 2 ** 20, 1),
+            "rss_peak_mb": round(max(samples) / 2 ** 20, 1),
+            "rss_growth_mb": round((max(samples) - baseline) / 2 ** 20, 1),
+            "in_flight_peak_mb": round(body["peak_bytes"] / 2 ** 20, 2),
+            "rejected": body["rejected"],
+        }
+    finally:
+        if server.poll() is None:
+            server.kill()
+        server.wait()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+async def run(args) -> dict:
+    results = {}
+    # 上限足以容纳全部请求体时相当于不限制
+    for label, max_kb in (("bounded", args.max_kb), ("unbounded", (args.large_mb << 10) * 2)):
+        results[label] = result = await measure(args, max_kb)
+        print(f"{label:>9}: RSS峰值增长 {result['rss_growth_mb']:.1f} MB，在途请求体峰值 {result['in_flight_peak_mb']:.2f} MB，"
+              f"拒绝 {result['rejected']}", file=sys.stderr)
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "large_mb": args.large_mb,
+        "large_ratio": args.large_ratio,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--event-size", type=int, default=1024, help="正常事件大小（字节）")
+    parser.add_argument("--large-mb", type=int, default=8, help="超大请求体大小（MB）")
+    parser.add_argument("--large-ratio", type=float, default=0.1, help="超大请求体所占比例")
+    parser.add_argument("--max-kb", type=int, default=1024, help="受限运行时的请求体上限（KB）")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="结果写入JSON文件")
+    parser.add_argument("--verbose", action="store_true", help="显示服务端日志")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
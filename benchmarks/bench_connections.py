@@ -0,0 +1,271 @@
+"""空闲连接内存基准测试：每个WebSocket连接占用的服务端常驻内存（RSS）
+
+在临时目录中以独立配置启动服务端，由若干客户端子进程（各自绑定不同的127.0.0.x源地址，避免临时端口耗尽）
+建立N个空闲WebSocket连接（每个连接使用独立密钥，模拟多租户部署），
+记录连接前后服务端RSS之差除以连接数，以及空闲期间服务端的CPU占用。
+开启 --keepalive 时服务端启用应用层保活，客户端应答 {"op": "ping"}。
+
+每个进程可打开的文件数受 RLIMIT_NOFILE 硬限制，超出服务端可用文件数的连接数会被跳过并在结果中注明。
+
+用法:
+  python benchmarks/bench_connections.py --counts 10000,50000
+  python benchmarks/bench_connections.py --counts 1000,5000 --keepalive --idle-timeout 2 --idle 10
+"""
+import argparse
+import asyncio
+import json
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from benchmarks.loadtest import free_port, process_usage
+from benchmarks.restart import LAUNCHER, wait_listeners
+
+CONFIG_TEMPLATE = """服务端信息:
+  ip: "127.0.0.1"
+  port: {port}
+  workers: 1
+日志等级:
+  leave: "ERROR"
+  format: "fast"
+连接保活:
+  enable: {keepalive}
+  idle_timeout: {idle_timeout}
+  evict_timeout: {evict_timeout}
+"""
+
+# 服务端进程启动时将文件数软限制提高到硬限制
+SERVER_LAUNCHER = """import resource
+soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+""" + LAUNCHER
+
+# 每个客户端子进程的连接数上限（受文件数限制）
+CONNECTIONS_PER_CLIENT = 15000
+# 建立连接时的最大并发握手数（不超过服务端监听队列）
+HANDSHAKE_CONCURRENCY = 128
+# 预留给服务端自身（监听套接字、日志、离线缓存等）的文件数
+RESERVED_FDS = 100
+
+HANDSHAKE = ("GET /ws/{secret} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+             "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\nSec-WebSocket-Version: 13\r\n\r\n")
+# 客户端帧须掩码，使用全零掩码键（负载保持原样）
+PONG_FRAME = b"\x81" + bytes([0x80 | 13]) + b"\x00\x00\x00\x00" + b'{"op":"pong"}'
+
+
+# ---------------------------------------------------------------- 客户端子进程
+
+class IdleClient(asyncio.Protocol):
+    """最小化的WebSocket客户端：完成握手后保持空闲，只应答ping"""
+
+    def __init__(self, secret: str, port: int, pong: bool, state: dict):
+        self.secret = secret
+        self.port = port
+        self.pong = pong
+        self.state = state
+        self.handshake = asyncio.get_running_loop().create_future()
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.write(HANDSHAKE.format(secret=self.secret, port=self.port).encode())
+
+    def data_received(self, data: bytes):
+        if not self.handshake.done():
+            self.handshake.set_result(data.startswith(b"HTTP/1.1 101"))
+            return
+        if data[:1] == b"\x89":
+            # 协议层ping：原样回复pong（负载不超过125字节）
+            payload = data[2:2 + (data[1] & 0x7F)]
+            self.transport.write(b"\x8a" + bytes([0x80 | len(payload)]) + b"\x00\x00\x00\x00" + payload)
+        elif self.pong and b'"op": "ping"' in data:
+            self.transport.write(PONG_FRAME)
+
+    def connection_lost(self, exc):
+        if not self.handshake.done():
+            self.handshake.set_result(False)
+        elif not self.state["stopping"]:
+            self.state["closed"] += 1
+
+
+async def run_clients(args):
+    loop = asyncio.get_running_loop()
+    state = {"closed": 0, "stopping": False}
+    clients = []
+    semaphore = asyncio.Semaphore(HANDSHAKE_CONCURRENCY)
+
+    async def connect(i: int):
+        async with semaphore:
+            client = IdleClient(f"idle-{args.source}-{i}", args.port, args.pong, state)
+            await loop.create_connection(lambda: client, "127.0.0.1", args.port, local_addr=(args.source, 0))
+            if not await client.handshake:
+                raise RuntimeError("握手失败")
+            clients.append(client)
+
+    await asyncio.gather(*(connect(i) for i in range(args.count)))
+    print(f"ready {len(clients)}", flush=True)
+    # 等待父进程关闭标准输入
+    await loop.run_in_executor(None, sys.stdin.read)
+    print(f"closed {state['closed']}", flush=True)
+    state["stopping"] = True
+    for client in clients:
+        client.transport.abort()
+
+
+# ---------------------------------------------------------------- 父进程
+
+def raise_fd_limit() -> int:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+class ClientGroup:
+    """按 CONNECTIONS_PER_CLIENT 拆分的客户端子进程"""
+
+    def __init__(self, port: int, count: int, pong: bool):
+        self.processes = []
+        index = 0
+        while count > 0:
+            batch = min(count, CONNECTIONS_PER_CLIENT)
+            index += 1
+            command = [sys.executable, __file__, "--client", "--port", str(port), "--count", str(batch),
+                       "--source", f"127.0.0.{index + 1}"]
+            if pong:
+                command.append("--pong")
+            self.processes.append(subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                                   text=True))
+            count -= batch
+
+    async def wait_ready(self, timeout: float) -> int:
+        loop = asyncio.get_running_loop()
+        lines = await asyncio.wait_for(asyncio.gather(
+            *(loop.run_in_executor(None, process.stdout.readline) for process in self.processes)), timeout)
+        if not all(line.startswith("ready") for line in lines):
+            raise RuntimeError("客户端建立连接失败")
+        return sum(int(line.split()[1]) for line in lines)
+
+    def stop(self) -> int:
+        """关闭全部连接，返回空闲期间被服务端关闭的连接数"""
+        closed = 0
+        for process in self.processes:
+            try:
+                process.stdin.close()
+                line = process.stdout.readline()
+                if line.startswith("closed"):
+                    closed += int(line.split()[1])
+            except OSError:
+                pass
+        for process in self.processes:
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        return closed
+
+
+async def measure(args, count: int) -> dict:
+    port = free_port()
+    directory = Path(tempfile.mkdtemp(prefix="qqwebhook-conns-"))
+    (directory / "setconfig.yaml").write_text(CONFIG_TEMPLATE.format(
+        port=port, keepalive="true" if args.keepalive else "false",
+        idle_timeout=args.idle_timeout, evict_timeout=args.evict_timeout,
+    ), encoding="utf-8")
+    (directory / "server.py").write_text(
+        SERVER_LAUNCHER.format(repo=str(REPO_ROOT), main=str(REPO_ROOT / "main.py")), encoding="utf-8")
+    server = subprocess.Popen([sys.executable, str(directory / "server.py")], cwd=directory,
+                              stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL)
+    try:
+        await wait_listeners(port, 1)
+        # 预热：建立并断开少量连接，使导入与首次分配不计入结果
+        warmup = ClientGroup(port, min(100, count), args.keepalive)
+        await warmup.wait_ready(args.timeout)
+        warmup.stop()
+        await asyncio.sleep(1.0)
+        before = process_usage(server.pid)
+
+        started = time.perf_counter()
+        group = ClientGroup(port, count, args.keepalive)
+        try:
+            connected = await group.wait_ready(args.timeout)
+            connect_seconds = time.perf_counter() - started
+            await asyncio.sleep(1.0)
+            loaded = process_usage(server.pid)
+            await asyncio.sleep(args.idle)
+            idle = process_usage(server.pid)
+        finally:
+            evicted = group.stop()
+        return {
+            "connections": connected,
+            "connect_s": round(connect_seconds, 2),
+            "rss_before_mb": round(before["rss"] / 2 ** 20, 1),
+            "rss_after_mb": round(idle["rss"] / 2 ** 20, 1),
+            "rss_per_connection_kb": round((idle["rss"] - before["rss"]) / connected / 1024, 2),
+            "idle_cpu_pct": round((idle["cpu"] - loaded["cpu"]) / args.idle * 100, 2),
+            "closed_by_server": evicted,
+        }
+    finally:
+        if server.poll() is None:
+            server.kill()
+        server.wait()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+async def run(args) -> dict:
+    limit = raise_fd_limit()
+    results = {}
+    for count in args.counts:
+        if count > limit - RESERVED_FDS:
+            results[str(count)] = {"skipped": f"超出服务端可打开的文件数（RLIMIT_NOFILE={limit}）"}
+            print(f"{count:>7}: 跳过（RLIMIT_NOFILE={limit}）", file=sys.stderr)
+            continue
+        results[str(count)] = result = await measure(args, count)
+        print(f"{count:>7}: {result['rss_per_connection_kb']:.2f} KB/连接，空闲CPU {result['idle_cpu_pct']:.2f}%",
+              file=sys.stderr)
+    return {
+        "keepalive": args.keepalive,
+        "idle_s": args.idle,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--counts", type=lambda value: [int(v) for v in value.split(",")], default=[10000, 50000],
+                        help="连接数，逗号分隔")
+    parser.add_argument("--idle", type=float, default=5, help="连接建立后保持空闲的秒数")
+    parser.add_argument("--keepalive", action="store_true", help="开启服务端应用层保活")
+    parser.add_argument("--idle-timeout", type=float, default=60)
+    parser.add_argument("--evict-timeout", type=float, default=30)
+    parser.add_argument("--timeout", type=float, default=300, help="建立全部连接的超时时间（秒）")
+    parser.add_argument("--output", help="结果写入JSON文件")
+    parser.add_argument("--verbose", action="store_true", help="显示服务端日志")
+    # 客户端子进程参数
+    parser.add_argument("--client", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--count", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--source", help=argparse.SUPPRESS)
+    parser.add_argument("--pong", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.client:
+        raise_fd_limit()
+        asyncio.run(run_clients(args))
+        return
+
+    result = asyncio.run(run(args))
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""事件去重基准测试：单事件耗时（提取去重键+检查记录）随缓存条目数的变化
+
+缓存条目数从1万增长到上限时单事件耗时应保持不变（O(1)），同时输出重复命中率与内存占用。
+用法: python benchmarks/bench_dedup.py [--events 100000] [--duplicate-ratio 0.05]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.payloads import message_event
+from src.dedup import DedupCache, event_key
+
+ID_PLACEHOLDER = b"0000000000"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.05)
+    parser.add_argument("--secrets", type=int, default=100)
+    args = parser.parse_args()
+
+    template = message_event(2048, event_id=ID_PLACEHOLDER.decode())
+    secrets = [f"secret-{i}" for i in range(args.secrets)]
+    rng = random.Random(1)
+    results = []
+    for fill in (10_000, 100_000, 1_000_000):
+        cache = DedupCache(ttl=3600, max_entries=fill * 10)
+        for i in range(fill):
+            cache.seen(secrets[i % args.secrets], f"GROUP_AT_MESSAGE_CREATE:{i:010d}")
+        bodies = []
+        for i in range(args.events):
+            seq = rng.randrange(fill) if rng.random() < args.duplicate_ratio else fill + i
+            bodies.append((secrets[seq % args.secrets], template.replace(ID_PLACEHOLDER, b"%010d" % seq)))
+        cache.checks = cache.duplicates = 0
+        start = time.perf_counter()
+        for secret, body in bodies:
+            cache.seen(secret, event_key(body))
+        per_event = (time.perf_counter() - start) / args.events * 1e6
+        stats = cache.stats()
+        results.append({"entries": stats["entries"], "us_per_event": round(per_event, 3),
+                        "hit_rate": stats["hit_rate"], "memory_mb": round(stats["memory_bytes"] / (1 << 20), 1)})
+        print(f"条目 {stats['entries']:>8}  {per_event:6.2f} µs/事件  命中率 {stats['hit_rate']:.3f}  "
+              f"内存 {stats['memory_bytes'] / (1 << 20):.1f} MB")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
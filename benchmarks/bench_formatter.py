@@ -0,0 +1,56 @@
+"""日志格式化基准测试：UltimateJSONFormatter（pretty） vs FastJSONFormatter（fast）
+
+以真实大小的QQ事件作为日志内容，统计每秒可格式化的记录数。
+用法: python benchmarks/bench_formatter.py [--records 2000]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.payloads import message_event
+from src.function import FastJSONFormatter, UltimateJSONFormatter
+
+
+def make_records(body: bytes, count: int):
+    """构造与handle_webhook一致的两类日志记录：带前缀的消息日志与纯JSON日志"""
+    text = body.decode()
+    records = []
+    for i in range(count):
+        if i % 2:
+            msg, args = "收到消息: %s", (text,)
+        else:
+            msg, args = "%s", (text,)
+        records.append(logging.LogRecord("QQwebhook", logging.INFO, __file__, 0, msg, args, None))
+    return records
+
+
+def measure(formatter: logging.Formatter, records) -> float:
+    start = time.perf_counter()
+    for record in records:
+        formatter.format(record)
+    return len(records) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--max-body", type=int, default=4096)
+    args = parser.parse_args()
+
+    results = []
+    for size in (512, 2048, 8192, 20480):
+        records = make_records(message_event(size), args.records)
+        pretty = measure(UltimateJSONFormatter(), records)
+        fast = measure(FastJSONFormatter(args.max_body), records)
+        results.append({"size": size, "pretty_rps": round(pretty), "fast_rps": round(fast)})
+        print(f"{size:>6}B  pretty: {pretty:>10.0f} rec/s  fast: {fast:>10.0f} rec/s  x{fast / pretty:.1f}")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
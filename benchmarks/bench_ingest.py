@@ -0,0 +1,83 @@
+"""对比旧版（Pydantic解析+重复读取+解码）与原始字节快速路径的单事件CPU耗时与内存分配
+
+用法: python benchmarks/bench_ingest.py [--rounds 2000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydantic import BaseModel
+
+from benchmarks.payloads import message_event
+from src.function import parse_validation_request
+
+
+class Payload(BaseModel):
+    d: dict
+
+
+def legacy_path(body: bytes):
+    """旧版路径：FastAPI解析请求体为模型，检查字段后再次解码转发"""
+    payload = Payload.model_validate(json.loads(body))
+    if "event_ts" in payload.d and "plain_token" in payload.d:
+        return None
+    return body.decode("utf-8")
+
+
+def fast_text_path(body: bytes):
+    """快速路径（文本帧）：定向检查后仅解码一次"""
+    if parse_validation_request(body) is not None:
+        return None
+    return body.decode("utf-8")
+
+
+def fast_binary_path(body: bytes):
+    """快速路径（二进制帧）：原始字节直接透传"""
+    if parse_validation_request(body) is not None:
+        return None
+    return body
+
+
+def measure(func, body: bytes, rounds: int) -> dict:
+    start = time.process_time()
+    for _ in range(rounds):
+        func(body)
+    cpu_us = (time.process_time() - start) / rounds * 1e6
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(100):
+        func(body)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    allocated = sum(max(0, s.size_diff) for s in stats)
+    return {"cpu_us": round(cpu_us, 2), "peak_bytes": peak, "retained_bytes": allocated}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    results = []
+    for size in (1024, 4096, 20480):
+        body = message_event(size)
+        row = {"size": len(body)}
+        for name, func in (("legacy", legacy_path), ("fast_text", fast_text_path), ("fast_binary", fast_binary_path)):
+            row[name] = measure(func, body, args.rounds)
+        results.append(row)
+        print(f"{len(body):>6}B  " + "  ".join(
+            f"{name}: {row[name]['cpu_us']:>8.2f}us peak={row[name]['peak_bytes']:>7}B"
+            for name in ("legacy", "fast_text", "fast_binary")))
+    print(json.dumps(results, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""优先级通道基准测试：低优先级事件洪峰下高优先级事件的推送延迟
+
+单个连接的模拟WebSocket每帧发送耗时固定（模拟客户端接收能力），以超过其能力的速率持续入队低优先级事件
+（成员变更、表情表态），同时以较低速率入队需要及时回复的消息事件，统计两类事件从入队到发送的延迟与送达数。
+分别测量不分通道（先进先出）、strict 与 weighted 调度，另外测量入队时提取事件类型并分类的单事件耗时。
+
+用法:
+  python benchmarks/bench_lanes.py --seconds 5 --send-ms 2 --low-rate 800 --high-rate 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.payloads import message_event
+from src.connection import ClientConnection
+from src.lanes import PriorityPolicy, SCHEDULE_STRICT, SCHEDULE_WEIGHTED
+from src.subscription import event_type
+
+HIGH_TYPE = "GROUP_AT_MESSAGE_CREATE"
+LOW_TYPES = ("GUILD_MEMBER_UPDATE", "MESSAGE_REACTION_ADD")
+
+
+class SlowWebSocket:
+    """每帧发送耗时固定的模拟WebSocket，记录各事件的发送时间"""
+
+    def __init__(self, send_delay: float, sent: dict):
+        self.send_delay = send_delay
+        self.sent = sent
+
+    async def send(self, message: dict):
+        await asyncio.sleep(self.send_delay)
+        self.sent[message["text"]] = time.perf_counter()
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def percentile(samples: list, q: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * q), len(samples) - 1)]
+
+
+async def produce(conn: ClientConnection, events: list, rate: float, seconds: float, enqueued: dict):
+    """按固定速率入队（每毫秒按应入队数量补足，避免依赖sleep精度）"""
+    started = time.perf_counter()
+    count = 0
+    while True:
+        elapsed = time.perf_counter() - started
+        if elapsed >= seconds:
+            return
+        while count < elapsed * rate:
+            body = events[count % len(events)]
+            enqueued[body.decode()] = time.perf_counter()
+            conn.enqueue(body)
+            count += 1
+        await asyncio.sleep(0.001)
+
+
+async def measure(args, schedule) -> dict:
+    sent = {}
+    policy = PriorityPolicy(schedule=schedule) if schedule else None
+    conn = ClientConnection(SlowWebSocket(args.send_ms / 1000, sent), "bench-lanes", max_size=args.queue_size,
+                            priority=policy)
+    conn.start()
+    # 事件内容互不相同，以文本区分
+    high = [message_event(args.event_size, HIGH_TYPE, f"high-{i}") for i in range(int(args.high_rate * args.seconds) + 1)]
+    low = [message_event(args.event_size, LOW_TYPES[i % 2], f"low-{i}") for i in range(int(args.low_rate * args.seconds) + 1)]
+    enqueued_high, enqueued_low = {}, {}
+    await asyncio.gather(
+        produce(conn, high, args.high_rate, args.seconds, enqueued_high),
+        produce(conn, low, args.low_rate, args.seconds, enqueued_low),
+    )
+    # 等待积压全部发送完毕
+    deadline = time.perf_counter() + args.seconds * 4
+    while conn.queue and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    await conn.stop()
+    result = {}
+    for label, enqueued in (("high", enqueued_high), ("low", enqueued_low)):
+        latencies = [sent[text] - at for text, at in enqueued.items() if text in sent]
+        result[label] = {
+            "enqueued": len(enqueued),
+            "sent": len(latencies),
+            "p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        }
+    result["dropped"] = conn.dropped
+    return result
+
+
+def classify_cost(args) -> dict:
+    """入队时提取事件类型（只匹配请求体末尾）并分类的单事件耗时，与完整解析JSON对比"""
+    policy = PriorityPolicy()
+    body = message_event(args.event_size, HIGH_TYPE)
+    number = 20000
+    peek = timeit.timeit(lambda: policy.lane(event_type(body)), number=number) / number
+    parse = timeit.timeit(lambda: policy.lane(json.loads(body).get("t")), number=number) / number
+    return {"peek_us": round(peek * 1e6, 2), "json_loads_us": round(parse * 1e6, 2)}
+
+
+async def run(args) -> dict:
+    results = {}
+    for label, schedule in (("fifo", None), ("strict", SCHEDULE_STRICT), ("weighted", SCHEDULE_WEIGHTED)):
+        results[label] = result = await measure(args, schedule)
+        print(f"{label:>8}: 高优先级 p50 {result['high']['p50_ms']:.1f} ms / p99 {result['high']['p99_ms']:.1f} ms，"
+              f"低优先级送达 {result['low']['sent']}/{result['low']['enqueued']}，丢弃 {result['dropped']}",
+              file=sys.stderr)
+    return {
+        "seconds": args.seconds,
+        "send_ms": args.send_ms,
+        "low_rate": args.low_rate,
+        "high_rate": args.high_rate,
+        "queue_size": args.queue_size,
+        "classify": classify_cost(args),
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--send-ms", type=float, default=2.0, help="模拟客户端每帧接收耗时（毫秒）")
+    parser.add_argument("--low-rate", type=float, default=800, help="低优先级事件速率（每秒）")
+    parser.add_argument("--high-rate", type=float, default=20, help="高优先级事件速率（每秒）")
+    parser.add_argument("--queue-size", type=int, default=1000, help="出站队列上限")
+    parser.add_argument("--event-size", type=int, default=1024, help="事件大小（字节）")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""指标记录开销基准测试
+
+按handle_webhook的埋点顺序（读取/识别/路由/总耗时四次observe与一次计数）记录指标，
+统计每个事件的记录耗时与内存分配，并在进程内（ASGI，不经过网络）对比有无埋点的Webhook请求吞吐。
+用法: python benchmarks/bench_metrics.py [--events 200000] [--requests 5000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import tracemalloc
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI, Request
+
+from benchmarks.payloads import message_event
+from src.function import parse_validation_request
+from src.metrics import (EVENTS_DELIVERED, STAGE_PARSE, STAGE_READ, STAGE_ROUTE, STAGE_TOTAL,
+                         MetricsRegistry)
+
+
+def record_event():
+    """与handle_webhook一致的一次完整埋点"""
+    started = perf_counter()
+    mark = perf_counter()
+    STAGE_READ.observe(mark - started)
+    now = perf_counter()
+    STAGE_PARSE.observe(now - mark)
+    mark = now
+    now = perf_counter()
+    STAGE_ROUTE.observe(now - mark)
+    STAGE_TOTAL.observe(now - started)
+    EVENTS_DELIVERED.inc()
+
+
+def measure_recording(events: int) -> float:
+    start = time.perf_counter()
+    for _ in range(events):
+        record_event()
+    return (time.perf_counter() - start) / events * 1e9
+
+
+def measure_allocations(events: int) -> int:
+    """稳定状态下每个事件新增的内存（字节）"""
+    record_event()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(events):
+        record_event()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    growth = sum(stat.size_diff for stat in after.compare_to(before, "filename")
+                 if stat.traceback[0].filename.endswith("metrics.py"))
+    return max(growth, 0)
+
+
+def make_app(instrumented: bool) -> FastAPI:
+    """与handle_webhook结构一致的最小Webhook应用"""
+    app = FastAPI()
+
+    @app.post("/webhook")
+    async def handle_webhook(request: Request):
+        body = await request.body()
+        if parse_validation_request(body) is not None:
+            return {"status": "validation"}
+        if instrumented:
+            record_event()
+        return {"status": "推送成功"}
+
+    return app
+
+
+async def measure_requests(instrumented: bool, body: bytes, requests: int) -> float:
+    transport = httpx.ASGITransport(app=make_app(instrumented))
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(100):
+            await client.post("/webhook", content=body)
+        start = time.perf_counter()
+        for _ in range(requests):
+            await client.post("/webhook", content=body)
+        return requests / (time.perf_counter() - start)
+
+
+def measure_render(series: int) -> float:
+    registry = MetricsRegistry()
+    histogram = registry.histogram("bench_seconds", "bench", ("stage",))
+    for i in range(series):
+        histogram.labels(str(i)).observe(0.001)
+    start = time.perf_counter()
+    registry.render()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=200000)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    recording_ns = measure_recording(args.events)
+    allocated = measure_allocations(args.events // 10)
+    body = message_event(2048)
+    baseline = asyncio.run(measure_requests(False, body, args.requests))
+    instrumented = asyncio.run(measure_requests(True, body, args.requests))
+    render_ms = measure_render(100)
+    result = {
+        "recording_ns_per_event": round(recording_ns),
+        "allocated_bytes_steady_state": allocated,
+        "baseline_rps": round(baseline),
+        "instrumented_rps": round(instrumented),
+        "overhead_percent": round(recording_ns / (1e9 / baseline) * 100, 3),
+        "render_ms_100_series": round(render_ms, 3),
+    }
+    print(f"埋点耗时: {recording_ns:.0f} ns/事件  稳定状态内存增长: {allocated} B")
+    print(f"Webhook请求: 无埋点 {baseline:.0f} req/s  有埋点 {instrumented:.0f} req/s  "
+          f"理论开销 {result['overhead_percent']}%  渲染100个序列: {render_ms:.2f} ms")
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
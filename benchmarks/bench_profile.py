@@ -0,0 +1,167 @@
+"""性能分析开销基准测试：采集期间与未采集时的Webhook吞吐与延迟
+
+在临时目录中以独立配置启动服务端（开启性能分析与独立管理端口），一个WebSocket客户端接收事件，
+以固定并发（闭环）持续发送Webhook请求，依次测量：未开启性能分析、开启但未采集、sample采集期间、cpu采集期间，
+输出各阶段的吞吐与p50/p99延迟，以及采集摘要中的事件循环延迟与慢回调个数。
+
+用法:
+  python benchmarks/bench_profile.py --concurrency 32 --seconds 5
+"""
+import argparse
+import asyncio
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+import websockets
+
+from benchmarks.loadtest import RawHTTPClient, free_port
+from benchmarks.payloads import message_event
+from benchmarks.restart import LAUNCHER, wait_listeners
+
+CONFIG_TEMPLATE = """服务端信息:
+  ip: "127.0.0.1"
+  port: {port}
+  workers: 1
+日志等级:
+  leave: "ERROR"
+  format: "fast"
+事件去重:
+  enable: false
+监控指标:
+  admin_port: {admin_port}
+性能分析:
+  enable: {enable}
+  token: "{token}"
+  max_seconds: 120
+  sample_interval_ms: {interval_ms}
+"""
+
+SECRET = "bench-profile"
+TOKEN = "bench-token"
+
+
+def percentile(samples: list, q: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * q), len(samples) - 1)]
+
+
+async def load(client: RawHTTPClient, args, seconds: float) -> dict:
+    """闭环发送seconds秒，返回吞吐与延迟"""
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    counter = [0]
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            counter[0] += 1
+            body = message_event(args.event_size, event_id=f"profile-{counter[0]}")
+            started = time.perf_counter()
+            await client.post(f"/webhook?secret={SECRET}", body)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+async def capture(admin_port: int, mode: str, seconds: float) -> dict:
+    reader, writer = await asyncio.open_connection("127.0.0.1", admin_port)
+    writer.write(f"POST /debug/profile?mode={mode}&seconds={seconds} HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+                 f"Authorization: Bearer {TOKEN}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode())
+    data = await reader.read()
+    writer.close()
+    return json.loads(data.split(b"\r\n\r\n", 1)[1])
+
+
+async def measure(args, enable: bool, modes: tuple) -> dict:
+    port, admin_port = free_port(), free_port()
+    directory = Path(tempfile.mkdtemp(prefix="qqwebhook-profile-"))
+    (directory / "setconfig.yaml").write_text(CONFIG_TEMPLATE.format(
+        port=port, admin_port=admin_port, enable=str(enable).lower(), token=TOKEN, interval_ms=args.interval_ms),
+        encoding="utf-8")
+    (directory / "server.py").write_text(
+        LAUNCHER.format(repo=str(REPO_ROOT), main=str(REPO_ROOT / "main.py")), encoding="utf-8")
+    server = subprocess.Popen([sys.executable, str(directory / "server.py")], cwd=directory,
+                              stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL)
+    results = {}
+    try:
+        await wait_listeners(port, 1)
+        async with websockets.connect(f"ws://127.0.0.1:{port}/ws/{SECRET}", max_size=None,
+                                      ping_interval=None) as ws:
+            async def consume():
+                async for _ in ws:
+                    pass
+
+            consumer = asyncio.ensure_future(consume())
+            client = RawHTTPClient(f"http://127.0.0.1:{port}", args.concurrency)
+            await load(client, args, 1.0)
+            for mode in modes:
+                if mode is None:
+                    results["idle"] = await load(client, args, args.seconds)
+                    continue
+                # 采集时间略长于压测时间，压测阶段完全处于采集期间
+                summary = asyncio.ensure_future(capture(admin_port, mode, args.seconds + 1))
+                await asyncio.sleep(0.5)
+                results[mode] = await load(client, args, args.seconds)
+                profile = await summary
+                results[mode].update(loop_lag_p99_ms=profile["loop_lag"]["p99_ms"],
+                                     slow_callbacks=len(profile["slow_callbacks"]))
+            await client.close()
+            consumer.cancel()
+        return results
+    finally:
+        if server.poll() is None:
+            server.kill()
+        server.wait()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+async def run(args) -> dict:
+    results = {"disabled": (await measure(args, False, (None,)))["idle"]}
+    results.update(await measure(args, True, (None, "sample", "cpu")))
+    for label, result in results.items():
+        print(f"{label:>8}: {result['rps']:.0f} req/s, p50 {result['p50_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms",
+              file=sys.stderr)
+    return {
+        "concurrency": args.concurrency,
+        "seconds": args.seconds,
+        "sample_interval_ms": args.interval_ms,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=5.0, help="每个阶段的压测时间（秒）")
+    parser.add_argument("--event-size", type=int, default=1024, help="事件大小（字节）")
+    parser.add_argument("--interval-ms", type=float, default=5, help="调用栈采样间隔（毫秒）")
+    parser.add_argument("--output", help="结果写入JSON文件")
+    parser.add_argument("--verbose", action="store_true", help="显示服务端日志")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""连接注册表基准测试：全局asyncio.Lock（旧版） vs 无锁查询+按密钥注册锁
+
+模拟数千个密钥的持续投递，同时以固定速率重连（关闭旧连接存在网络延迟），统计投递吞吐量。
+用法: python benchmarks/bench_registry.py [--secrets 5000] [--churn 500] [--close-ms 5] [--seconds 3]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.connection import ClientConnection
+from src.registry import ConnectionRegistry
+
+
+class FakeWebSocket:
+    """关闭时存在网络延迟的模拟WebSocket"""
+
+    def __init__(self, close_delay: float):
+        self.close_delay = close_delay
+
+    async def close(self, code: int = 1000):
+        await asyncio.sleep(self.close_delay)
+
+
+class LegacyRegistry:
+    """旧版实现：所有查询、注册、注销都持有同一把全局锁，并在锁内关闭旧连接"""
+
+    def __init__(self):
+        self.connections = {}
+        self.lock = asyncio.Lock()
+
+    async def deliver(self, secret, body):
+        async with self.lock:
+            conn = self.connections.get(secret)
+        return conn.enqueue(body) if conn else False
+
+    async def connect(self, conn):
+        async with self.lock:
+            old = self.connections.get(conn.secret)
+            if old is not None:
+                await old.close()
+            self.connections[conn.secret] = conn
+
+
+class NewRegistry:
+    """新版实现：无锁查询，按密钥串行注册，锁外关闭旧连接"""
+
+    def __init__(self):
+        self.registry = ConnectionRegistry()
+
+    async def deliver(self, secret, body):
+        subscribers = self.registry.get(secret)
+        return subscribers.deliver(body) if subscribers else False
+
+    async def connect(self, conn):
+        async with self.registry.registration_lock(conn.secret):
+            evicted = self.registry.add(conn)
+        for old in evicted:
+            await old.close()
+
+
+def make_conn(secret, close_delay):
+    return ClientConnection(FakeWebSocket(close_delay), secret, max_size=64)
+
+
+async def run(impl, secrets, churn_rate, close_delay, seconds, deliverers=8):
+    for secret in secrets:
+        await impl.connect(make_conn(secret, close_delay))
+
+    body = b'{"op":0,"t":"GROUP_AT_MESSAGE_CREATE","d":{}}'
+    delivered = 0
+    reconnects = 0
+    stop = time.perf_counter() + seconds
+
+    async def deliverer():
+        nonlocal delivered
+        rnd = random.Random()
+        while time.perf_counter() < stop:
+            for _ in range(64):
+                if await impl.deliver(secrets[rnd.randrange(len(secrets))], body):
+                    delivered += 1
+            await asyncio.sleep(0)
+
+    async def churner():
+        nonlocal reconnects
+        rnd = random.Random()
+        while time.perf_counter() < stop:
+            asyncio.ensure_future(impl.connect(make_conn(secrets[rnd.randrange(len(secrets))], close_delay)))
+            reconnects += 1
+            await asyncio.sleep(1 / churn_rate)
+
+    start = time.perf_counter()
+    await asyncio.gather(churner(), *(deliverer() for _ in range(deliverers)))
+    elapsed = time.perf_counter() - start
+    return {"events_per_sec": round(delivered / elapsed), "reconnects": reconnects}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--secrets", type=int, default=5000)
+    parser.add_argument("--churn", type=float, default=500, help="每秒重连次数")
+    parser.add_argument("--close-ms", type=float, default=5, help="关闭旧连接的网络延迟")
+    parser.add_argument("--seconds", type=float, default=3)
+    args = parser.parse_args()
+
+    secrets = [f"secret-{i:06d}" for i in range(args.secrets)]
+    results = {}
+    for name, factory in (("legacy_global_lock", LegacyRegistry), ("lock_free_registry", NewRegistry)):
+        results[name] = asyncio.run(run(factory(), secrets, args.churn, args.close_ms / 1000, args.seconds))
+        print(f"{name:<20} {results[name]['events_per_sec']:>10} events/s  reconnects={results[name]['reconnects']}")
+    print(json.dumps({"params": vars(args), "results": results}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""启动耗时基准测试：从启动进程到首个WebSocket连接被接受的时间
+
+在临时目录中以独立配置多次启动服务端（与生产一致，执行main.py入口），
+客户端持续尝试握手，记录首次握手成功的耗时；分别测试无配置缓存（首次启动）与有缓存两种情况，
+并以 -X importtime 统计导入main时各主要模块的累计导入耗时（未出现的模块表示启动时未加载）。
+
+用法: python benchmarks/bench_startup.py [--runs 5] [--format pretty|fast] [--output result.json]
+"""
+import argparse
+import asyncio
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+import websockets
+
+from benchmarks.loadtest import free_port
+from benchmarks.restart import LAUNCHER
+
+CONFIG_TEMPLATE = """服务端信息:
+  ip: "127.0.0.1"
+  port: {port}
+  workers: 1
+日志等级:
+  leave: "WARNING"
+  format: "{format}"
+"""
+
+# 统计导入耗时的模块（第三方依赖与本项目的重量级模块）
+TRACKED_MODULES = (
+    "main", "fastapi", "uvicorn", "pydantic", "ruamel.yaml", "cryptography", "colorama",
+    "src.config", "src.function", "src.signer",
+)
+
+
+async def first_connection(port: int, process: subprocess.Popen, started: float, timeout: float) -> float:
+    """持续尝试WebSocket握手，返回自启动进程起首次握手成功的秒数"""
+    uri = f"ws://127.0.0.1:{port}/ws/bench-startup"
+    while True:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务端启动失败，退出码 {process.returncode}")
+        try:
+            async with websockets.connect(uri, open_timeout=timeout, ping_interval=None):
+                return time.perf_counter() - started
+        except (OSError, websockets.exceptions.WebSocketException, asyncio.TimeoutError):
+            pass
+        if time.perf_counter() - started > timeout:
+            raise RuntimeError("等待服务端就绪超时")
+        await asyncio.sleep(0.002)
+
+
+def stop(process: subprocess.Popen):
+    if process.poll() is None:
+        process.kill()
+    process.wait()
+
+
+async def measure(directory: Path, port: int, cached: bool, timeout: float) -> float:
+    if not cached:
+        for cache in directory.glob(".*.cache.json"):
+            cache.unlink()
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, str(directory / "server.py")], cwd=directory,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        return await first_connection(port, process, started, timeout)
+    finally:
+        stop(process)
+
+
+def import_times(directory: Path) -> dict:
+    """-X importtime：导入main时各模块的累计导入耗时（毫秒）"""
+    code = (f"import sys; sys.argv = [{str(directory / 'server.py')!r}]; "
+            f"sys.path.insert(0, {str(REPO_ROOT)!r}); import main")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=directory,
+                            capture_output=True, text=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        name = name.strip()
+        if name in TRACKED_MODULES and name not in times and cumulative.strip().isdigit():
+            times[name] = round(int(cumulative) / 1000, 1)
+    return {name: times.get(name) for name in TRACKED_MODULES}
+
+
+def summary(samples) -> dict:
+    return {
+        "median_ms": round(statistics.median(samples) * 1000, 1),
+        "min_ms": round(min(samples) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1),
+    }
+
+
+async def run(args) -> dict:
+    port = free_port()
+    directory = Path(tempfile.mkdtemp(prefix="qqwebhook-startup-"))
+    try:
+        (directory / "setconfig.yaml").write_text(CONFIG_TEMPLATE.format(port=port, format=args.format),
+                                                  encoding="utf-8")
+        (directory / "server.py").write_text(
+            LAUNCHER.format(repo=str(REPO_ROOT), main=str(REPO_ROOT / "main.py")), encoding="utf-8")
+        results = {}
+        for label, cached in (("uncached", False), ("cached", True)):
+            # 预热一次（生成配置缓存、填充操作系统页缓存），不计入结果
+            await measure(directory, port, cached, args.timeout)
+            samples = [await measure(directory, port, cached, args.timeout) for _ in range(args.runs)]
+            results[label] = summary(samples)
+            print(f"{label:>9}: 首个连接 {results[label]['median_ms']:.1f} ms（中位数，{args.runs} 次）",
+                  file=sys.stderr)
+        return {
+            "format": args.format,
+            "runs": args.runs,
+            "first_connection": results,
+            "import_ms": import_times(directory),
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--format", choices=("pretty", "fast"), default="pretty", help="日志格式")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--output", help="结果写入JSON文件")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,485 @@
+"""中继服务端到端压测
+
+在临时目录中以独立配置启动服务端（main.app），建立N个模拟机器人WebSocket客户端（分布在M个密钥上），
+按目标速率（开环，按计划时间计算延迟，避免协调遗漏）或最大并发（闭环）发送Webhook请求，
+请求体为真实大小的QQ事件，并按比例混入回调验证请求。
+输出吞吐、HTTP与端到端延迟分位数（p50/p99/p999）、服务端CPU与每连接内存（JSON格式，便于跨版本对比）。
+
+用法:
+  python benchmarks/loadtest.py --clients 100 --secrets 10 --rate 2000 --duration 10
+  python benchmarks/loadtest.py --rate 0 --concurrency 64            # 闭环，测最大吞吐
+  python benchmarks/loadtest.py --url http://127.0.0.1:2173 ...      # 压测已运行的服务（不统计服务端资源）
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+import httpx
+import websockets
+
+from benchmarks.payloads import message_event, validation_event
+
+EVENT_TYPES = ("GROUP_AT_MESSAGE_CREATE", "C2C_MESSAGE_CREATE", "AT_MESSAGE_CREATE",
+               "DIRECT_MESSAGE_CREATE", "INTERACTION_CREATE")
+# 事件ID占位符，发送时替换为序号（定长，替换不改变请求体大小）
+ID_PLACEHOLDER = b"bench-0000000000"
+ID_PATTERN = re.compile(rb'"id":"[A-Z0-9_]+:bench-(\d{10})"')
+
+CONFIG_TEMPLATE = """服务端信息:
+  ip: "127.0.0.1"
+  port: {port}
+  workers: {workers}
+日志等级:
+  leave: "WARNING"
+推送队列:
+  max_size: {queue_size}
+  overflow: "drop_oldest"
+连接管理:
+  mode: "{mode}"
+  max_subscribers: {max_subscribers}
+  modes: {{}}
+"""
+
+LAUNCHER = """import sys
+sys.path.insert(0, {repo!r})
+import main
+import uvicorn
+
+if __name__ == "__main__":
+    workers = main.get_config("服务端信息.workers", 1, int)
+    if workers > 1 and main.supports_reuse_port():
+        main.run_supervisor(main.run_worker, workers)
+    else:
+        uvicorn.run(main.app, host="127.0.0.1", port={port}, **main.UVICORN_OPTIONS)
+"""
+
+
+# ---------------------------------------------------------------- 服务端进程
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def process_tree(pid: int) -> List[int]:
+    """pid及其全部子进程（Linux /proc）"""
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, ()))
+    return tree
+
+
+def process_usage(pid: Optional[int]) -> dict:
+    """进程树的累计CPU秒数与常驻内存字节数"""
+    if pid is None or not os.path.exists("/proc"):
+        return {"cpu": 0.0, "rss": 0}
+    ticks = os.sysconf("SC_CLK_TCK")
+    page = os.sysconf("SC_PAGE_SIZE")
+    cpu, rss = 0.0, 0
+    for child in process_tree(pid):
+        try:
+            with open(f"/proc/{child}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{child}/statm") as f:
+                rss += int(f.read().split()[1]) * page
+        except OSError:
+            continue
+        cpu += (int(fields[11]) + int(fields[12])) / ticks
+    return {"cpu": cpu, "rss": rss}
+
+
+class RelayServer:
+    """在临时目录中以独立配置启动的服务端"""
+
+    def __init__(self, args):
+        self.args = args
+        self.port = free_port()
+        self.directory = Path(tempfile.mkdtemp(prefix="qqwebhook-bench-"))
+        self.process: Optional[subprocess.Popen] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        (self.directory / "setconfig.yaml").write_text(CONFIG_TEMPLATE.format(
+            port=self.port,
+            workers=self.args.workers,
+            queue_size=self.args.queue_size,
+            mode=self.args.mode,
+            max_subscribers=max(16, self.args.clients),
+        ), encoding="utf-8")
+        launcher = self.directory / "bench_server.py"
+        launcher.write_text(LAUNCHER.format(repo=str(REPO_ROOT), port=self.port), encoding="utf-8")
+        self.process = subprocess.Popen(
+            [sys.executable, str(launcher)], cwd=self.directory,
+            stdout=subprocess.DEVNULL, stderr=None if self.args.verbose else subprocess.DEVNULL,
+        )
+
+    async def wait_ready(self, timeout: float = 20):
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as client:
+            while time.monotonic() < deadline:
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"服务端启动失败，退出码 {self.process.returncode}")
+                try:
+                    if (await client.get(self.url + "/")).status_code == 200:
+                        return
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+        raise RuntimeError("等待服务端就绪超时")
+
+    def usage(self) -> dict:
+        return process_usage(self.process.pid if self.process else None)
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+# ---------------------------------------------------------------- 压测客户端
+
+class RawHTTPClient:
+    """极简HTTP/1.1长连接客户端
+
+    压测端与被测服务在同一台机器上，通用HTTP客户端每个请求的CPU开销会先于服务端成为瓶颈，
+    这里只实现Webhook请求所需的最小子集。
+    """
+
+    def __init__(self, base_url: str, connections: int):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.size = connections
+        self._pool: "asyncio.Queue[Tuple[asyncio.StreamReader, asyncio.StreamWriter]]" = asyncio.Queue()
+        self._opened = 0
+
+    async def _acquire(self):
+        if self._pool.empty() and self._opened < self.size:
+            self._opened += 1
+            try:
+                return await asyncio.open_connection(self.host, self.port)
+            except Exception:
+                self._opened -= 1
+                raise
+        return await self._pool.get()
+
+    async def post(self, path: str, body: bytes) -> Tuple[int, bytes]:
+        reader, writer = await self._acquire()
+        try:
+            writer.write(b"POST %s HTTP/1.1\r\nHost: %s\r\nContent-Type: application/json\r\n"
+                         b"Content-Length: %d\r\n\r\n" % (path.encode(), self.host.encode(), len(body)) + body)
+            head = await reader.readuntil(b"\r\n\r\n")
+            status = int(head[9:12])
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line[:15].lower() == b"content-length:":
+                    length = int(line[15:])
+            payload = await reader.readexactly(length)
+        except Exception:
+            writer.close()
+            self._opened -= 1
+            raise
+        self._pool.put_nowait((reader, writer))
+        return status, payload
+
+    async def close(self):
+        while not self._pool.empty():
+            _, writer = self._pool.get_nowait()
+            writer.close()
+
+
+class Recorder:
+    """记录发送时间与延迟样本"""
+
+    def __init__(self):
+        self.pending: Dict[int, float] = {}
+        self.http_latency: List[float] = []
+        self.e2e_latency: List[float] = []
+        self.outcomes: Dict[str, int] = {}
+        self.received = 0
+        self.frames = 0
+        self.duplicates = 0
+        self.errors = 0
+        self.measuring = False
+        self.first_seq = 0
+
+    def delivered(self, frame: bytes):
+        if self.measuring:
+            self.frames += 1
+        if frame[:1] == b"[":
+            # 批量推送：一帧包含多个事件
+            for match in ID_PATTERN.finditer(frame):
+                self._received(int(match.group(1)))
+            return
+        match = ID_PATTERN.search(frame, 0, 256)
+        if match is not None:
+            self._received(int(match.group(1)))
+
+    def _received(self, seq: int):
+        sent_at = self.pending.pop(seq, None)
+        if sent_at is None:
+            # 预热阶段遗留的事件不计为重复
+            if seq >= self.first_seq:
+                self.duplicates += 1
+            return
+        self.received += 1
+        if self.measuring:
+            self.e2e_latency.append(time.perf_counter() - sent_at)
+
+
+async def run_client(uri: str, recorder: Recorder, connected: asyncio.Event, counter: list, total: int):
+    """模拟机器人客户端：接收推送并计算端到端延迟"""
+    async with websockets.connect(uri, max_size=None, ping_interval=None) as ws:
+        counter[0] += 1
+        if counter[0] >= total:
+            connected.set()
+        async for message in ws:
+            recorder.delivered(message if isinstance(message, bytes) else message.encode())
+
+
+class Workload:
+    """预生成的请求体模板，发送时仅替换事件ID"""
+
+    def __init__(self, args):
+        self.templates = [message_event(size, event_type, ID_PLACEHOLDER.decode())
+                          for size in args.sizes for event_type in EVENT_TYPES]
+        self.validation = validation_event()
+        self.validation_ratio = args.validation_ratio
+        self.secrets = [f"bench-secret-{i}" for i in range(args.secrets)]
+        self.random = random.Random(args.seed)
+
+    def next(self, seq: int):
+        """返回(密钥, 请求体, 是否回调验证)"""
+        secret = self.secrets[seq % len(self.secrets)]
+        if self.validation_ratio and self.random.random() < self.validation_ratio:
+            return secret, self.validation, True
+        template = self.templates[seq % len(self.templates)]
+        return secret, template.replace(ID_PLACEHOLDER, b"bench-%010d" % seq), False
+
+
+async def post_event(client: RawHTTPClient, recorder: Recorder, workload: Workload, seq: int,
+                     scheduled: float):
+    secret, body, validation = workload.next(seq)
+    if not validation:
+        recorder.pending[seq] = scheduled
+    try:
+        code, payload = await client.post(f"/webhook?secret={secret}", body)
+        status = "validation" if validation else str(json.loads(payload).get("status", code))
+    except Exception:
+        recorder.errors += 1
+        recorder.pending.pop(seq, None)
+        return
+    if recorder.measuring:
+        recorder.http_latency.append(time.perf_counter() - scheduled)
+        recorder.outcomes[status] = recorder.outcomes.get(status, 0) + 1
+
+
+async def drive_open_loop(client, recorder, workload, rate: float, until: float, seq: list):
+    """开环：按计划时间发送，延迟自计划时间起算，服务端变慢不会降低发送速率"""
+    interval = 1 / rate
+    start = time.perf_counter()
+    issued = 0
+    tasks = set()
+    while True:
+        now = time.perf_counter()
+        if now >= until:
+            break
+        due = int((now - start) / interval) + 1
+        while issued < due:
+            task = asyncio.ensure_future(post_event(client, recorder, workload, seq[0],
+                                                    start + issued * interval))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            seq[0] += 1
+            issued += 1
+        await asyncio.sleep(min(interval, 0.001))
+    if tasks:
+        await asyncio.gather(*tasks)
+
+
+async def drive_closed_loop(client, recorder, workload, concurrency: int, until: float, seq: list):
+    """闭环：concurrency个发送者各自收到应答后立即发送下一个请求"""
+
+    async def sender():
+        while time.perf_counter() < until:
+            current = seq[0]
+            seq[0] += 1
+            await post_event(client, recorder, workload, current, time.perf_counter())
+
+    await asyncio.gather(*(sender() for _ in range(concurrency)))
+
+
+def percentiles(samples: List[float]) -> dict:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {"p50": pick(0.5), "p99": pick(0.99), "p999": pick(0.999), "max": round(ordered[-1] * 1000, 3),
+            "samples": len(ordered)}
+
+
+async def run(args, server: Optional[RelayServer]) -> dict:
+    base_url = args.url or server.url
+    ws_base = base_url.replace("http", "ws", 1)
+    recorder = Recorder()
+    workload = Workload(args)
+    baseline = server.usage() if server else process_usage(None)
+
+    # 建立客户端连接
+    connected = asyncio.Event()
+    counter = [0]
+    params = []
+    if args.binary:
+        params.append("frame=binary")
+    if args.batch:
+        params.append(f"batch={args.batch}&linger_ms={args.linger_ms}")
+    frame = "?" + "&".join(params) if params else ""
+    clients = [asyncio.ensure_future(run_client(f"{ws_base}/ws/{workload.secrets[i % args.secrets]}{frame}",
+                                                recorder, connected, counter, args.clients))
+               for i in range(args.clients)]
+    await asyncio.wait_for(connected.wait(), timeout=60)
+    await asyncio.sleep(0.5)
+    connected_usage = server.usage() if server else baseline
+
+    seq = [0]
+    client = RawHTTPClient(base_url, args.concurrency)
+    try:
+        drive = drive_open_loop if args.rate else drive_closed_loop
+        load = args.rate if args.rate else args.concurrency
+        # 预热阶段不计入统计
+        if args.warmup:
+            await drive(client, recorder, workload, load, time.perf_counter() + args.warmup, seq)
+        recorder.pending.clear()
+        recorder.received = 0
+        recorder.first_seq = seq[0]
+        recorder.measuring = True
+        before = server.usage() if server else baseline
+        client_cpu = time.process_time()
+        start = time.perf_counter()
+        await drive(client, recorder, workload, load, start + args.duration, seq)
+        elapsed = time.perf_counter() - start
+        after = server.usage() if server else baseline
+        client_cpu = time.process_time() - client_cpu
+        # 等待在途事件送达
+        deadline = time.perf_counter() + args.drain
+        while recorder.pending and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+    finally:
+        await client.close()
+
+    for task in clients:
+        task.cancel()
+    await asyncio.gather(*clients, return_exceptions=True)
+
+    requests = len(recorder.http_latency)
+    server_cpu = after["cpu"] - before["cpu"]
+    return {
+        "config": {
+            "clients": args.clients, "secrets": args.secrets, "rate": args.rate,
+            "concurrency": args.concurrency, "duration": args.duration, "sizes": args.sizes,
+            "validation_ratio": args.validation_ratio, "mode": args.mode, "workers": args.workers,
+            "binary": args.binary, "batch": args.batch, "linger_ms": args.linger_ms,
+        },
+        "throughput": {
+            "requests_per_s": round(requests / elapsed, 1),
+            "events_received_per_s": round(recorder.received / elapsed, 1),
+            "frames_received_per_s": round(recorder.frames / elapsed, 1),
+        },
+        "http_latency_ms": percentiles(recorder.http_latency),
+        "e2e_latency_ms": percentiles(recorder.e2e_latency),
+        "outcomes": recorder.outcomes,
+        "errors": recorder.errors,
+        "lost": len(recorder.pending),
+        "duplicates": recorder.duplicates,
+        "server": None if server is None else {
+            "cpu_seconds": round(server_cpu, 3),
+            "cpu_percent": round(server_cpu / elapsed * 100, 1),
+            "cpu_us_per_request": round(server_cpu / requests * 1e6, 1) if requests else None,
+            "rss_mb": round(after["rss"] / (1 << 20), 1),
+            "rss_per_connection_kb": round((connected_usage["rss"] - baseline["rss"]) / args.clients / 1024, 1),
+        },
+        "client_cpu_seconds": round(client_cpu, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=50, help="WebSocket客户端数量")
+    parser.add_argument("--secrets", type=int, default=10, help="机器人密钥数量")
+    parser.add_argument("--rate", type=float, default=1000, help="目标请求速率（每秒），0为闭环最大吞吐")
+    parser.add_argument("--concurrency", type=int, default=64, help="HTTP连接数（闭环模式下为发送者数量）")
+    parser.add_argument("--duration", type=float, default=10, help="统计时长（秒）")
+    parser.add_argument("--warmup", type=float, default=2, help="预热时长（秒）")
+    parser.add_argument("--drain", type=float, default=5, help="结束后等待在途事件的最长时间（秒）")
+    parser.add_argument("--sizes", type=lambda v: [int(s) for s in v.split(",")], default=[512, 2048],
+                        help="事件大小（字节），逗号分隔")
+    parser.add_argument("--validation-ratio", type=float, default=0.01, help="回调验证请求占比")
+    parser.add_argument("--mode", default="round_robin", help="连接管理.mode")
+    parser.add_argument("--workers", type=int, default=1, help="服务端工作进程数")
+    parser.add_argument("--queue-size", type=int, default=10000, help="推送队列.max_size")
+    parser.add_argument("--binary", action="store_true", help="以二进制帧接收")
+    parser.add_argument("--batch", type=int, default=0, help="批量推送单帧事件数，0为逐条推送")
+    parser.add_argument("--linger-ms", type=float, default=5, help="批量推送最长等待时间（毫秒）")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="压测已运行的服务端，不自动启动")
+    parser.add_argument("--output", help="结果写入文件")
+    parser.add_argument("--verbose", action="store_true", help="显示服务端错误输出")
+    args = parser.parse_args()
+    args.secrets = max(1, min(args.secrets, args.clients))
+
+    server = None if args.url else RelayServer(args)
+    try:
+        if server:
+            server.start()
+            asyncio.run(server.wait_ready())
+        result = asyncio.run(run(args, server))
+    finally:
+        if server:
+            server.stop()
+
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(output, encoding="utf-8")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
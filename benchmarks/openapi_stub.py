@@ -0,0 +1,150 @@
+"""本地模拟的QQ开放平台：用于接口代理的功能验证与基准测试
+
+- POST /app/getAppAccessToken：按appId签发access_token（expires_in与真实平台一样为字符串）
+- 其余路径：校验 Authorization: QQBot {token} 与 X-Union-Appid，通过时回显请求，否则返回401
+- GET /_stub/stats：累计的客户端连接数（按源地址端口区分）、签发token次数与请求数
+
+--latency-ms 模拟接口处理耗时，--tls 时在 --cert-dir 生成自签名证书（SAN为127.0.0.1）并以HTTPS监听，
+客户端以该证书作为CA即可校验。
+
+用法:
+  python benchmarks/openapi_stub.py --port 9443 --tls --cert-dir /tmp/stub-cert --latency-ms 20
+"""
+import argparse
+import asyncio
+import datetime
+import ipaddress
+import json
+import secrets
+import time
+from pathlib import Path
+
+
+def generate_certificate(directory: Path):
+    """生成自签名证书，返回(证书路径, 私钥路径)"""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    directory.mkdir(parents=True, exist_ok=True)
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]),
+                       critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = directory / "stub.crt"
+    key_path = directory / "stub.key"
+    cert_path.write_bytes(certificate.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                           serialization.NoEncryption()))
+    return cert_path, key_path
+
+
+class OpenApiStub:
+    """纯ASGI应用，不依赖Web框架"""
+
+    def __init__(self, latency: float = 0.0, token_ttl: int = 7200):
+        self.latency = latency
+        self.token_ttl = token_ttl
+        # access_token -> (appid, 过期时间)
+        self.tokens = {}
+        self.connections = set()
+        self.token_fetches = 0
+        self.requests = 0
+        self.unauthorized = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+        if scope.get("client"):
+            self.connections.add(tuple(scope["client"]))
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        status, content = await self.dispatch(scope, body)
+        payload = json.dumps(content, ensure_ascii=False).encode()
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(payload)).encode())]})
+        await send({"type": "http.response.body", "body": payload})
+
+    async def dispatch(self, scope, body: bytes):
+        method, path = scope["method"], scope["path"]
+        headers = {name.decode().lower(): value.decode() for name, value in scope["headers"]}
+        if path == "/_stub/stats":
+            return 200, {"connections": len(self.connections), "token_fetches": self.token_fetches,
+                         "requests": self.requests, "unauthorized": self.unauthorized}
+        if path == "/app/getAppAccessToken" and method == "POST":
+            try:
+                data = json.loads(body)
+                appid = str(data["appId"])
+                if not data.get("clientSecret"):
+                    raise KeyError("clientSecret")
+            except (ValueError, KeyError):
+                return 400, {"code": 100016, "message": "invalid appid or secret"}
+            self.token_fetches += 1
+            token = secrets.token_hex(16)
+            self.tokens[token] = (appid, time.monotonic() + self.token_ttl)
+            return 200, {"access_token": token, "expires_in": str(self.token_ttl)}
+
+        self.requests += 1
+        authorization = headers.get("authorization", "")
+        token = authorization[6:] if authorization.startswith("QQBot ") else ""
+        appid, expires_at = self.tokens.get(token, (None, 0.0))
+        if appid is None or appid != headers.get("x-union-appid") or expires_at < time.monotonic():
+            self.unauthorized += 1
+            return 401, {"code": 11244, "message": "token not exist or expire"}
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        try:
+            echo = json.loads(body) if body else None
+        except ValueError:
+            echo = body.decode("utf-8", "replace")
+        return 200, {"id": secrets.token_hex(8), "method": method, "path": path, "appid": appid, "echo": echo}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9443)
+    parser.add_argument("--latency-ms", type=float, default=0, help="模拟的接口处理耗时（毫秒）")
+    parser.add_argument("--token-ttl", type=int, default=7200, help="access_token有效期（秒）")
+    parser.add_argument("--tls", action="store_true", help="使用自签名证书以HTTPS监听")
+    parser.add_argument("--cert-dir", default="openapi-stub-cert", help="自签名证书的保存目录")
+    args = parser.parse_args()
+
+    import uvicorn
+    options = {}
+    if args.tls:
+        cert_path, key_path = generate_certificate(Path(args.cert_dir))
+        options.update(ssl_certfile=str(cert_path), ssl_keyfile=str(key_path))
+    app = OpenApiStub(args.latency_ms / 1000, args.token_ttl)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", lifespan="on",
+                timeout_keep_alive=300, **options)
+
+
+if __name__ == "__main__":
+    main()
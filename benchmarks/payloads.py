@@ -0,0 +1,30 @@
+# 基准测试用的QQ事件样本
+import json
+import time
+import uuid
+
+
+def message_event(size: int, event_type: str = "GROUP_AT_MESSAGE_CREATE", event_id: str = None) -> bytes:
+    """生成约size字节的QQ消息事件"""
+    event = {
+        "op": 0,
+        "id": f"{event_type}:{event_id or uuid.uuid4().hex}",
+        "d": {
+            "author": {"id": uuid.uuid4().hex.upper(), "member_openid": uuid.uuid4().hex.upper()},
+            "content": "",
+            "group_id": uuid.uuid4().hex.upper(),
+            "group_openid": uuid.uuid4().hex.upper(),
+            "id": "ROBOT1.0_" + uuid.uuid4().hex,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S+08:00"),
+        },
+        "t": event_type,
+    }
+    base = len(json.dumps(event, ensure_ascii=False).encode())
+    # 中文内容每字符占3字节
+    event["d"]["content"] = " 你好，机器人" * max(0, (size - base) // 19)
+    return json.dumps(event, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def validation_event(event_ts: str = "1725442341", plain_token: str = "Arq0D5A61EgUu4OxUvOp") -> bytes:
+    """生成回调验证请求"""
+    return json.dumps({"d": {"plain_token": plain_token, "event_ts": event_ts}, "op": 13}).encode()
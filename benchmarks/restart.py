@@ -0,0 +1,315 @@
+"""平滑重启测试：持续压测期间以SO_REUSEPORT启动新进程并终止旧进程
+
+在临时目录中以 reuse_port 配置启动服务端A，建立N个WebSocket客户端（各自使用独立密钥）并按固定速率发送Webhook；
+到达 --restart-at 时启动新进程B（绑定同一端口），随后向A发送SIGTERM。
+客户端收到 {"op": "reconnect", "delay_ms": N} 后在N毫秒时先建立新连接再等待旧连接关闭；
+Webhook应答503或连接断开时按平台行为延迟重试。
+输出丢失/重复事件数、重启前后的端到端延迟分位数与客户端重连时间分布（JSON格式）。
+
+用法:
+  python benchmarks/restart.py --clients 50 --rate 500 --duration 12 --restart-at 4
+  python benchmarks/restart.py --spool              # 开启离线缓存
+  python benchmarks/restart.py --no-overlap         # 旧进程退出后再启动新进程（普通重启）
+"""
+import argparse
+import asyncio
+import json
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+import websockets
+
+from benchmarks.loadtest import ID_PATTERN, ID_PLACEHOLDER, RawHTTPClient, free_port, percentiles
+from benchmarks.payloads import message_event
+
+CONFIG_TEMPLATE = """服务端信息:
+  ip: "127.0.0.1"
+  port: {port}
+  workers: 1
+日志等级:
+  leave: "WARNING"
+离线缓存:
+  enable: {spool}
+  path: "spool"
+平滑重启:
+  drain_timeout: {drain_timeout}
+  reconnect_spread_ms: {spread_ms}
+  reuse_port: true
+"""
+
+# 执行main.py的入口（与生产启动方式一致）；不使用runpy，以免替换sys.argv[0]导致读取仓库目录下的配置
+LAUNCHER = """import sys
+sys.path.insert(0, {repo!r})
+with open({main!r}, encoding="utf-8") as f:
+    code = compile(f.read(), {main!r}, "exec")
+exec(code, {{"__name__": "__main__", "__file__": {main!r}}})
+"""
+
+# 平台重试间隔（秒）与次数
+RETRY_INTERVAL = 0.2
+RETRY_LIMIT = 50
+
+
+class Instance:
+    """共用同一临时目录（配置与离线缓存）的服务端进程"""
+
+    def __init__(self, directory: Path, name: str, verbose: bool):
+        self.directory = directory
+        self.name = name
+        self.verbose = verbose
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [sys.executable, str(self.directory / "server.py")], cwd=self.directory,
+            stdout=subprocess.DEVNULL, stderr=None if self.verbose else subprocess.DEVNULL,
+        )
+
+    def terminate(self):
+        if self.process and self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+
+    async def wait_exit(self, timeout: float) -> Optional[int]:
+        deadline = time.monotonic() + timeout
+        while self.process.poll() is None and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self.process.poll() is None:
+            self.process.kill()
+        return self.process.wait()
+
+
+def listeners(port: int) -> int:
+    """监听该端口的套接字数量（Linux /proc/net/tcp，状态0A为LISTEN）"""
+    count = 0
+    for table in ("/proc/net/tcp", "/proc/net/tcp6"):
+        try:
+            with open(table) as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    if fields[3] == "0A" and int(fields[1].rsplit(":", 1)[1], 16) == port:
+                        count += 1
+        except OSError:
+            continue
+    return count
+
+
+async def wait_listeners(port: int, expected: int, timeout: float = 20):
+    deadline = time.monotonic() + timeout
+    while listeners(port) < expected:
+        if time.monotonic() > deadline:
+            raise RuntimeError("等待服务端监听超时")
+        await asyncio.sleep(0.05)
+
+
+class Tracker:
+    """记录事件发送/接收与客户端重连"""
+
+    def __init__(self):
+        self.sent_at: Dict[int, float] = {}
+        self.received: Dict[int, float] = {}
+        self.duplicates = 0
+        self.hints: List[float] = []
+        self.reconnects: List[float] = []
+        self.outcomes: Dict[str, int] = {}
+        self.retries = 0
+        self.failed = 0
+
+    def delivered(self, frame: bytes):
+        for match in ID_PATTERN.finditer(frame):
+            seq = int(match.group(1))
+            if seq in self.received:
+                self.duplicates += 1
+            elif seq in self.sent_at:
+                self.received[seq] = time.perf_counter()
+
+
+async def run_client(uri: str, tracker: Tracker, stop: asyncio.Event):
+    """按服务端提示重连的客户端：先建立新连接，再等待旧连接被关闭"""
+    hinted = asyncio.Event()
+
+    async def reader(ws):
+        try:
+            async for message in ws:
+                frame = message if isinstance(message, bytes) else message.encode()
+                if frame.startswith(b'{"op": "reconnect"'):
+                    tracker.hints.append(time.perf_counter())
+                    delay = json.loads(frame)["delay_ms"] / 1000
+                    asyncio.get_running_loop().call_later(delay, hinted.set)
+                    continue
+                tracker.delivered(frame)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    readers = set()
+    while not stop.is_set():
+        try:
+            ws = await websockets.connect(uri, max_size=None, ping_interval=None)
+        except (OSError, websockets.exceptions.WebSocketException):
+            await asyncio.sleep(0.1)
+            continue
+        hinted.clear()
+        task = asyncio.ensure_future(reader(ws))
+        readers.add(task)
+        task.add_done_callback(readers.discard)
+        # 收到提示后到达指定时间，或连接意外断开时重连
+        waiter = asyncio.ensure_future(hinted.wait())
+        stopper = asyncio.ensure_future(stop.wait())
+        await asyncio.wait({task, waiter, stopper}, return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        stopper.cancel()
+        if not stop.is_set():
+            tracker.reconnects.append(time.perf_counter())
+    for task in list(readers):
+        task.cancel()
+
+
+async def post_with_retry(client: RawHTTPClient, tracker: Tracker, secret: str, body: bytes, seq: int):
+    """发送Webhook，503或连接错误时按平台行为延迟重试"""
+    tracker.sent_at[seq] = time.perf_counter()
+    for attempt in range(RETRY_LIMIT):
+        try:
+            code, payload = await client.post(f"/webhook?secret={secret}", body)
+        except Exception:
+            code, payload = 0, b""
+        if code == 200:
+            status = json.loads(payload).get("status", "")
+            tracker.outcomes[status] = tracker.outcomes.get(status, 0) + 1
+            return
+        tracker.retries += 1
+        await asyncio.sleep(RETRY_INTERVAL)
+    tracker.failed += 1
+
+
+async def run(args) -> dict:
+    port = free_port()
+    directory = Path(tempfile.mkdtemp(prefix="qqwebhook-restart-"))
+    (directory / "setconfig.yaml").write_text(CONFIG_TEMPLATE.format(
+        port=port, spool="true" if args.spool else "false",
+        drain_timeout=args.drain_timeout, spread_ms=args.spread_ms,
+    ), encoding="utf-8")
+    (directory / "server.py").write_text(LAUNCHER.format(repo=str(REPO_ROOT), main=str(REPO_ROOT / "main.py")),
+                                         encoding="utf-8")
+    old = Instance(directory, "A", args.verbose)
+    new = Instance(directory, "B", args.verbose)
+    tracker = Tracker()
+    stop = asyncio.Event()
+    client = RawHTTPClient(f"http://127.0.0.1:{port}", args.connections)
+    secrets = [f"restart-secret-{i}" for i in range(args.clients)]
+    template = message_event(1024, "GROUP_AT_MESSAGE_CREATE", ID_PLACEHOLDER.decode())
+    try:
+        old.start()
+        await wait_listeners(port, 1)
+        clients = [asyncio.ensure_future(run_client(f"ws://127.0.0.1:{port}/ws/{secret}", tracker, stop))
+                   for secret in secrets]
+        await asyncio.sleep(1.0)
+
+        start = time.perf_counter()
+        restart_at = start + args.restart_at
+        until = start + args.duration
+        restarted = None
+        tasks = set()
+        seq = 0
+        interval = 1 / args.rate
+        while True:
+            now = time.perf_counter()
+            if now >= until:
+                break
+            if restarted is None and now >= restart_at:
+                restarted = now
+                if args.no_overlap:
+                    old.terminate()
+                    await old.wait_exit(args.drain_timeout + 10)
+                    new.start()
+                else:
+                    new.start()
+                    await wait_listeners(port, 2)
+                    old.terminate()
+            due = int((now - start) / interval) + 1
+            while seq < due:
+                body = template.replace(ID_PLACEHOLDER, b"bench-%010d" % seq)
+                task = asyncio.ensure_future(post_with_retry(client, tracker, secrets[seq % len(secrets)], body, seq))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                seq += 1
+            await asyncio.sleep(min(interval, 0.001))
+        if tasks:
+            await asyncio.gather(*tasks)
+        old_code = await old.wait_exit(args.drain_timeout + 10)
+        # 等待离线缓存补发与在途事件
+        deadline = time.perf_counter() + args.settle
+        while len(tracker.received) < len(tracker.sent_at) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.1)
+        stop.set()
+        await asyncio.gather(*clients, return_exceptions=True)
+    finally:
+        await client.close()
+        old.terminate()
+        new.terminate()
+        if old.process:
+            await old.wait_exit(5)
+        if new.process:
+            await new.wait_exit(args.drain_timeout + 10)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    phases = {"before": [], "restart": [], "after": []}
+    window_end = restarted + args.drain_timeout if restarted else until
+    for seq, sent in tracker.sent_at.items():
+        received = tracker.received.get(seq)
+        if received is None:
+            continue
+        phase = "before" if restarted is None or sent < restarted else "restart" if sent < window_end else "after"
+        phases[phase].append(received - sent)
+    reconnects = sorted(t - restarted for t in tracker.reconnects) if restarted else []
+    return {
+        "config": {"clients": args.clients, "rate": args.rate, "spool": args.spool,
+                   "overlap": not args.no_overlap, "spread_ms": args.spread_ms},
+        "sent": len(tracker.sent_at),
+        "received": len(tracker.received),
+        "lost": len(tracker.sent_at) - len(tracker.received),
+        "duplicates": tracker.duplicates,
+        "retries": tracker.retries,
+        "failed": tracker.failed,
+        "outcomes": tracker.outcomes,
+        "old_exit_code": old_code,
+        "hints": len(tracker.hints),
+        "reconnect_ms": {"first": round(reconnects[0] * 1000, 1), "last": round(reconnects[-1] * 1000, 1),
+                         "count": len(reconnects)} if reconnects else {},
+        "e2e_latency_ms": {phase: percentiles(samples) for phase, samples in phases.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=500)
+    parser.add_argument("--connections", type=int, default=16, help="Webhook长连接数")
+    parser.add_argument("--duration", type=float, default=12)
+    parser.add_argument("--restart-at", type=float, default=4)
+    parser.add_argument("--drain-timeout", type=float, default=5)
+    parser.add_argument("--spread-ms", type=int, default=2000)
+    parser.add_argument("--settle", type=float, default=5, help="发送结束后等待在途事件的时间（秒）")
+    parser.add_argument("--spool", action="store_true", help="开启离线缓存")
+    parser.add_argument("--no-overlap", action="store_true", help="旧进程退出后再启动新进程")
+    parser.add_argument("--output", help="结果写入JSON文件")
+    parser.add_argument("--verbose", action="store_true", help="显示服务端日志")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,397 @@
 import asyncio
-from fastapi import FastAPI, Request, Header, WebSocket, WebSocketDisconnect
+import hmac
+import json
+import logging
+import os
+import random
+import struct
+import sys
+from contextlib import asynccontextmanager, nullcontext
+from pathlib import Path
+from time import perf_counter
+
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
-from pydantic import BaseModel
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse
 
 from src.config import *
 from src.envfix import create_config_if_not_exists
 from src.function import *
+from src.connection import ClientConnection, CLOSE_SERVICE_RESTART
+from src.signer import DEFAULT_MAX_AGE
+from src.registry import ConnectionRegistry, BALANCED_MODES, MODE_REPLACE
+from src.spool import Spool
+from src.dedup import DedupCache, event_key
+from src.subscription import event_type, resolve_subscription
+from src.admission import AdmissionController, AdmissionMiddleware
+from src.keepalive import KeepaliveMonitor
+from src.apiproxy import ApiProxy, DEFAULT_BASE_URL, DEFAULT_TOKEN_URL, error_frame
+from src.ingest import BodyReader, BodyTooLarge
+from src.tracing import Tracer, parse_rids
+from src.lanes import DEFAULT_LANES, PriorityPolicy
+from src import metrics
+from src.metrics import (STAGE_READ, STAGE_VERIFY, STAGE_SIGN, STAGE_PARSE, STAGE_DEDUP, STAGE_ROUTE, STAGE_TOTAL,
+                         EVENTS_DELIVERED, EVENTS_FORWARDED, EVENTS_SPOOLED, EVENTS_UNDELIVERED,
+                         EVENTS_REJECTED, EVENTS_VALIDATION, EVENTS_FAILED, EVENTS_DUPLICATE, EVENTS_FILTERED,
+                         EVENTS_DEFERRED, EVENTS_TOO_LARGE)
+from src.cluster import (ClusterRouter, ENV_HANDOVER, OP_DELIVER, OP_SPOOL, OP_FETCH, OP_COMMIT, OP_DEDUP,
+                         OP_EVICT, bind_reuse_port, decode_records, encode_records, port_in_use, run_supervisor,
+                         supports_reuse_port)
 import uvicorn
 
 create_config_if_not_exists()
-app = FastAPI()
 leave = get_config("日志等级.leave", )
-logger = configure_logger("QQwebhook", leave)
+logger = configure_logger(
+    "QQwebhook",
+    leave,
+    queued=get_config("日志等级.queued", False, bool),
+    queue_size=get_config("日志等级.queue_size", 10000, int),
+    fmt=get_config("日志等级.format", "pretty", str),
+    max_body=get_config("日志等级.max_body", 4096, int),
+)
+# 签名校验配置
+verify_signature = get_config("签名校验.enable", False, bool)
+signature_engine.configure(
+    cache_size=get_config("签名校验.cache_size", 1024, int),
+    offload_rate=get_config("签名校验.offload_rate", 2000, int),
+    max_workers=get_config("签名校验.workers", 4, int),
+    max_age=get_config("签名校验.max_age", DEFAULT_MAX_AGE, float),
+)
+# 离线消息缓存配置
+spool = None
+# 回放时出站队列已满，等待写任务发送的单次时长（秒）
+REPLAY_WAIT = 1.0
+if get_config("离线缓存.enable", False, bool):
+    spool_path = Path(get_config("离线缓存.path", "spool"))
+    if not spool_path.is_absolute():
+        spool_path = Path(sys.argv[0]).parent.resolve() / spool_path
+    spool = Spool(
+        str(spool_path),
+        segment_bytes=get_config("离线缓存.segment_mb", 16, int) << 20,
+        max_bytes=get_config("离线缓存.max_mb", 256, int) << 20,
+        max_age=get_config("离线缓存.max_age", 86400, int),
+        commit_records=get_config("离线缓存.commit_records", 64, int),
+        commit_interval=get_config("离线缓存.commit_interval_ms", 50, int) / 1000,
+    )
+
+# 请求体读取（流式读取，超过上限时应答413）
+body_reader = BodyReader()
+# 事件去重配置
+dedup = None
+if get_config("事件去重.enable", True, bool):
+    dedup = DedupCache(
+        ttl=get_config("事件去重.ttl", 300, int),
+        max_entries=get_config("事件去重.max_entries", 1000000, int),
+    )
+# 推送队列配置
+queue_max_size = max(get_config("推送队列.max_size", 1000, int), 1)
+queue_overflow = get_config("推送队列.overflow", "drop_oldest", str)
+# 批量推送默认参数（客户端通过?batch或握手消息开启）
+batch_max_size = get_config("推送队列.batch_max_size", 100, int)
+batch_linger_ms = get_config("推送队列.batch_linger_ms", 5, int)
+# 出站优先级通道（按事件类型t分级调度，未开启时每个连接只有一个先进先出队列）
+priority = None
+if get_config("优先级.enable", False, bool):
+    try:
+        priority = PriorityPolicy(
+            lanes=get_config("优先级.lanes", DEFAULT_LANES),
+            default=get_config("优先级.default", "normal", str),
+            schedule=get_config("优先级.schedule", "weighted", str),
+        )
+    except ValueError as e:
+        logger.error("优先级配置无效，已使用默认通道: %s", e)
+        priority = PriorityPolicy()
+# 订阅者投递模式配置
+delivery_mode = get_config("连接管理.mode", "replace", str)
+delivery_modes = dict(get_config("连接管理.modes", {}) or {})
+max_subscribers = get_config("连接管理.max_subscribers", 16, int)
+# 多进程模式下的跨进程路由（单进程模式为None）
+cluster = ClusterRouter.from_env()
+# 准入控制（在读取请求体与签名校验之前拒绝超限请求）
+admission = AdmissionController()
+# 监控指标配置
+metrics_enable = get_config("监控指标.enable", True, bool)
+metrics_admin_host = get_config("监控指标.admin_host", "127.0.0.1", str)
+metrics_admin_port = get_config("监控指标.admin_port", 0, int)
+# 未配置独立管理端口时，是否在Webhook端口上公开 /stats 与 /metrics（默认不公开）
+metrics_public = get_config("监控指标.public", False, bool)
+# 平滑重启配置
+drain_timeout = get_config("平滑重启.drain_timeout", 10, float)
+reconnect_spread_ms = get_config("平滑重启.reconnect_spread_ms", 3000, int)
+reuse_port = get_config("平滑重启.reuse_port", False, bool)
+hold_ms = get_config("平滑重启.hold_ms", 3000, int)
+# 退出排空中：拒绝新连接，无法送达的事件应答503由平台重试
+draining = False
+# 与旧进程交接中：启动时端口仍由旧进程监听（reuse_port重叠启动）
+handover = os.environ.get(ENV_HANDOVER) == "1"
+# 启动过渡期截止时间（仅在与旧进程交接时设置；客户端从旧进程重连期间，无法送达的事件同样应答503）
+warmup_until = 0.0
+# 启动过渡期内等待客户端连接的Webhook（按密钥）
+arrivals = {}
+# 应用层保活（开启后由单个时间轮统一处理空闲检测、ping与驱逐）
+keepalive = None
+if get_config("连接保活.enable", False, bool):
+    keepalive = KeepaliveMonitor(tick=max(get_config("连接保活.tick_ms", 1000, int), 10) / 1000)
+    keepalive.configure(
+        idle_timeout=get_config("连接保活.idle_timeout", 60, float),
+        evict_timeout=get_config("连接保活.evict_timeout", 30, float),
+    )
+# 开放平台接口代理（客户端经WebSocket调用接口，共享连接池与access_token）
+api_proxy = None
+if get_config("接口代理.enable", False, bool):
+    api_proxy = ApiProxy(
+        base_url=get_config("接口代理.base_url", DEFAULT_BASE_URL, str),
+        token_url=get_config("接口代理.token_url", DEFAULT_TOKEN_URL, str),
+        http2=get_config("接口代理.http2", True, bool),
+        max_connections=get_config("接口代理.max_connections", 100, int),
+        max_keepalive=get_config("接口代理.max_keepalive", 100, int),
+        keepalive_expiry=get_config("接口代理.keepalive_expiry", 60, float),
+        pool_shards=get_config("接口代理.pool_shards", 16, int),
+        timeout=get_config("接口代理.timeout", 10, float),
+        max_concurrency=get_config("接口代理.max_concurrency", 8, int),
+        refresh_before=get_config("接口代理.refresh_before", 60, float),
+        verify=get_config("接口代理.ca_file", "", str) or True,
+    )
+# 端到端延迟追踪（客户端以?envelope=on连接时生效）
+tracer = None
+if get_config("延迟追踪.enable", False, bool):
+    tracer = Tracer()
+    tracer.configure(
+        ack_timeout=get_config("延迟追踪.ack_timeout", 30, float),
+        max_pending=get_config("延迟追踪.max_pending", 10000, int),
+    )
+# 运行时性能分析（仅在独立管理端口提供，未开启时不导入分析模块）
+profiler = None
+profile_token = ""
+if get_config("性能分析.enable", False, bool):
+    if metrics_admin_port <= 0:
+        logger.error("性能分析需要配置独立管理端口（监控指标.admin_port），已忽略")
+    else:
+        from src.profiling import MODE_SAMPLE, Profiler, ProfileBusy
+        # 相对路径以可执行文件所在目录为基准（与配置文件、离线缓存一致），不随启动时的工作目录变化
+        profile_dir = Path(get_config("性能分析.output_dir", "profiles", str))
+        if not profile_dir.is_absolute():
+            profile_dir = Path(sys.argv[0]).parent.resolve() / profile_dir
+        profiler = Profiler(
+            output_dir=str(profile_dir),
+            prefix=f"profile-w{cluster.worker_id}" if cluster else "profile",
+        )
+# uvicorn运行参数
+# 协议层ping始终保留：只接收事件的客户端由协议层pong证明存活，应用层保活不会驱逐这类连接
+UVICORN_OPTIONS = dict(ws_ping_timeout=300, log_level="warning", timeout_keep_alive=300)
+
+
+async def spool_commit_loop():
+    """离线缓存组提交：按固定间隔批量同步磁盘，并定期清理过期分段"""
+    ticks = 0
+    interval = spool.commit_interval
+    while True:
+        await asyncio.sleep(interval)
+        if not spool.owned and spool.acquire(spool_lock_name()):
+            take_over_spool()
+        spool.flush_all()
+        ticks += 1
+        if ticks * interval >= 60:
+            ticks = 0
+            spool.enforce_retention()
+
+
+def spool_lock_name() -> str:
+    """离线缓存锁名：多进程模式下各工作进程负责不同密钥，按进程编号分别加锁"""
+    return f"worker-{cluster.worker_id}" if cluster else "spool"
+
+
+def take_over_spool():
+    """旧进程退出后接管离线缓存，补发其遗留的事件"""
+    logger.info("已接管离线缓存")
+    for conn in list(active_connections.connections()):
+        if spool_is_local(conn.secret) and spool.has_pending(conn.secret):
+            enqueue_spooled(conn)
+
+
+def apply_queue_limits(_=None):
+    """推送队列配置变更后应用到全部现有连接"""
+    global queue_max_size, queue_overflow
+    queue_max_size = max(get_config("推送队列.max_size", 1000, int), 1)
+    queue_overflow = get_config("推送队列.overflow", "drop_oldest", str)
+    for conn in active_connections.connections():
+        conn.max_size = queue_max_size
+        conn.overflow = queue_overflow
+
+
+def apply_batch_defaults(_=None):
+    global batch_max_size, batch_linger_ms
+    batch_max_size = get_config("推送队列.batch_max_size", 100, int)
+    batch_linger_ms = get_config("推送队列.batch_linger_ms", 5, int)
+
+
+def apply_admission(_=None):
+    """编译访问控制配置（白名单网段、限流速率），配置有误时保留原有规则"""
+    try:
+        admission.configure(
+            whitelist=get_config("访问控制.ip_whitelist", []) or [],
+            rate_limit=get_config("访问控制.rate_limit", ""),
+            ip_rate_limit=get_config("访问控制.ip_rate_limit", ""),
+            ws_connect_rate=get_config("访问控制.ws_connect_rate", ""),
+            ws_max_connections=get_config("访问控制.ws_max_connections", 0, int),
+            trust_forwarded=get_config("访问控制.trust_forwarded", False, bool),
+            trusted_hops=get_config("访问控制.trusted_hops", 1, int),
+            trust_real_ip=get_config("访问控制.trust_real_ip", False, bool),
+        )
+    except ValueError as e:
+        logger.error("访问控制配置无效: %s", e)
+
+
+def apply_keepalive(_=None):
+    keepalive.configure(
+        idle_timeout=get_config("连接保活.idle_timeout", 60, float),
+        evict_timeout=get_config("连接保活.evict_timeout", 30, float),
+    )
+
+
+def apply_api_proxy(_=None):
+    api_proxy.configure(
+        timeout=get_config("接口代理.timeout", 10, float),
+        max_concurrency=get_config("接口代理.max_concurrency", 8, int),
+        refresh_before=get_config("接口代理.refresh_before", 60, float),
+    )
+
+
+def apply_body_limits(_=None):
+    body_reader.configure(
+        max_size=get_config("请求体.max_kb", 1024, int) << 10,
+        pool_size=get_config("请求体.buffer_pool", 8, int),
+        retain=get_config("请求体.buffer_retain_kb", 256, int) << 10,
+    )
+
+
+def apply_tracing(_=None):
+    tracer.configure(
+        ack_timeout=get_config("延迟追踪.ack_timeout", 30, float),
+        max_pending=get_config("延迟追踪.max_pending", 10000, int),
+    )
+
+
+def apply_profiling(_=None):
+    global profile_token
+    profile_token = get_config("性能分析.token", "", str)
+    profiler.configure(
+        max_seconds=get_config("性能分析.max_seconds", 60, float),
+        sample_interval=get_config("性能分析.sample_interval_ms", 5, float) / 1000,
+        slow_callback=get_config("性能分析.slow_callback_ms", 100, float) / 1000,
+        keep_files=get_config("性能分析.keep_files", 20, int),
+    )
+    if not profile_token:
+        logger.warning("性能分析未设置token，采集接口将拒绝全部请求")
+
+
+def apply_priority(_=None):
+    """优先级配置热更新（事件类型映射、权重与调度模式），配置有误时保留原有配置"""
+    try:
+        priority.configure(
+            lanes=get_config("优先级.lanes", DEFAULT_LANES),
+            default=get_config("优先级.default", "normal", str),
+            schedule=get_config("优先级.schedule", "weighted", str),
+        )
+    except ValueError as e:
+        logger.error("优先级配置无效: %s", e)
+
+
+def apply_verify_signature(_=None):
+    global verify_signature
+    verify_signature = get_config("签名校验.enable", False, bool)
+    signature_engine.configure(max_age=get_config("签名校验.max_age", DEFAULT_MAX_AGE, float))
+
+
+def apply_log_level(value):
+    """日志等级热更新，配置项被删除时保持当前等级"""
+    if value is not None:
+        logger.setLevel(value)
+
+
+# 运行时配置变更（由配置监视线程回调，无需重启；配置项被删除时以None回调，按默认值处理）
+subscribe_config("日志等级.leave", apply_log_level)
+subscribe_config("推送队列.max_size", apply_queue_limits)
+subscribe_config("推送队列.overflow", apply_queue_limits)
+subscribe_config("推送队列.batch_max_size", apply_batch_defaults)
+subscribe_config("推送队列.batch_linger_ms", apply_batch_defaults)
+subscribe_config("签名校验.enable", apply_verify_signature)
+subscribe_config("签名校验.max_age", apply_verify_signature)
+subscribe_config("访问控制", apply_admission)
+subscribe_config("请求体", apply_body_limits)
+if keepalive:
+    subscribe_config("连接保活", apply_keepalive)
+if api_proxy:
+    subscribe_config("接口代理", apply_api_proxy)
+if tracer:
+    subscribe_config("延迟追踪", apply_tracing)
+if priority:
+    subscribe_config("优先级", apply_priority)
+if profiler:
+    subscribe_config("性能分析", apply_profiling)
+    apply_profiling()
+apply_admission()
+apply_body_limits()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动后台任务，退出时落盘"""
+    global warmup_until
+    takeover = handover
+    tasks = []
+    # 配置变更回调会修改连接与队列，调度到事件循环中执行
+    start_config_watcher(loop=asyncio.get_running_loop())
+    if spool:
+        if not spool.acquire(spool_lock_name()):
+            logger.warning("离线缓存正被其他进程使用（平滑重启中），旧进程退出后接管")
+            takeover = True
+        tasks.append(asyncio.create_task(spool_commit_loop()))
+    if takeover:
+        # 旧进程仍在运行：过渡期内等待客户端重连，无法送达的事件应答503；普通冷启动立即应答
+        logger.info("与旧进程交接中，启动过渡期 %.1f 秒", drain_timeout)
+        warmup_until = perf_counter() + drain_timeout
+    if keepalive:
+        tasks.append(asyncio.create_task(keepalive.run()))
+    if tracer:
+        tasks.append(asyncio.create_task(tracer.run()))
+    if cluster:
+        cluster.handlers.update({
+            OP_DELIVER: handle_routed_deliver,
+            OP_SPOOL: handle_routed_spool,
+            OP_FETCH: handle_routed_fetch,
+            OP_COMMIT: handle_routed_commit,
+            OP_DEDUP: handle_routed_dedup,
+            OP_EVICT: handle_routed_evict,
+        })
+        await cluster.start()
+    admin_server = None
+    if metrics_admin_port > 0:
+        # 多进程模式下各工作进程使用独立的管理端口
+        port = metrics_admin_port + (cluster.worker_id if cluster else 0)
+        admin_server = AdminServer(uvicorn.Config(admin_app, host=metrics_admin_host, port=port,
+                                                  log_level="warning"))
+        admin_task = asyncio.create_task(admin_server.serve())
+        logger.info("管理端口已启动: http://%s:%d", metrics_admin_host, port)
+    yield
+    if admin_server:
+        admin_server.should_exit = True
+        await admin_task
+    for task in tasks:
+        task.cancel()
+    if cluster:
+        await cluster.stop()
+    if spool:
+        spool.close()
+    if api_proxy:
+        await api_proxy.close()
+    stop_config_watcher()
+    stop_logging()
+
+
+app = FastAPI(lifespan=lifespan)
+# 独立管理端口上的应用（仅在配置admin_port时启动）
+admin_app = FastAPI()
 # 跨域配置
 app.add_middleware(
     CORSMiddleware,
@@ -21,15 +400,458 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 准入控制位于最外层，先于路由与请求体读取执行
+app.add_middleware(AdmissionMiddleware, controller=admission)
 
 # WebSocket连接管理
-active_connections = {}
-active_connections_lock = asyncio.Lock()
+active_connections = ConnectionRegistry(delivery_mode, delivery_modes, max_subscribers)
+
+
+def redeliver(secret: str, body: bytes):
+    """连接断开后遗留的事件：负载均衡模式下转交其他订阅者，否则写入离线缓存"""
+    subscribers = active_connections.get(secret)
+    if subscribers and subscribers.mode in BALANCED_MODES and subscribers.deliver(body):
+        return True
+    if spool and not spool_is_local(secret):
+        # 连接关闭时的回调无法等待，结果由spool_event记录
+        asyncio.ensure_future(spool_event(secret, body))
+        return True
+    return spool_local(secret, body)
+
+
+def discard_connection(conn: ClientConnection):
+    """连接写任务异常退出：立即注销，后续事件不再投递到该连接"""
+    if active_connections.remove(conn):
+        logger.warning("推送失败，已注销连接: %s", conn.secret)
+        if cluster and active_connections.get(conn.secret) is None:
+            cluster.release(conn.secret)
+
+
+def spool_is_local(secret: str) -> bool:
+    """该密钥的离线缓存是否由本进程负责（多进程模式下按密钥固定到某个工作进程）"""
+    return cluster is None or cluster.is_home(secret)
+
+
+async def spool_event(secret: str, body: bytes) -> bool:
+    """将未能送达的事件写入离线缓存，未开启缓存或写入失败时返回False（由调用方应答未送达）"""
+    if not spool:
+        return False
+    if spool_is_local(secret):
+        return spool_local(secret, body)
+    worker_id = cluster.home_worker(secret)
+    try:
+        if await cluster.call(worker_id, OP_SPOOL, secret, body) == b"\x01":
+            return True
+    except (ConnectionError, OSError, asyncio.TimeoutError) as e:
+        logger.warning("写入工作进程 #%d 的离线缓存失败: %s - %s", worker_id, secret, e)
+        return False
+    logger.warning("工作进程 #%d 未能写入离线缓存: %s", worker_id, secret)
+    return False
+
+
+def spool_local(secret: str, body: bytes) -> bool:
+    """写入本进程负责的离线缓存，缓存仍由旧进程持有时返回False"""
+    if not spool or not spool.owned:
+        return False
+    offset = spool.append(secret, body)
+    logger.info("事件已写入离线缓存: %s #%d", secret, offset)
+    return True
+
+
+async def read_spooled(secret: str, start_offset: int) -> list:
+    """读取离线缓存，start_offset为0时从消费游标之后开始"""
+    if not spool_is_local(secret):
+        payload = await cluster.call(cluster.home_worker(secret), OP_FETCH, secret, struct.pack("<Q", start_offset))
+        return decode_records(payload)
+    if not spool.owned:
+        return []
+    if not start_offset:
+        if not spool.has_pending(secret):
+            return []
+        start_offset = spool.log(secret).cursor + 1
+    return spool.log(secret).read(start_offset)
+
+
+async def commit_spooled(secret: str, offset: int):
+    """提交离线缓存消费游标"""
+    if not spool_is_local(secret):
+        await cluster.call(cluster.home_worker(secret), OP_COMMIT, secret, struct.pack("<Q", offset))
+    else:
+        spool.log(secret).commit_cursor(offset)
+
+
+async def replay_spool(conn: ClientConnection, start_offset: int = 0):
+    """顺序回放离线缓存，返回最后回放的偏移量（无缓存时为None）
+
+    回放的事件经出站队列推送（与实时事件相同的信封与批量格式），连接写任务需已启动。
+    """
+    last = None
+    while True:
+        batch = await read_spooled(conn.secret, start_offset)
+        if not batch:
+            return last
+        enqueued = await enqueue_replayed(conn, batch)
+        if enqueued is not None:
+            await commit_spooled(conn.secret, enqueued)
+            last = enqueued
+        if enqueued != batch[-1][0]:
+            # 连接已关闭，剩余事件留在缓存中
+            return last
+        start_offset = last + 1
+
+
+async def enqueue_replayed(conn: ClientConnection, batch: list):
+    """回放事件依次入队，队列已满时等待写任务发送（不因溢出策略丢弃），返回最后入队的偏移量"""
+    last = None
+    for offset, body in batch:
+        while len(conn.queue) >= conn.max_size:
+            if not await conn.flush(REPLAY_WAIT) and conn.closed:
+                return last
+        if conn.events is None or conn.accepts(event_type(body)):
+            if not conn.enqueue(body):
+                return last
+        last = offset
+    return last
 
 
-# 数据模型
-class Payload(BaseModel):
-    d: dict
+def enqueue_spooled(conn: ClientConnection):
+    """将回放后新写入离线缓存的事件同步转入出站队列"""
+    log = spool.log(conn.secret)
+    while True:
+        batch = log.read(log.cursor + 1)
+        if not batch:
+            return
+        for _, body in batch:
+            if conn.events is None or conn.accepts(event_type(body)):
+                conn.enqueue(body)
+        log.commit_cursor(batch[-1][0])
+
+
+async def register_connection(conn: ClientConnection) -> list:
+    """回放离线缓存后注册连接，返回被替换的旧连接"""
+    secret = conn.secret
+    # 先启动写任务，回放的事件经出站队列推送
+    conn.start()
+    if spool:
+        # 回放离线缓存，追平后再注册以保证事件顺序
+        offset_param = conn.websocket.query_params.get("offset")
+        start_offset = int(offset_param) + 1 if offset_param is not None and offset_param.isdigit() else 0
+        last_offset = await replay_spool(conn, start_offset)
+        if last_offset is not None:
+            logger.info("离线缓存回放完成: %s -> #%d", secret, last_offset)
+        # 回放期间新写入的事件先于实时事件入队（同步执行，期间不会有新事件插入）
+        if spool_is_local(secret) and spool.owned and spool.has_pending(secret):
+            enqueue_spooled(conn)
+
+    evicted = active_connections.add(conn)
+    arrival = arrivals.pop(secret, None)
+    if arrival is not None:
+        arrival.set()
+    if cluster:
+        cluster.claim(secret)
+        if active_connections.mode_for(secret) == MODE_REPLACE:
+            # replace模式跨进程生效：其他工作进程上的旧连接同样关闭
+            await cluster.evict(secret)
+        # 由其他工作进程负责的离线缓存在注册后补发
+        if spool and not spool_is_local(secret):
+            await replay_spool(conn)
+    logger.info("新连接建立: %s (%s)", secret, active_connections.mode_for(secret))
+    return evicted
+
+
+async def is_duplicate(secret: str, key: str) -> bool:
+    """检查并记录事件（多进程模式下由该密钥的负责进程统一判断，平台重试可能落到任意进程）"""
+    if cluster and not cluster.is_home(secret):
+        worker_id = cluster.home_worker(secret)
+        try:
+            reply = await cluster.call(worker_id, OP_DEDUP, secret, b"\x01" + key.encode())
+        except (ConnectionError, OSError, asyncio.TimeoutError) as e:
+            # 负责进程不可达时按非重复处理：宁可重复推送也不丢弃事件
+            logger.warning("查询工作进程 #%d 的去重记录失败: %s - %s", worker_id, secret, e)
+            return False
+        return reply == b"\x01"
+    return dedup.seen(secret, key)
+
+
+def forget_event(secret: str, key: str):
+    """事件未能送达时撤销去重记录，平台重试时可再次推送"""
+    if cluster and not cluster.is_home(secret):
+        worker_id = cluster.home_worker(secret)
+        task = asyncio.ensure_future(cluster.call(worker_id, OP_DEDUP, secret, b"\x00" + key.encode()))
+        task.add_done_callback(lambda done: log_forget_failure(done, worker_id, secret))
+    else:
+        dedup.forget(secret, key)
+
+
+def log_forget_failure(task: asyncio.Future, worker_id: int, secret: str):
+    """取出后台撤销请求的异常并记录（避免未取回的异常在任务回收时报错）"""
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error is not None:
+        logger.warning("撤销工作进程 #%d 的去重记录失败: %s - %s", worker_id, secret, error)
+
+
+async def handle_routed_dedup(secret: str, body: bytes) -> bytes:
+    key = body[1:].decode()
+    if body[:1] == b"\x01":
+        return b"\x01" if dedup.seen(secret, key) else b"\x00"
+    dedup.forget(secret, key)
+    return b"\x01"
+
+
+async def handle_routed_deliver(secret: str, body: bytes) -> bytes:
+    """其他工作进程转发来的事件：投递给本进程持有的连接"""
+    subscribers = active_connections.get(secret)
+    return b"\x01" if subscribers and subscribers.deliver(body) else b"\x00"
+
+
+async def handle_routed_spool(secret: str, body: bytes) -> bytes:
+    return b"\x01" if spool_local(secret, body) else b"\x00"
+
+
+async def handle_routed_evict(secret: str, body: bytes) -> bytes:
+    """其他工作进程以replace模式接收了该密钥的新连接：关闭本进程持有的旧连接"""
+    subscribers = active_connections.get(secret)
+    if subscribers is None or subscribers.mode != MODE_REPLACE:
+        return b"\x00"
+    for old_conn in subscribers.members:
+        active_connections.remove(old_conn)
+        try:
+            await old_conn.close()
+            logger.info("已关闭旧连接（新连接位于其他工作进程）: %s", secret)
+        except Exception as e:
+            logger.error("关闭旧连接失败: %s", e)
+    if active_connections.get(secret) is None:
+        cluster.release(secret)
+    return b"\x01"
+
+
+async def handle_routed_fetch(secret: str, body: bytes) -> bytes:
+    (start_offset,) = struct.unpack("<Q", body)
+    return encode_records(await read_spooled(secret, start_offset))
+
+
+async def handle_routed_commit(secret: str, body: bytes) -> bytes:
+    (offset,) = struct.unpack("<Q", body)
+    await commit_spooled(secret, offset)
+    return b"\x01"
+
+
+def negotiate_batch(conn: ClientConnection, max_size=None, linger_ms=None):
+    """按客户端请求开启批量推送，未指定的参数使用配置默认值"""
+    conn.configure_batch(
+        batch_max_size if max_size is None else max_size,
+        (batch_linger_ms if linger_ms is None else float(linger_ms)) / 1000,
+    )
+
+
+async def handle_batch_control(conn: ClientConnection, message: dict):
+    """握手消息 {"op": "batch", "max_size": 100, "linger_ms": 5}，max_size<=1 时关闭批量推送"""
+    negotiate_batch(conn, message.get("max_size"), message.get("linger_ms"))
+    conn.send_control(json.dumps({
+        "op": "batch",
+        "max_size": conn.batch_size,
+        "linger_ms": round(conn.batch_linger * 1000, 3),
+    }).encode())
+    logger.info("批量推送: %s max_size=%d", conn.secret, conn.batch_size)
+
+
+def subscribe_connection(conn: ClientConnection, events=None, intents=None):
+    """设置连接订阅的事件类型，events与intents均为空时接收全部事件"""
+    conn.events = resolve_subscription(events, intents)
+    subscribers = active_connections.get(conn.secret)
+    if subscribers is not None:
+        subscribers.refresh_filters()
+
+
+async def handle_subscribe_control(conn: ClientConnection, message: dict):
+    """订阅消息 {"op": "subscribe", "events": ["AT_MESSAGE_CREATE"], "intents": ["INTERACTION"]}
+
+    intents也可为位掩码整数；events与intents均为空时恢复接收全部事件
+    """
+    subscribe_connection(conn, message.get("events"), message.get("intents"))
+    conn.send_control(json.dumps({
+        "op": "subscribe",
+        "events": sorted(conn.events) if conn.events is not None else None,
+    }).encode())
+    logger.info("事件订阅: %s %s", conn.secret, "全部" if conn.events is None else ",".join(sorted(conn.events)))
+
+
+async def handle_ping_control(conn: ClientConnection, message: dict):
+    """客户端保活消息 {"op": "ping"}，应答 {"op": "pong"}
+
+    服务端发出的ping无需专门处理：收到客户端的任何消息都会刷新最后活动时间
+    """
+    conn.send_control(b'{"op": "pong"}')
+
+
+async def handle_api_control(conn: ClientConnection, message: dict):
+    """接口调用 {"op": "api", "id": 1, "method": "POST", "path": "/v2/groups/{openid}/messages", "body": {...}}
+
+    应答 {"op": "api", "id": 1, "status": 200, "body": {...}}，失败时为 {"op": "api", "id": 1, "error": "..."}；
+    调用在后台执行，同一连接可同时发起多个请求，以id对应应答
+    """
+    if api_proxy is None:
+        conn.send_control(error_frame(message.get("id"), "接口代理未开启"))
+        return
+    api_proxy.submit(conn, message)
+
+
+async def handle_ack_control(conn: ClientConnection, message: dict):
+    """信封模式的确认消息 {"op": "ack", "rid": 1} 或 {"op": "ack", "rids": [1, 2, 3]}"""
+    if conn.trace is None:
+        return
+    tracer.ack(conn.trace, parse_rids(message))
+
+
+# 客户端控制帧处理函数，按 op 分发
+CONTROL_HANDLERS = {
+    "batch": handle_batch_control,
+    "subscribe": handle_subscribe_control,
+    "ping": handle_ping_control,
+    "api": handle_api_control,
+    "ack": handle_ack_control,
+}
+
+
+async def dispatch_control(conn: ClientConnection, text: str):
+    """处理客户端发来的控制帧（JSON对象，按 op 字段分发），其他消息忽略"""
+    if not text.startswith("{"):
+        return
+    try:
+        message = json.loads(text)
+        handler = CONTROL_HANDLERS.get(message.get("op")) if isinstance(message, dict) else None
+        if handler is not None:
+            await handler(conn, message)
+    except (ValueError, TypeError) as e:
+        logger.warning("无效的控制帧: %s - %s", conn.secret, e)
+
+
+async def handle_stats():
+    """连接与推送队列状态（密钥已脱敏）"""
+    connections = list(active_connections.connections())
+    queues = {}
+    for conn in connections:
+        queues.setdefault(mask_secret(conn.secret), []).append(conn.stats())
+    return {
+        "connections": len(connections),
+        "queues": queues,
+        "logging": logging_stats(),
+        "dedup": dedup.stats() if dedup is not None else None,
+        "admission": admission.stats(),
+        "body": body_reader.stats(),
+        "keepalive": keepalive.stats() if keepalive else None,
+        "api_proxy": api_proxy.stats() if api_proxy else None,
+        "tracing": tracer.stats() if tracer else None,
+        "draining": draining,
+    }
+
+
+def queue_depths():
+    """按密钥（已脱敏）汇总的出站队列深度，抓取时计算"""
+    depths = {}
+    for conn in active_connections.connections():
+        key = mask_secret(conn.secret)
+        depths[key] = depths.get(key, 0) + len(conn.queue)
+    return [((key,), depth) for key, depth in depths.items()]
+
+
+def lane_depths():
+    """按优先级通道汇总的出站队列深度，抓取时计算"""
+    depths = dict.fromkeys(priority.names, 0)
+    for conn in active_connections.connections():
+        for name, depth in conn.lanes.depths().items():
+            depths[name] += depth
+    return [((name,), depth) for name, depth in depths.items()]
+
+
+metrics.registry.gauge("qqwebhook_connections", "活跃WebSocket连接数", function=lambda: len(active_connections))
+metrics.registry.gauge("qqwebhook_queue_depth", "出站队列深度", ("secret",), function=queue_depths)
+metrics.registry.gauge("qqwebhook_lane_depth", "各优先级通道的出站队列深度（全部连接合计）", ("lane",),
+                       function=lambda: lane_depths() if priority else [])
+metrics.registry.gauge("qqwebhook_dedup_entries", "去重缓存条目数",
+                       function=lambda: len(dedup) if dedup is not None else 0)
+metrics.registry.gauge("qqwebhook_dedup_memory_bytes", "去重缓存内存（估算）",
+                       function=lambda: dedup.memory_bytes() if dedup is not None else 0)
+metrics.registry.counter("qqwebhook_admission_rejected_total", "准入控制拒绝的请求数", ("reason",),
+                         function=lambda: [((reason,), count) for reason, count in admission.rejected.items()])
+metrics.registry.counter("qqwebhook_keepalive_total", "应用层保活ping与驱逐次数", ("result",),
+                         function=lambda: [(("ping",), keepalive.pings), (("evicted",), keepalive.evicted)]
+                         if keepalive else [])
+metrics.registry.counter("qqwebhook_api_requests_total", "接口代理请求数", ("result",),
+                         function=lambda: [((result,), count) for result, count in api_proxy.results.items()]
+                         if api_proxy else [])
+metrics.registry.counter("qqwebhook_api_token_fetches_total", "接口代理获取access_token次数",
+                         function=lambda: api_proxy.token_fetches if api_proxy else 0)
+metrics.registry.gauge("qqwebhook_body_in_flight_bytes", "正在读取与处理中的Webhook请求体字节数",
+                       function=lambda: body_reader.in_flight)
+metrics.registry.gauge("qqwebhook_body_in_flight_peak_bytes", "在途请求体字节数峰值",
+                       function=lambda: body_reader.peak)
+metrics.registry.gauge("qqwebhook_log_queue_dropped", "日志队列丢弃的记录数",
+                       function=lambda: logging_stats().get("dropped", 0))
+
+
+async def handle_metrics():
+    """Prometheus文本格式的运行指标"""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def add_status_route(path: str, endpoint):
+    """注册运行状态接口：配置admin_port时只在独立管理端口提供，否则仅在开启public时挂载到Webhook端口"""
+    if metrics_admin_port > 0:
+        admin_app.add_api_route(path, endpoint, methods=["GET"])
+    elif metrics_public:
+        app.add_api_route(path, endpoint, methods=["GET"])
+
+
+add_status_route("/stats", handle_stats)
+if metrics_enable:
+    add_status_route("/metrics", handle_metrics)
+
+
+def profile_authorized(request: Request) -> bool:
+    """性能分析接口的鉴权：请求头 Authorization: Bearer <性能分析.token>"""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    return bool(profile_token) and scheme.lower() == "bearer" and hmac.compare_digest(token.encode(),
+                                                                                      profile_token.encode())
+
+
+async def handle_profile_capture(request: Request):
+    """采集性能数据 POST /debug/profile?mode=sample|cpu&seconds=N，采集结束后返回摘要与结果文件名"""
+    if not profile_authorized(request):
+        return JSONResponse(status_code=401, content={"error": "Unauthorized"})
+    try:
+        result = await profiler.capture(request.query_params.get("mode", MODE_SAMPLE),
+                                        float(request.query_params.get("seconds", 10)))
+    except ProfileBusy as e:
+        return JSONResponse(status_code=409, content={"error": str(e)})
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    return JSONResponse(result)
+
+
+async def handle_profile_list(request: Request):
+    """采集状态与已保存的结果文件"""
+    if not profile_authorized(request):
+        return JSONResponse(status_code=401, content={"error": "Unauthorized"})
+    return JSONResponse(profiler.stats())
+
+
+async def handle_profile_download(request: Request):
+    """下载结果文件 GET /debug/profile/{name}"""
+    if not profile_authorized(request):
+        return JSONResponse(status_code=401, content={"error": "Unauthorized"})
+    file = profiler.resolve(request.path_params["name"])
+    if file is None:
+        return JSONResponse(status_code=404, content={"error": "Not found"})
+    return FileResponse(file, filename=file.name)
+
+
+if profiler:
+    admin_app.add_route("/debug/profile", handle_profile_capture, methods=["POST"])
+    admin_app.add_route("/debug/profile", handle_profile_list, methods=["GET"])
+    admin_app.add_route("/debug/profile/{name}", handle_profile_download, methods=["GET"])
 
 
 @app.get("/")
@@ -49,91 +871,326 @@ async def handle_favicon():
 
 
 @app.post("/webhook")
-async def handle_webhook(
-        request: Request,
-        payload: Payload,
-        user_agent: str = Header(None),
-        x_bot_appid: str = Header(None)
-):
-    """处理Webhook请求"""
+async def handle_webhook(request: Request):
+    """处理Webhook请求
+
+    请求头直接从request读取：声明Header参数会在注册路由时加载pydantic.v1兼容层，拖慢启动
+    """
     secret = request.query_params.get('secret')
     if not secret:
         logger.error("缺少secret参数")
         return {"error": "Secret required"}, 400
 
+    started = perf_counter()
+    try:
+        body_bytes = await body_reader.read(request)
+    except BodyTooLarge as e:
+        EVENTS_TOO_LARGE.inc()
+        logger.warning("请求体过大，已拒绝: %s (%s)", secret, e)
+        return JSONResponse(status_code=413, content={"error": "Payload too large"})
+    try:
+        return await process_webhook(request, secret, body_bytes, started)
+    finally:
+        body_reader.release(len(body_bytes))
+
+
+async def process_webhook(request: Request, secret: str, body_bytes: bytes, started: float):
+    """处理已读取的Webhook请求体"""
+    mark = perf_counter()
+    STAGE_READ.observe(mark - started)
+
+    # 开启签名校验时，在解析与转发前拒绝未签名或伪造的请求
+    if verify_signature:
+        headers = request.headers
+        valid = await verify_webhook_signature(secret, headers.get("x-signature-ed25519"),
+                                               headers.get("x-signature-timestamp"), body_bytes)
+        now = perf_counter()
+        STAGE_VERIFY.observe(now - mark)
+        mark = now
+        if not valid:
+            EVENTS_REJECTED.inc()
+            logger.warning("签名校验失败: %s", secret)
+            return JSONResponse(status_code=401, content={"error": "Invalid signature"})
+    if api_proxy:
+        # 平台在X-Bot-AppID中携带机器人appid，接口代理据此获取access_token
+        api_proxy.learn_appid(secret, request.headers.get("x-bot-appid"))
+
     try:
         # 处理回调验证请求
-        if "event_ts" in payload.d and "plain_token" in payload.d:
-            logger.debug("申请进行签名校验： %s", Payload.d)
-            event_ts = payload.d["event_ts"]
-            plain_token = payload.d["plain_token"]
+        validation = parse_validation_request(body_bytes)
+        now = perf_counter()
+        STAGE_PARSE.observe(now - mark)
+        mark = now
+        if validation is not None:
+            logger.debug("申请进行签名校验： %s", validation)
+            event_ts = validation["event_ts"]
+            plain_token = validation["plain_token"]
 
-            result = generate_signature(secret, event_ts, plain_token)
+            result = await generate_signature_async(secret, event_ts, plain_token)
+            now = perf_counter()
+            STAGE_SIGN.observe(now - mark)
+            STAGE_TOTAL.observe(now - started)
+            EVENTS_VALIDATION.inc()
             logger.debug("生成签名: %s", result)
             return result
 
-        # 处理普通消息
-        body_bytes = await request.body()
-        body_str = body_bytes.decode('utf-8')
-        logger.info("收到消息: %s", body_str)
+        # 处理普通消息（原始字节直接透传，仅在需要时解码）
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("收到消息: %s", body_bytes.decode('utf-8', 'replace'))
 
-        # 获取对应WebSocket连接
-        async with active_connections_lock:
-            ws = active_connections.get(secret)
+        # 平台重试的重复事件直接应答，不再推送
+        dedup_key = event_key(body_bytes) if dedup is not None else None
+        duplicate = dedup_key is not None and await is_duplicate(secret, dedup_key)
+        if dedup is not None:
+            now = perf_counter()
+            STAGE_DEDUP.observe(now - mark)
+            mark = now
+        if duplicate:
+            EVENTS_DUPLICATE.inc()
+            logger.info("重复事件已忽略: %s %s", secret, dedup_key)
+            return {"status": "重复事件"}
 
-        if ws:
-            try:
-                await ws.send_text(body_str)
+        # 获取对应WebSocket连接（无锁查询），入队后立即应答，不等待客户端
+        subscribers = active_connections.get(secret)
+        if not subscribers and not draining and perf_counter() < warmup_until:
+            subscribers = await wait_for_subscribers(secret)
+
+        if subscribers:
+            # 仅在有订阅者设置过滤或开启优先级时提取事件类型
+            kind = subscribers.event_type(body_bytes) if priority is None else event_type(body_bytes)
+            if not subscribers.accepts(kind):
+                observe_route(mark, started)
+                EVENTS_FILTERED.inc()
+                return {"status": "已过滤"}
+            delivered = subscribers.deliver(body_bytes, kind, started, priority.lane(kind) if priority else None)
+            observe_route(mark, started)
+            if delivered:
+                EVENTS_DELIVERED.inc()
                 logger.info("消息推送成功: %s", secret)
-            except WebSocketDisconnect:
-                logger.warning("连接已断开: %s", secret)
-                async with active_connections_lock:
-                    if secret in active_connections and active_connections[secret] is ws:
-                        del active_connections[secret]
-            except Exception as e:
-                logger.error("推送失败: %s", e)
+                return {"status": "推送成功"}
+            logger.warning("推送队列已满或连接已关闭: %s", secret)
+            if await spool_event(secret, body_bytes):
+                EVENTS_SPOOLED.inc()
+                return {"status": "已缓存"}
+            EVENTS_UNDELIVERED.inc()
+            if dedup_key is not None:
+                forget_event(secret, dedup_key)
+            return {"status": "队列已满"}
+
+        # 多进程模式：转发给持有连接的工作进程
+        if cluster and await cluster.forward(secret, body_bytes):
+            observe_route(mark, started)
+            EVENTS_FORWARDED.inc()
+            logger.info("消息已转发: %s", secret)
             return {"status": "推送成功"}
 
+        observe_route(mark, started)
         logger.warning("未找到活跃连接: %s", secret)
+        if await spool_event(secret, body_bytes):
+            EVENTS_SPOOLED.inc()
+            return {"status": "已缓存"}
+        if dedup_key is not None:
+            forget_event(secret, dedup_key)
+        if restarting():
+            # 客户端正在迁移到新进程：应答503由平台重试，不丢弃事件
+            EVENTS_DEFERRED.inc()
+            return JSONResponse(status_code=503, content={"status": "服务重启中"}, headers={"Retry-After": "1"})
+        EVENTS_UNDELIVERED.inc()
         return {"status": "连接未就绪"}
 
     except Exception as e:
+        EVENTS_FAILED.inc()
         logger.error("处理异常: %s", e)
-        return {"error": "服务器内部错误"}, 500
+        return JSONResponse(status_code=500, content={"error": "服务器内部错误"})
+
+
+async def wait_for_subscribers(secret: str):
+    """启动过渡期内暂缓投递，等待客户端从旧进程重连（至多hold_ms），超时返回None"""
+    timeout = min(warmup_until - perf_counter(), hold_ms / 1000)
+    if timeout <= 0 or (cluster and cluster.owners(secret)):
+        return None
+    arrival = arrivals.get(secret)
+    if arrival is None:
+        arrival = arrivals[secret] = asyncio.Event()
+    try:
+        await asyncio.wait_for(arrival.wait(), timeout)
+    except asyncio.TimeoutError:
+        return None
+    return active_connections.get(secret)
+
+
+def restarting() -> bool:
+    """平滑重启过渡期：本进程正在排空、接替旧进程后刚启动（客户端尚在重连），或离线缓存仍由旧进程持有"""
+    return draining or perf_counter() < warmup_until or (spool is not None and not spool.owned)
 
 
-@app.websocket("/ws/{secret}")
-async def websocket_endpoint(websocket: WebSocket, secret: str):
-    """WebSocket连接端点"""
+def observe_route(mark: float, started: float):
+    """记录查询连接/入队阶段与Webhook总耗时"""
+    now = perf_counter()
+    STAGE_ROUTE.observe(now - mark)
+    STAGE_TOTAL.observe(now - started)
+
+
+# 注册为Starlette原生路由：不经过FastAPI依赖注入，连接存续期间不保留依赖解析的上下文
+@app.websocket_route("/ws/{secret}")
+async def websocket_endpoint(websocket: WebSocket):
+    """WebSocket连接端点
+
+    ?frame=binary 时以二进制帧推送；开启离线缓存时，?offset=N 从偏移量N之后回放，
+    未指定时回放上次消费位置之后的全部缓存事件；
+    ?batch=on|N&linger_ms=M 开启批量推送，事件合并为JSON数组帧，攒满N条或等待M毫秒后发送；
+    ?events=A,B / ?intents=X,Y 只接收指定类型的事件；?appid=N 指定接口代理使用的机器人appid；
+    ?envelope=on 时事件包装为带中继ID与时间戳的信封，客户端以 {"op": "ack"} 确认（需开启延迟追踪）
+    """
+    secret = websocket.path_params["secret"]
+    if api_proxy:
+        api_proxy.learn_appid(secret, websocket.query_params.get("appid"))
+    if draining:
+        # 正在退出，握手前拒绝，客户端重连到新进程
+        await websocket.close(CLOSE_SERVICE_RESTART)
+        return
     await websocket.accept()
+    conn = ClientConnection(
+        websocket,
+        secret,
+        binary=websocket.query_params.get("frame") == "binary",
+        max_size=queue_max_size,
+        overflow=queue_overflow,
+        on_undelivered=redeliver,
+        priority=priority,
+        on_failed=discard_connection,
+    )
+    batch_param = websocket.query_params.get("batch")
+    if batch_param and batch_param not in ("0", "off", "false"):
+        try:
+            negotiate_batch(conn, batch_param if batch_param.isdigit() else None,
+                            websocket.query_params.get("linger_ms"))
+        except ValueError:
+            logger.warning("无效的批量推送参数: %s", secret)
+    try:
+        conn.events = resolve_subscription(websocket.query_params.get("events"),
+                                           websocket.query_params.get("intents"))
+    except ValueError as e:
+        logger.warning("无效的订阅参数: %s - %s", secret, e)
+    if websocket.query_params.get("envelope") in ("on", "1", "true"):
+        if tracer:
+            conn.trace = tracer.open(secret)
+        else:
+            logger.warning("延迟追踪未开启，忽略信封模式: %s", secret)
 
-    # 关闭旧连接并注册新连接
-    async with active_connections_lock:
-        if secret in active_connections:
-            old_ws = active_connections[secret]
+    try:
+        # 同一密钥的注册流程串行执行，不影响其他密钥的投递
+        async with active_connections.registration_lock(secret):
+            evicted = await register_connection(conn)
+
+        # 在注册表外关闭被替换的旧连接
+        for old_conn in evicted:
             try:
-                await old_ws.close()
+                await old_conn.close()
                 logger.info("已关闭旧连接: %s", secret)
             except Exception as e:
                 logger.error("关闭旧连接失败: %s", e)
-        active_connections[secret] = websocket
-        logger.info("新连接建立: %s", secret)
 
-    try:
+        if keepalive:
+            keepalive.watch(conn)
+
         while True:
-            await websocket.receive_text()
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            # 任何入站帧（包括二进制帧）都视为客户端活动
+            conn.touch()
+            if message.get("text") is not None:
+                await dispatch_control(conn, message["text"])
     except WebSocketDisconnect:
         logger.info("连接断开: %s", secret)
     except Exception as e:
         logger.error("连接异常: %s - %s", secret, e)
     finally:
-        async with active_connections_lock:
-            if secret in active_connections and active_connections[secret] is websocket:
-                del active_connections[secret]
-                logger.info("清理连接: %s", secret)
+        if keepalive:
+            keepalive.unwatch(conn)
+        if active_connections.remove(conn):
+            logger.info("清理连接: %s", secret)
+            if cluster and active_connections.get(secret) is None:
+                cluster.release(secret)
+        await conn.stop()
+        if conn.trace is not None:
+            tracer.close(conn.trace)
+
+
+async def drain_connections(timeout: float, spread: float):
+    """退出排空：提示客户端分散重连，推送完已入队的事件后按各自的时间关闭连接
+
+    每个连接的关闭时间在spread秒内随机分布，并通过控制帧提前告知客户端，避免全部客户端同时重连。
+    """
+    global draining
+    draining = True
+    connections = list(active_connections.connections())
+    if not connections:
+        return
+    logger.info("正在排空连接: %d 个（最长 %.1f 秒）", len(connections), timeout)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    spread = max(min(spread, timeout), 0.0)
+
+    async def drain(conn: ClientConnection):
+        delay = random.uniform(0, spread)
+        conn.send_control(json.dumps({"op": "reconnect", "delay_ms": round(delay * 1000)}).encode())
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # 关闭前推送完已入队的事件，超时未送达的由on_undelivered写入离线缓存
+        await conn.flush(max(deadline - loop.time(), 0.0))
+        if not conn.closed:
+            await conn.close(CLOSE_SERVICE_RESTART)
+        logger.debug("连接已排空: %s (%.0f ms)", conn.secret, (loop.time() - deadline + timeout) * 1000)
+
+    await asyncio.gather(*(drain(conn) for conn in connections))
+    logger.info("连接排空完成")
+
+
+class DrainingServer(uvicorn.Server):
+    """退出时先停止接受新连接并排空WebSocket连接，再执行uvicorn的关闭流程"""
+
+    async def shutdown(self, sockets=None):
+        for server in self.servers:
+            server.close()
+        for sock in sockets or []:
+            sock.close()
+        # 关闭空闲的HTTP长连接（处理中的请求应答后关闭），Webhook随即转到新进程；
+        # 只有HTTP协议对象带有请求周期cycle，WebSocket连接留待排空
+        for connection in list(self.server_state.connections):
+            if hasattr(connection, "cycle"):
+                connection.shutdown()
+        await drain_connections(drain_timeout, reconnect_spread_ms / 1000)
+        await super().shutdown(sockets)
+
+
+def create_server(**kwargs) -> DrainingServer:
+    return DrainingServer(uvicorn.Config(app, timeout_graceful_shutdown=max(drain_timeout, 1), **UVICORN_OPTIONS,
+                                         **kwargs))
+
+
+class AdminServer(uvicorn.Server):
+    """与主服务共用事件循环的管理端口服务，不接管进程信号"""
+
+    def capture_signals(self):
+        return nullcontext()
+
+    def install_signal_handlers(self):
+        pass
+
+
+def run_worker(worker_id: int):
+    """多进程模式的工作进程入口：各进程以SO_REUSEPORT绑定同一端口"""
+    host = get_config("服务端信息.ip")
+    port = int(get_config("服务端信息.port"))
+    sock = bind_reuse_port(host, port)
+    create_server().run(sockets=[sock])
 
 
 if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()
     logger.info("欢迎使用QQwebhook服务端")
     logger.info("=======================🛠 使用方式 🛠======================")
     logger.info("🔗 Webhook 接入地址：")
@@ -153,11 +1210,19 @@ if __name__ == "__main__":
     logger.info(" 🪝   Webhook 回调接口")
     logger.info(f"  ➤ [http://{host}:{port}/webhook?secret=机器人密钥")
     logger.info("╚══════════════════════════════════════════════════════")
-    uvicorn.run(
-        app,
-        host=host,
-        port=port,
-        ws_ping_timeout=300,
-        log_level="warning",
-        timeout_keep_alive=300
-    )
+    workers = get_config("服务端信息.workers", 1, int) or os.cpu_count()
+    if (workers > 1 or reuse_port) and supports_reuse_port() and port_in_use(host, port):
+        # 旧进程仍在监听同一端口（重叠启动）：开启启动过渡期，等待客户端从旧进程迁移
+        handover = True
+        os.environ[ENV_HANDOVER] = "1"
+    if workers > 1 and supports_reuse_port():
+        logger.info("多进程模式: %d 个工作进程", workers)
+        run_supervisor(run_worker, workers)
+    else:
+        if workers > 1:
+            logger.warning("当前平台不支持SO_REUSEPORT，使用单进程模式")
+        if reuse_port and supports_reuse_port():
+            # 新进程可在本进程排空期间绑定同一端口，接收新的连接
+            create_server().run(sockets=[bind_reuse_port(host, port)])
+        else:
+            create_server(host=host, port=port).run()
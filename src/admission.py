@@ -0,0 +1,288 @@
+# 准入控制：IP白名单、令牌桶限流、WebSocket连接数限制
+import ipaddress
+import logging
+import math
+import re
+import socket
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+logger = logging.getLogger("QQwebhook")
+
+# 速率单位（秒数）
+RATE_UNITS = {
+    "秒": 1, "s": 1, "sec": 1, "second": 1,
+    "分": 60, "分钟": 60, "m": 60, "min": 60, "minute": 60,
+    "时": 3600, "小时": 3600, "h": 3600, "hour": 3600,
+    "天": 86400, "d": 86400, "day": 86400,
+}
+_RATE_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(?:/\s*(\d*)\s*(\S+?))?\s*$")
+
+# 拒绝原因
+REJECT_WHITELIST = "whitelist"
+REJECT_IP_RATE = "ip_rate"
+REJECT_SECRET_RATE = "secret_rate"
+REJECT_WS_RATE = "ws_rate"
+REJECT_WS_LIMIT = "ws_limit"
+REJECT_REASONS = (REJECT_WHITELIST, REJECT_IP_RATE, REJECT_SECRET_RATE, REJECT_WS_RATE, REJECT_WS_LIMIT)
+
+
+def parse_rate(value) -> Optional[Tuple[float, float]]:
+    """解析速率配置，返回(每秒速率, 桶容量)；如 "1000/分钟"、"50/秒"、"10/5s"，纯数字按每秒计，空值不限制
+
+    桶容量默认为一个周期内的请求数，即允许在一个周期内集中到达。
+    """
+    if value in (None, "", 0, False):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value), float(value)
+    match = _RATE_PATTERN.match(str(value))
+    if match is None:
+        raise ValueError(f"无效的速率配置: {value}")
+    count = float(match.group(1))
+    multiplier = float(match.group(2)) if match.group(2) else 1.0
+    unit = match.group(3) or "秒"
+    if unit.lower() not in RATE_UNITS:
+        raise ValueError(f"无效的速率单位: {value}")
+    period = RATE_UNITS[unit.lower()] * multiplier
+    return count / period, count
+
+
+class RateLimiter:
+    """按键的令牌桶：每个键的状态为[令牌数, 上次更新时间]，访问时按时间差补充令牌，无后台任务
+
+    键数超过max_keys时清理已补满（空闲）的桶，保证内存有界。
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100000):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.max_keys = max_keys
+        self._buckets: Dict[str, List[float]] = {}
+
+    def allow(self, key: str, now: Optional[float] = None) -> bool:
+        if now is None:
+            now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._sweep(now)
+            self._buckets[key] = [self.burst - 1, now]
+            return True
+        tokens = bucket[0] + (now - bucket[1]) * self.rate
+        if tokens > self.burst:
+            tokens = self.burst
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - 1
+        return True
+
+    def retry_after(self, key: str) -> float:
+        """距下一个令牌可用的秒数"""
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket[0] >= 1:
+            return 0.0
+        return (1 - bucket[0]) / self.rate
+
+    def _sweep(self, now: float):
+        full = [key for key, (tokens, stamp) in self._buckets.items()
+                if tokens + (now - stamp) * self.rate >= self.burst]
+        for key in full:
+            del self._buckets[key]
+        # 仍然超限时（大量活跃键）淘汰最早加入的一半
+        if len(self._buckets) >= self.max_keys:
+            for key in list(self._buckets)[:len(self._buckets) // 2]:
+                del self._buckets[key]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class PrefixSet:
+    """预编译的CIDR集合：按前缀长度分组保存网络号，查询时对每个出现过的前缀长度做一次集合查找"""
+
+    def __init__(self, networks: Iterable[str]):
+        self._tables: Dict[int, List[Tuple[int, set]]] = {4: [], 6: []}
+        grouped: Dict[Tuple[int, int], set] = {}
+        for text in networks:
+            network = ipaddress.ip_network(str(text).strip(), strict=False)
+            grouped.setdefault((network.version, network.prefixlen), set()).add(int(network.network_address))
+        for (version, prefixlen), addresses in sorted(grouped.items(), key=lambda item: item[0][1]):
+            bits = 32 if version == 4 else 128
+            self._tables[version].append((bits - prefixlen, addresses))
+        self.size = sum(len(addresses) for addresses in grouped.values())
+
+    def __bool__(self) -> bool:
+        return self.size > 0
+
+    def __contains__(self, ip: str) -> bool:
+        try:
+            if ":" in ip:
+                value = int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), "big")
+                # IPv4映射地址按IPv4匹配
+                if value >> 32 == 0xFFFF:
+                    return self._match(4, value & 0xFFFFFFFF)
+                return self._match(6, value)
+            return self._match(4, int.from_bytes(socket.inet_aton(ip), "big"))
+        except OSError:
+            return False
+
+    def _match(self, version: int, value: int) -> bool:
+        for shift, addresses in self._tables[version]:
+            if (value >> shift) << shift in addresses:
+                return True
+        return False
+
+
+class AdmissionController:
+    """准入控制：在读取请求体与签名校验之前拒绝超限请求"""
+
+    def __init__(self):
+        self.whitelist = PrefixSet(())
+        self.secret_limiter: Optional[RateLimiter] = None
+        self.ip_limiter: Optional[RateLimiter] = None
+        self.ws_limiter: Optional[RateLimiter] = None
+        self.ws_max_connections = 0
+        self.trust_forwarded = False
+        self.trusted_hops = 1
+        self.trust_real_ip = False
+        self.ws_active = 0
+        self.rejected = dict.fromkeys(REJECT_REASONS, 0)
+
+    def configure(self, whitelist=(), rate_limit=None, ip_rate_limit=None, ws_connect_rate=None,
+                  ws_max_connections: int = 0, trust_forwarded: bool = False, trusted_hops: int = 1,
+                  trust_real_ip: bool = False):
+        """编译配置后整体替换，可在运行时重复调用（配置热加载）"""
+        self.whitelist = PrefixSet(whitelist or ())
+        self.secret_limiter = self._limiter(rate_limit)
+        self.ip_limiter = self._limiter(ip_rate_limit)
+        self.ws_limiter = self._limiter(ws_connect_rate)
+        self.ws_max_connections = int(ws_max_connections or 0)
+        self.trust_forwarded = bool(trust_forwarded)
+        self.trusted_hops = max(int(trusted_hops or 1), 1)
+        self.trust_real_ip = bool(trust_real_ip)
+
+    @staticmethod
+    def _limiter(value) -> Optional[RateLimiter]:
+        rate = parse_rate(value)
+        return RateLimiter(*rate) if rate else None
+
+    def client_ip(self, scope) -> str:
+        """来源IP：信任反向代理时按可信代理层数从右侧取X-Forwarded-For
+
+        X-Forwarded-For靠左的条目由客户端自行填写，只有最右侧trusted_hops个条目由可信代理追加。
+        X-Real-IP只有在代理总是覆盖该请求头时才可信，需单独开启trust_real_ip。
+        """
+        if self.trust_real_ip:
+            for name, value in scope.get("headers", ()):
+                if name == b"x-real-ip":
+                    real_ip = value.strip()
+                    if real_ip:
+                        return real_ip.decode("latin-1")
+        if self.trust_forwarded:
+            forwarded = []
+            for name, value in scope.get("headers", ()):
+                if name == b"x-forwarded-for":
+                    forwarded.extend(entry.strip() for entry in value.split(b","))
+            forwarded = [entry for entry in forwarded if entry]
+            if forwarded:
+                return forwarded[max(len(forwarded) - self.trusted_hops, 0)].decode("latin-1")
+        client = scope.get("client")
+        return client[0] if client else ""
+
+    def _reject(self, reason: str) -> str:
+        self.rejected[reason] += 1
+        return reason
+
+    def check_ip(self, ip: str) -> Optional[str]:
+        if self.whitelist and ip not in self.whitelist:
+            return self._reject(REJECT_WHITELIST)
+        return None
+
+    def check_webhook(self, ip: str, secret: Optional[str]) -> Optional[str]:
+        """Webhook请求准入检查，通过时返回None，否则返回拒绝原因"""
+        reason = self.check_ip(ip)
+        if reason:
+            return reason
+        now = time.monotonic()
+        if self.ip_limiter is not None and not self.ip_limiter.allow(ip, now):
+            return self._reject(REJECT_IP_RATE)
+        if secret and self.secret_limiter is not None and not self.secret_limiter.allow(secret, now):
+            return self._reject(REJECT_SECRET_RATE)
+        return None
+
+    def check_websocket(self, ip: str) -> Optional[str]:
+        """WebSocket连接准入检查"""
+        reason = self.check_ip(ip)
+        if reason:
+            return reason
+        if self.ws_max_connections and self.ws_active >= self.ws_max_connections:
+            return self._reject(REJECT_WS_LIMIT)
+        if self.ws_limiter is not None and not self.ws_limiter.allow(""):
+            return self._reject(REJECT_WS_RATE)
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "rejected": dict(self.rejected),
+            "ws_active": self.ws_active,
+            "tracked_secrets": len(self.secret_limiter) if self.secret_limiter else 0,
+            "tracked_ips": len(self.ip_limiter) if self.ip_limiter else 0,
+        }
+
+
+class AdmissionMiddleware:
+    """ASGI中间件：在路由、依赖解析与读取请求体之前执行准入检查"""
+
+    def __init__(self, app, controller: AdmissionController, webhook_path: str = "/webhook",
+                 ws_prefix: str = "/ws/"):
+        self.app = app
+        self.controller = controller
+        self.webhook_path = webhook_path
+        self.ws_prefix = ws_prefix
+
+    async def __call__(self, scope, receive, send):
+        kind = scope["type"]
+        if kind == "http" and scope["path"] == self.webhook_path:
+            controller = self.controller
+            secret = None
+            if controller.secret_limiter is not None:
+                secret = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1"))).get("secret")
+            ip = controller.client_ip(scope)
+            reason = controller.check_webhook(ip, secret)
+            if reason:
+                retry = 0.0
+                if reason == REJECT_IP_RATE:
+                    retry = controller.ip_limiter.retry_after(ip)
+                elif reason == REJECT_SECRET_RATE:
+                    retry = controller.secret_limiter.retry_after(secret)
+                await self._reject_http(send, reason, retry)
+                return
+        elif kind == "websocket" and scope["path"].startswith(self.ws_prefix):
+            controller = self.controller
+            reason = controller.check_websocket(controller.client_ip(scope))
+            if reason:
+                # 握手前关闭，服务器返回403；重连风暴时避免刷屏，仅在调试级别记录
+                logger.debug("WebSocket连接被拒绝: %s (%s)", controller.client_ip(scope), reason)
+                await send({"type": "websocket.close", "code": 1008})
+                return
+            controller.ws_active += 1
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                controller.ws_active -= 1
+            return
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _reject_http(send, reason: str, retry_after: float = 0.0):
+        status = 403 if reason == REJECT_WHITELIST else 429
+        body = b'{"error":"Forbidden"}' if status == 403 else b'{"error":"Too Many Requests"}'
+        headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        if status == 429:
+            headers.append((b"retry-after", str(max(1, math.ceil(retry_after))).encode()))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
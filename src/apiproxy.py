@@ -0,0 +1,310 @@
+# QQ开放平台接口代理：客户端经WebSocket发起接口调用，由中继共享连接池与access_token
+import asyncio
+import json
+import logging
+import ssl
+import time
+from importlib.util import find_spec
+from typing import Dict, Optional, Tuple
+
+from src.metrics import STAGE_API
+
+logger = logging.getLogger("QQwebhook")
+
+DEFAULT_BASE_URL = "https://api.sgroup.qq.com"
+DEFAULT_TOKEN_URL = "https://bots.qq.com/app/getAppAccessToken"
+ALLOWED_METHODS = frozenset(("GET", "POST", "PUT", "PATCH", "DELETE"))
+# 透传给开放平台的客户端请求头（鉴权相关的头由中继设置）
+FORWARDED_HEADERS = frozenset(("content-type", "x-request-id"))
+
+# 请求结果
+RESULT_OK = "ok"
+RESULT_ERROR = "error"          # 上游连接失败或超时
+RESULT_REJECTED = "rejected"    # 请求格式错误、缺少appid或超出并发上限
+RESULT_TOKEN = "token"          # 获取access_token失败
+RESULTS = (RESULT_OK, RESULT_ERROR, RESULT_REJECTED, RESULT_TOKEN)
+# 后台刷新失败后的重试间隔（秒）
+REFRESH_RETRY = 5.0
+
+
+class ApiProxyError(Exception):
+    """接口调用失败，消息原样返回给客户端"""
+
+    def __init__(self, message: str, result: str = RESULT_ERROR):
+        super().__init__(message)
+        self.result = result
+
+
+class AccessToken:
+    """单个机器人的access_token（按机器人密钥缓存，appid变化时重新获取）"""
+    __slots__ = ("appid", "value", "expires_at", "used")
+
+    def __init__(self, appid: str, value: str, expires_at: float):
+        self.appid = appid
+        self.value = value
+        self.expires_at = expires_at
+        # 有效期内被使用过：到期前在后台续期，未使用的token到期后不再续期
+        self.used = False
+
+
+def response_frame(request_id, status: int, content_type: str, content: bytes) -> bytes:
+    """接口应答控制帧；上游返回JSON时原始字节直接拼接，不重新解析"""
+    head = json.dumps({"op": "api", "id": request_id, "status": status}, ensure_ascii=False)[:-1].encode()
+    if content and content_type.startswith("application/json"):
+        return head + b', "body": ' + content + b"}"
+    body = json.dumps(content.decode("utf-8", "replace") if content else None, ensure_ascii=False)
+    return head + b', "body": ' + body.encode() + b"}"
+
+
+def error_frame(request_id, message: str) -> bytes:
+    return json.dumps({"op": "api", "id": request_id, "error": message}, ensure_ascii=False).encode()
+
+
+class ApiProxy:
+    """共享的开放平台客户端
+
+    所有机器人共用长连接池（安装h2时使用HTTP/2多路复用），免去各机器人进程各自的TLS握手；
+    access_token按机器人缓存，在expires_in到期前refresh_before秒由定时器在后台刷新（有效期内未被使用的不再续期），
+    调用时剩余有效期不足refresh_before秒也会触发刷新，同一机器人同时只有一次刷新；
+    每个机器人的并发请求数不超过max_concurrency。
+    """
+
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, token_url: str = DEFAULT_TOKEN_URL,
+                 http2: bool = True, max_connections: int = 100, max_keepalive: int = 100,
+                 keepalive_expiry: float = 60.0, timeout: float = 10.0, max_concurrency: int = 8,
+                 refresh_before: float = 60.0, verify=True, pool_shards: int = 16):
+        self.base_url = base_url.rstrip("/")
+        self.token_url = token_url
+        self.http2 = http2 and find_spec("h2") is not None
+        if http2 and not self.http2:
+            logger.info("未安装h2，接口代理使用HTTP/1.1长连接")
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.verify = verify
+        # httpcore的连接池每次分配请求都要逐个检查池中连接，连接数较多时开销显著增长；
+        # HTTP/1.1下按机器人分片为多个小连接池，同一机器人的请求固定使用同一分片（HTTP/2只需一个连接，不分片）
+        self.pool_shards = 1 if self.http2 else max(int(pool_shards), 1)
+        self.timeout = timeout
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.refresh_before = refresh_before
+        # 机器人密钥 -> appid（来自Webhook的X-Bot-AppID请求头或客户端连接参数）
+        self.appids: Dict[str, str] = {}
+        self._clients: list = []
+        self._tokens: Dict[str, AccessToken] = {}
+        self._refreshing: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._tasks = set()
+        self.results = dict.fromkeys(RESULTS, 0)
+        self.token_fetches = 0
+
+    def configure(self, timeout: float = None, max_concurrency: int = None, refresh_before: float = None):
+        """运行时可调整的参数（连接池参数需重启生效）"""
+        if timeout is not None:
+            self.timeout = timeout
+        if max_concurrency is not None and max(int(max_concurrency), 1) != self.max_concurrency:
+            self.max_concurrency = max(int(max_concurrency), 1)
+            # 新请求使用新的并发上限，进行中的请求不受影响
+            self._semaphores.clear()
+        if refresh_before is not None:
+            self.refresh_before = refresh_before
+
+    def client(self, secret: str):
+        """机器人所在分片的httpx客户端（首次调用时创建，不调用接口代理时无需导入httpx）"""
+        if not self._clients:
+            import httpx
+            # 各分片共用一个SSL上下文，只加载一次CA证书
+            if isinstance(self.verify, str):
+                context = ssl.create_default_context(cafile=self.verify)
+            else:
+                context = httpx.create_ssl_context(verify=self.verify)
+            limits = httpx.Limits(max_connections=max(self.max_connections // self.pool_shards, 1),
+                                  max_keepalive_connections=max(self.max_keepalive // self.pool_shards, 1),
+                                  keepalive_expiry=self.keepalive_expiry)
+            self._clients = [httpx.AsyncClient(http2=self.http2, verify=context, timeout=self.timeout,
+                                               limits=limits)
+                             for _ in range(self.pool_shards)]
+        return self._clients[hash(secret) % len(self._clients)]
+
+    def learn_appid(self, secret: str, appid: Optional[str]):
+        if appid and self.appids.get(secret) != appid:
+            self.appids[secret] = appid
+
+    # ------------------------------------------------------------ access_token
+
+    async def _fetch_token(self, secret: str, appid: str) -> AccessToken:
+        import httpx
+        self.token_fetches += 1
+        try:
+            response = await self.client(secret).post(self.token_url, json={"appId": appid, "clientSecret": secret})
+            data = response.json()
+            value = data["access_token"]
+            expires_in = float(data["expires_in"])
+        except (httpx.HTTPError, ValueError, KeyError, TypeError) as e:
+            raise ApiProxyError(f"获取access_token失败: {e}", RESULT_TOKEN)
+        token = AccessToken(appid, value, time.monotonic() + expires_in)
+        self._tokens[secret] = token
+        # 到期前留出refresh_before秒的余量（有效期过短时在有效期过半时刷新）
+        lead = expires_in - self.refresh_before
+        self._schedule_refresh(secret, lead if lead > 0 else expires_in / 2)
+        logger.debug("已刷新access_token: appid=%s 有效期 %.0f 秒", appid, expires_in)
+        return token
+
+    def _schedule_refresh(self, secret: str, delay: float):
+        timer = self._timers.pop(secret, None)
+        if timer is not None:
+            timer.cancel()
+        self._timers[secret] = asyncio.get_running_loop().call_later(delay, self._refresh_due, secret)
+
+    def _refresh_due(self, secret: str):
+        """定时器到期：当前token在有效期内被使用过时后台续期，失败时在过期前重试"""
+        self._timers.pop(secret, None)
+        cached = self._tokens.get(secret)
+        if cached is None or not cached.used:
+            return
+        future = self._refresh(secret, cached.appid)
+
+        def retry(_):
+            if future.cancelled() or future.exception() is None:
+                return
+            remaining = cached.expires_at - time.monotonic()
+            if self._tokens.get(secret) is cached and remaining > REFRESH_RETRY:
+                self._schedule_refresh(secret, REFRESH_RETRY)
+
+        future.add_done_callback(retry)
+
+    def _refresh(self, secret: str, appid: str) -> asyncio.Future:
+        """同一机器人同时只有一次刷新，其余调用等待同一结果"""
+        key = (secret, appid)
+        future = self._refreshing.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch_token(secret, appid))
+            self._refreshing[key] = future
+
+            def done(_):
+                self._refreshing.pop(key, None)
+                if not future.cancelled() and future.exception() is not None:
+                    logger.warning("获取access_token失败: appid=%s - %s", appid, future.exception())
+
+            future.add_done_callback(done)
+        return future
+
+    async def token(self, secret: str, appid: str) -> str:
+        """获取access_token：有效期充足时直接返回缓存，即将过期时后台刷新并返回当前值"""
+        cached = self._tokens.get(secret)
+        if cached is not None and cached.appid == appid:
+            cached.used = True
+            remaining = cached.expires_at - time.monotonic()
+            if remaining > self.refresh_before:
+                return cached.value
+            if remaining > 0:
+                # 旧值在过期前仍然有效，刷新失败时下次调用重试
+                self._refresh(secret, appid)
+                return cached.value
+        # 调用方被取消时不影响其他等待同一刷新的请求
+        token = await asyncio.shield(self._refresh(secret, appid))
+        token.used = True
+        return token.value
+
+    def invalidate(self, secret: str, value: str):
+        cached = self._tokens.get(secret)
+        if cached is not None and cached.value == value:
+            del self._tokens[secret]
+            timer = self._timers.pop(secret, None)
+            if timer is not None:
+                timer.cancel()
+
+    # ------------------------------------------------------------ 接口调用
+
+    def _semaphore(self, secret: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(secret)
+        if semaphore is None:
+            semaphore = self._semaphores[secret] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    async def call(self, secret: str, appid: str, method: str, path: str, body=None,
+                   headers: Optional[dict] = None) -> Tuple[int, str, bytes]:
+        """以机器人身份调用开放平台接口，返回(状态码, Content-Type, 响应体)"""
+        import httpx
+        method = str(method or "GET").upper()
+        if method not in ALLOWED_METHODS:
+            raise ApiProxyError(f"不支持的方法: {method}", RESULT_REJECTED)
+        # 只接受开放平台的相对路径，避免代理被用于访问其他地址
+        if not isinstance(path, str) or not path.startswith("/") or path.startswith("//"):
+            raise ApiProxyError("path须为以/开头的相对路径", RESULT_REJECTED)
+        request_headers = {name: str(value) for name, value in (headers or {}).items()
+                           if str(name).lower() in FORWARDED_HEADERS}
+        content = None
+        if body is not None:
+            content = body.encode() if isinstance(body, str) else json.dumps(body, ensure_ascii=False).encode()
+            request_headers.setdefault("Content-Type", "application/json")
+
+        semaphore = self._semaphore(secret)
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise ApiProxyError("并发请求过多", RESULT_REJECTED)
+        try:
+            for attempt in range(2):
+                access_token = await self.token(secret, appid)
+                request_headers["Authorization"] = f"QQBot {access_token}"
+                request_headers["X-Union-Appid"] = appid
+                try:
+                    response = await self.client(secret).request(
+                        method, self.base_url + path, content=content, headers=request_headers, timeout=self.timeout)
+                except httpx.HTTPError as e:
+                    raise ApiProxyError(f"请求失败: {e.__class__.__name__} {e}")
+                # access_token被提前作废时重新获取一次
+                if response.status_code == 401 and attempt == 0:
+                    self.invalidate(secret, access_token)
+                    continue
+                return response.status_code, response.headers.get("content-type", ""), response.content
+        finally:
+            semaphore.release()
+
+    async def handle(self, conn, message: dict):
+        """处理客户端的接口调用帧，应答以控制帧推送（与请求的id对应）"""
+        request_id = message.get("id")
+        appid = str(message.get("appid") or self.appids.get(conn.secret) or "")
+        started = time.perf_counter()
+        try:
+            if not appid:
+                raise ApiProxyError("未知的appid：请在请求或连接参数中提供appid", RESULT_REJECTED)
+            status, content_type, content = await self.call(
+                conn.secret, appid, message.get("method"), message.get("path"),
+                message.get("body"), message.get("headers"))
+            frame = response_frame(request_id, status, content_type, content)
+            result = RESULT_OK
+        except ApiProxyError as e:
+            frame = error_frame(request_id, str(e))
+            result = e.result
+        STAGE_API.observe(time.perf_counter() - started)
+        self.results[result] += 1
+        conn.send_control(frame)
+
+    def submit(self, conn, message: dict):
+        """在后台执行接口调用，不阻塞连接的读取循环"""
+        task = asyncio.ensure_future(self.handle(conn, message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def close(self):
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        for task in list(self._tasks):
+            task.cancel()
+        clients, self._clients = self._clients, []
+        for client in clients:
+            await client.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "http2": self.http2,
+            "in_flight": len(self._tasks),
+            "bots": len(self._tokens),
+            "token_fetches": self.token_fetches,
+            "results": dict(self.results),
+        }
+
@@ -0,0 +1,354 @@
+# 多进程工作模式：SO_REUSEPORT 监听 + Unix域套接字跨进程路由
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import signal
+import socket
+import struct
+import tempfile
+import time
+from collections import deque
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("QQwebhook")
+
+ENV_WORKER_ID = "QQWEBHOOK_WORKER_ID"
+ENV_WORKER_COUNT = "QQWEBHOOK_WORKER_COUNT"
+ENV_RUN_DIR = "QQWEBHOOK_RUN_DIR"
+# 启动时端口仍由旧进程监听（平滑重启交接中），工作进程据此开启启动过渡期
+ENV_HANDOVER = "QQWEBHOOK_HANDOVER"
+
+# 路由协议：请求头 = 操作码(u8) + 密钥长度(u16) + 负载长度(u32)，响应 = 长度(u32) + 负载
+REQUEST_HEADER = struct.Struct("<BHI")
+RESPONSE_HEADER = struct.Struct("<I")
+RECORD_HEADER = struct.Struct("<QI")
+OP_DELIVER = 1      # 投递给本进程持有的连接
+OP_SPOOL = 2        # 写入本进程负责的离线缓存
+OP_FETCH = 3        # 读取离线缓存（负载为起始偏移量，0表示从消费游标开始）
+OP_COMMIT = 4       # 提交离线缓存消费游标
+OP_DEDUP = 5        # 事件去重检查（负载首字节为1检查并记录，为0撤销记录）
+OP_EVICT = 6        # 关闭本进程持有的该密钥连接（replace模式下连接迁移到其他进程）
+
+# 归属信息缓存时长（秒）
+OWNER_CACHE_TTL = 1.0
+FORWARD_TIMEOUT = 5.0
+
+
+def supports_reuse_port() -> bool:
+    """当前平台是否支持SO_REUSEPORT与Unix域套接字"""
+    return hasattr(socket, "SO_REUSEPORT") and hasattr(socket, "AF_UNIX")
+
+
+def port_in_use(host: str, port: int, timeout: float = 0.5) -> bool:
+    """端口上是否已有进程在监听（绑定前调用，用于判断是否与旧进程交接）"""
+    if host in ("", "0.0.0.0"):
+        host = "127.0.0.1"
+    elif host == "::":
+        host = "::1"
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def bind_reuse_port(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    """创建开启SO_REUSEPORT的监听套接字，多个进程可绑定同一端口"""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _secret_key(secret: str) -> str:
+    return hashlib.sha256(secret.encode()).hexdigest()[:24]
+
+
+class PeerLink:
+    """到其他工作进程的持久连接，请求按顺序流水线发送"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._pending: deque = deque()
+        self._connecting = asyncio.Lock()
+        self._reader_task: Optional[asyncio.Task] = None
+
+    async def _ensure(self):
+        if self._writer is not None and not self._writer.is_closing():
+            return
+        async with self._connecting:
+            if self._writer is not None and not self._writer.is_closing():
+                return
+            self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+            self._reader_task = asyncio.create_task(self._read_responses(self._reader))
+
+    async def _read_responses(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                (length,) = RESPONSE_HEADER.unpack(await reader.readexactly(RESPONSE_HEADER.size))
+                payload = await reader.readexactly(length) if length else b""
+                future = self._pending.popleft()
+                if not future.done():
+                    future.set_result(payload)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            pass
+        finally:
+            self._fail_pending()
+
+    def _fail_pending(self):
+        while self._pending:
+            future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(ConnectionError(f"路由连接断开: {self.path}"))
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def request(self, op: int, secret: str, body: bytes = b"") -> bytes:
+        await self._ensure()
+        secret_bytes = secret.encode()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(future)
+        self._writer.write(REQUEST_HEADER.pack(op, len(secret_bytes), len(body)) + secret_bytes)
+        self._writer.write(body)
+        return await asyncio.wait_for(future, FORWARD_TIMEOUT)
+
+    def close(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        self._fail_pending()
+
+
+class ClusterRouter:
+    """工作进程间的事件路由与连接归属跟踪
+
+    每个工作进程监听 run_dir/worker-<id>.sock；持有某密钥连接的进程在
+    run_dir/owners/<密钥摘要>/ 下创建以自身编号命名的归属文件，连接迁移到
+    其他进程时新旧文件短暂共存，投递失败时会尝试下一个归属进程。
+    离线缓存由密钥摘要决定的固定进程负责，避免多进程写同一日志。
+    """
+
+    def __init__(self, worker_id: int, worker_count: int, run_dir: str):
+        self.worker_id = worker_id
+        self.worker_count = worker_count
+        self.run_dir = Path(run_dir)
+        self.owners_dir = self.run_dir / "owners"
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._links: Dict[int, PeerLink] = {}
+        self._owner_cache: Dict[str, Tuple[float, List[int]]] = {}
+        self.handlers: Dict[int, Callable[[str, bytes], Awaitable[bytes]]] = {}
+
+    @classmethod
+    def from_env(cls) -> Optional["ClusterRouter"]:
+        """在多进程模式的工作进程中创建路由器，单进程模式返回None"""
+        worker_id = os.environ.get(ENV_WORKER_ID)
+        run_dir = os.environ.get(ENV_RUN_DIR)
+        if worker_id is None or not run_dir:
+            return None
+        return cls(int(worker_id), int(os.environ.get(ENV_WORKER_COUNT, "1")), run_dir)
+
+    def socket_path(self, worker_id: int) -> str:
+        return str(self.run_dir / f"worker-{worker_id}.sock")
+
+    def home_worker(self, secret: str) -> int:
+        """负责该密钥离线缓存的工作进程"""
+        return int(_secret_key(secret), 16) % self.worker_count
+
+    def is_home(self, secret: str) -> bool:
+        return self.home_worker(secret) == self.worker_id
+
+    async def start(self):
+        path = self.socket_path(self.worker_id)
+        if os.path.exists(path):
+            os.unlink(path)
+        self.owners_dir.mkdir(parents=True, exist_ok=True)
+        self._server = await asyncio.start_unix_server(self._serve, path=path)
+        logger.info("工作进程 #%d 路由已启动: %s", self.worker_id, path)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for link in self._links.values():
+            link.close()
+        self._links.clear()
+        release_worker(self.run_dir, self.worker_id)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理其他工作进程的路由请求"""
+        try:
+            while True:
+                op, secret_len, body_len = REQUEST_HEADER.unpack(await reader.readexactly(REQUEST_HEADER.size))
+                secret = (await reader.readexactly(secret_len)).decode()
+                body = await reader.readexactly(body_len) if body_len else b""
+                handler = self.handlers.get(op)
+                try:
+                    result = await handler(secret, body) if handler else b""
+                except Exception as e:
+                    logger.error("路由请求处理失败: %s - %s", secret, e)
+                    result = b""
+                writer.write(RESPONSE_HEADER.pack(len(result)) + result)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _link(self, worker_id: int) -> PeerLink:
+        link = self._links.get(worker_id)
+        if link is None:
+            link = PeerLink(self.socket_path(worker_id))
+            self._links[worker_id] = link
+        return link
+
+    async def call(self, worker_id: int, op: int, secret: str, body: bytes = b"") -> bytes:
+        return await self._link(worker_id).request(op, secret, body)
+
+    # ---- 连接归属 ----
+
+    def claim(self, secret: str):
+        """声明本进程持有该密钥的连接"""
+        directory = self.owners_dir / _secret_key(secret)
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / str(self.worker_id)).touch()
+
+    def release(self, secret: str):
+        """本进程已不再持有该密钥的连接"""
+        try:
+            (self.owners_dir / _secret_key(secret) / str(self.worker_id)).unlink()
+        except FileNotFoundError:
+            pass
+
+    def owners(self, secret: str) -> List[int]:
+        """查询持有该密钥连接的其他工作进程（短时缓存）"""
+        now = time.monotonic()
+        cached = self._owner_cache.get(secret)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        try:
+            names = os.listdir(self.owners_dir / _secret_key(secret))
+        except FileNotFoundError:
+            names = []
+        owners = [int(name) for name in names if name.isdigit() and int(name) != self.worker_id]
+        # 最近声明的进程优先
+        owners.sort(key=lambda w: -self._mtime(secret, w))
+        self._owner_cache[secret] = (now + OWNER_CACHE_TTL, owners)
+        return owners
+
+    def _mtime(self, secret: str, worker_id: int) -> float:
+        try:
+            return (self.owners_dir / _secret_key(secret) / str(worker_id)).stat().st_mtime
+        except FileNotFoundError:
+            return 0.0
+
+    async def forward(self, secret: str, body: bytes) -> bool:
+        """将事件转发给持有连接的工作进程，送达时返回True"""
+        for worker_id in self.owners(secret):
+            try:
+                if await self.call(worker_id, OP_DELIVER, secret, body) == b"\x01":
+                    return True
+            except (ConnectionError, OSError, asyncio.TimeoutError) as e:
+                logger.warning("转发到工作进程 #%d 失败: %s", worker_id, e)
+            self._owner_cache.pop(secret, None)
+        return False
+
+    async def evict(self, secret: str) -> int:
+        """通知其他持有该密钥连接的工作进程关闭旧连接，返回已关闭的进程数"""
+        self._owner_cache.pop(secret, None)
+        closed = 0
+        for worker_id in self.owners(secret):
+            try:
+                if await self.call(worker_id, OP_EVICT, secret) == b"\x01":
+                    closed += 1
+            except (ConnectionError, OSError, asyncio.TimeoutError) as e:
+                logger.warning("通知工作进程 #%d 关闭旧连接失败: %s", worker_id, e)
+        return closed
+
+
+def encode_records(records: List[Tuple[int, bytes]]) -> bytes:
+    return b"".join(RECORD_HEADER.pack(offset, len(body)) + body for offset, body in records)
+
+
+def decode_records(payload: bytes) -> List[Tuple[int, bytes]]:
+    records = []
+    position = 0
+    while position < len(payload):
+        offset, length = RECORD_HEADER.unpack_from(payload, position)
+        position += RECORD_HEADER.size
+        records.append((offset, payload[position:position + length]))
+        position += length
+    return records
+
+
+def release_worker(run_dir: Path, worker_id: int):
+    """清理工作进程遗留的归属文件与套接字"""
+    owners_dir = Path(run_dir) / "owners"
+    if owners_dir.exists():
+        for directory in owners_dir.iterdir():
+            try:
+                (directory / str(worker_id)).unlink()
+            except FileNotFoundError:
+                pass
+    try:
+        os.unlink(Path(run_dir) / f"worker-{worker_id}.sock")
+    except FileNotFoundError:
+        pass
+
+
+def run_supervisor(target: Callable[[int], None], workers: int):
+    """启动并守护多个工作进程，工作进程异常退出时自动重启"""
+    import multiprocessing
+
+    run_dir = tempfile.mkdtemp(prefix="qqwebhook-")
+    os.environ[ENV_RUN_DIR] = run_dir
+    os.environ[ENV_WORKER_COUNT] = str(workers)
+    ctx = multiprocessing.get_context("spawn")
+    processes: Dict[int, "multiprocessing.Process"] = {}
+    stopping = False
+
+    def spawn(worker_id: int):
+        os.environ[ENV_WORKER_ID] = str(worker_id)
+        process = ctx.Process(target=target, args=(worker_id,), name=f"qqwebhook-worker-{worker_id}")
+        process.start()
+        processes[worker_id] = process
+        logger.info("工作进程 #%d 已启动 (pid=%d)", worker_id, process.pid)
+
+    def handle_signal(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in processes.values():
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    for worker_id in range(workers):
+        spawn(worker_id)
+    os.environ.pop(ENV_WORKER_ID, None)
+    # 仅首次启动的工作进程与旧进程交接，异常退出后重启的工作进程不再等待
+    os.environ.pop(ENV_HANDOVER, None)
+
+    try:
+        while not stopping:
+            time.sleep(0.5)
+            for worker_id, process in list(processes.items()):
+                if process.is_alive() or stopping:
+                    continue
+                logger.error("工作进程 #%d 异常退出 (code=%s)，正在重启", worker_id, process.exitcode)
+                release_worker(Path(run_dir), worker_id)
+                time.sleep(1)
+                spawn(worker_id)
+                os.environ.pop(ENV_WORKER_ID, None)
+    finally:
+        for process in processes.values():
+            process.join()
+        shutil.rmtree(run_dir, ignore_errors=True)
@@ -1,12 +1,18 @@
+import asyncio
+import hashlib
+import marshal
 import os
+import select
+import struct
 import sys
+import threading
 import time
 from pathlib import Path
-from typing import Any, Optional, Union
+from types import MappingProxyType
+from typing import Any, Callable, Optional, Union
 import logging
 
 from pydantic import BaseModel, ValidationError
-from ruamel.yaml import YAML
 
 from src.function import configure_logger
 
@@ -24,9 +30,19 @@ class YAMLHandler:
 
         :param preserve_comments: 是否保留注释（需安装ruamel.yaml ）
         """
-        self.parser = YAML()
-        if preserve_comments and 'ruamel' not in str(type(self.parser)):
-            raise YAMLHandlerException("Comment preservation requires ruamel.yaml")
+        self.preserve_comments = preserve_comments
+        self._parser = None
+
+    @property
+    def parser(self):
+        """YAML解析器（首次使用时导入ruamel.yaml，命中配置缓存的启动过程无需加载）"""
+        if self._parser is None:
+            from ruamel.yaml import YAML
+            parser = YAML()
+            if self.preserve_comments and 'ruamel' not in str(type(parser)):
+                raise YAMLHandlerException("Comment preservation requires ruamel.yaml")
+            self._parser = parser
+        return self._parser
 
     def load(self, file_path: str) -> dict:
         """从文件加载YAML内容"""
@@ -84,10 +100,162 @@ class YAMLHandler:
             raise YAMLHandlerException("仅支持YAML格式文件")
 
 
+# 缺失配置项标记（区分值为None的配置项）
+_MISSING = object()
+# 配置缓存格式版本（快照结构变化时递增）
+CACHE_VERSION = 2
+# 配置解析缓存目录（设为空或off时关闭缓存）
+ENV_CACHE_DIR = "QQWEBHOOK_CACHE_DIR"
+
+
+def _cache_dir() -> Optional[Path]:
+    """配置解析缓存目录：环境变量指定，否则为用户缓存目录下的qqwebhook；关闭时返回None"""
+    value = os.environ.get(ENV_CACHE_DIR)
+    if value is not None:
+        value = value.strip()
+        if value.lower() in ("", "0", "off", "false", "no"):
+            return None
+        return Path(value).expanduser()
+    base = os.environ.get("LOCALAPPDATA" if sys.platform == "win32" else "XDG_CACHE_HOME")
+    try:
+        return Path(base) / "qqwebhook" if base else Path.home() / ".cache" / "qqwebhook"
+    except RuntimeError:
+        return None
+
+
+def _to_plain(value: Any) -> Any:
+    """将ruamel的注释映射/序列与标量子类（ScalarFloat等）转换为普通dict/list与内置类型"""
+    if isinstance(value, dict):
+        return {_to_plain(k): _to_plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_to_plain(v) for v in value]
+    if isinstance(value, bool):
+        return value
+    for base in (str, int, float):
+        if isinstance(value, base) and type(value) is not base:
+            return base(value)
+    return value
+
+
+class ConfigSnapshot:
+    """不可变的配置快照：点分隔路径预先展开，O(1)查询"""
+    __slots__ = ("values", "stat")
+
+    def __init__(self, data: dict, stat: tuple = None):
+        flat = {}
+        self._flatten(_to_plain(data or {}), "", flat)
+        self.values = MappingProxyType(flat)
+        self.stat = stat
+
+    @classmethod
+    def _flatten(cls, data: dict, prefix: str, out: dict):
+        for key, value in data.items():
+            path = f"{prefix}{key}"
+            out[path] = value
+            if isinstance(value, dict):
+                cls._flatten(value, f"{path}.", out)
+
+    def get(self, key_path: str, default: Any = _MISSING) -> Any:
+        return self.values.get(key_path, default)
+
+
+class ConfigWatcher(threading.Thread):
+    """配置文件监视线程：Linux下使用inotify，其他平台轮询修改时间"""
+
+    # inotify事件：写入关闭、移入（原子替换）、创建
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_EVENT = struct.Struct("iIII")
+
+    def __init__(self, manager: "ConfigManager", poll_interval: float = 2.0):
+        super().__init__(name="config-watcher", daemon=True)
+        self.manager = manager
+        self.poll_interval = poll_interval
+        self._stop_event = threading.Event()
+        # 在启动线程前注册监视，避免遗漏启动期间的修改
+        self._fd = self._inotify_open()
+        # 停止时写入唤醒管道，inotify等待立即返回
+        self._wake = os.pipe() if self._fd is not None else None
+
+    def stop(self, timeout: Optional[float] = 2.0):
+        """停止监视并等待线程退出（线程退出时关闭inotify描述符）"""
+        self._stop_event.set()
+        if self._wake is not None:
+            try:
+                os.write(self._wake[1], b"\0")
+            except OSError:
+                pass
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
+
+    def run(self):
+        fd = self._fd
+        try:
+            if fd is not None:
+                self._run_inotify(fd)
+            else:
+                self._run_polling()
+        finally:
+            if fd is not None:
+                os.close(fd)
+                for wake_fd in self._wake:
+                    os.close(wake_fd)
+
+    def _inotify_open(self) -> Optional[int]:
+        """通过ctypes初始化inotify，不可用时返回None"""
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            import ctypes
+            import ctypes.util
+            # 解释器进程已链接libc，直接查找符号，避免find_library执行外部命令
+            libc = ctypes.CDLL(None, use_errno=True)
+            if not hasattr(libc, "inotify_init1"):
+                libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+            if fd < 0:
+                return None
+            directory = os.path.dirname(os.path.abspath(self.manager._config_path))
+            mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+            if libc.inotify_add_watch(fd, directory.encode(), mask) < 0:
+                os.close(fd)
+                return None
+            return fd
+        except (OSError, AttributeError):
+            return None
+
+    def _run_inotify(self, fd: int):
+        target = os.path.basename(self.manager._config_path).encode()
+        while not self._stop_event.is_set():
+            readable, _, _ = select.select([fd, self._wake[0]], [], [], 1.0)
+            if fd not in readable:
+                continue
+            try:
+                data = os.read(fd, 65536)
+            except BlockingIOError:
+                continue
+            changed = False
+            position = 0
+            while position + self.IN_EVENT.size <= len(data):
+                _, _, _, length = self.IN_EVENT.unpack_from(data, position)
+                name = data[position + self.IN_EVENT.size:position + self.IN_EVENT.size + length].rstrip(b"\0")
+                position += self.IN_EVENT.size + length
+                if name == target:
+                    changed = True
+            if changed:
+                # 合并编辑器短时间内的多次写入
+                time.sleep(0.05)
+                self.manager.reload()
+
+    def _run_polling(self):
+        while not self._stop_event.wait(self.poll_interval):
+            self.manager.reload()
+
+
 class ConfigManager:
     _instance = None
-    _config_cache = None
-    _last_modified = 0
+    _snapshot: Optional[ConfigSnapshot] = None
     _config_path = None
 
     def __new__(cls):
@@ -95,6 +263,10 @@ class ConfigManager:
             cls._instance = super().__new__(cls)
             cls._instance._yaml_handler = YAMLHandler(preserve_comments=True)
             cls._instance._config_path = cls._instance._find_config_file()
+            cls._instance._subscribers = {}
+            cls._instance._reload_lock = threading.Lock()
+            cls._instance._watcher = None
+            cls._instance._loop = None
             # logger.info(f"配置文件路径: {cls._instance._config_path}")
         return cls._instance
 
@@ -120,33 +292,175 @@ class ConfigManager:
 
         raise YAMLHandlerException(f"未找到配置文件，请确认以下文件存在: {', '.join(config_files)}")
 
-    def _load_config(self) -> dict:
-        """带缓存验证的配置加载"""
+    def _file_stat(self) -> tuple:
+        st = os.stat(self._config_path)
+        return st.st_mtime_ns, st.st_size
+
+    def _cache_path(self) -> Optional[Path]:
+        """缓存文件：按配置文件绝对路径区分，位于仅当前用户可访问的缓存目录中；目录不可用时返回None"""
+        directory = _cache_dir()
+        if directory is None:
+            return None
+        try:
+            directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+            if hasattr(os, "getuid"):
+                # 配置中可能包含密钥，缓存目录必须属于当前用户且不对其他用户开放
+                st = directory.stat()
+                if st.st_uid != os.getuid() or st.st_mode & 0o077:
+                    logger.debug(f"配置缓存目录权限不安全，跳过缓存: {directory}")
+                    return None
+        except OSError as e:
+            logger.debug(f"配置缓存目录不可用: {str(e)}")
+            return None
+        digest = hashlib.sha256(os.path.abspath(self._config_path).encode()).hexdigest()[:16]
+        return directory / f"config-{digest}.marshal"
+
+    def _read_cache(self, stat: tuple) -> Optional[dict]:
+        """读取解析结果缓存，配置文件的修改时间与大小一致时返回其内容"""
+        path = self._cache_path()
+        if path is None:
+            return None
         try:
-            current_mtime = os.path.getmtime(self._config_path)
-            if current_mtime > self._last_modified or not self._config_cache:
-                #logger.debug(f"正在重新加载配置文件: {self._config_path}")
+            with open(path, 'rb') as f:
+                cache = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if not isinstance(cache, tuple) or len(cache) != 4:
+            return None
+        version, config_path, cached_stat, data = cache
+        if version != CACHE_VERSION or config_path != os.path.abspath(self._config_path) or cached_stat != stat:
+            return None
+        return data if isinstance(data, dict) else None
+
+    def _write_cache(self, stat: tuple, data: dict):
+        """保存解析结果（marshal，键与值的类型原样保留），下次启动时跳过YAML解析；写入失败不影响运行"""
+        path = self._cache_path()
+        if path is None:
+            return
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            # 含有marshal不支持的类型（如YAML日期）时不缓存，保证缓存结果与解析结果一致
+            payload = marshal.dumps((CACHE_VERSION, os.path.abspath(self._config_path), tuple(stat), data))
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+            os.replace(temp_path, path)
+        except (OSError, ValueError) as e:
+            logger.debug(f"配置缓存写入失败: {str(e)}")
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+
+    def _load_config(self) -> ConfigSnapshot:
+        """读取配置文件并生成快照，文件未变化时使用解析结果缓存"""
+        try:
+            stat = self._file_stat()
+            data = self._read_cache(stat)
+            if data is None:
                 with open(self._config_path, 'r', encoding='utf-8') as f:
-                    self._config_cache = self._yaml_handler.parser.load(f) or {}
-                    self._last_modified = current_mtime
-            return self._config_cache
+                    data = _to_plain(self._yaml_handler.parser.load(f) or {})
+                self._write_cache(stat, data)
+            return ConfigSnapshot(data, stat)
         except Exception as e:
             logger.critical(f"配置加载失败: {str(e)}")
             raise YAMLHandlerException(f"配置加载失败: {str(e)}")
 
-    def get_config(self, key_path: str, default: Any = None, expected_type: type = None) -> Any:
-        """改进的类型转换逻辑"""
-        try:
-            config_data = self._load_config()
-            keys = key_path.split('.')
-            current = config_data
+    def snapshot(self) -> ConfigSnapshot:
+        """当前配置快照（首次调用时加载）"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._reload_lock:
+                if self._snapshot is None:
+                    self._snapshot = self._load_config()
+                snapshot = self._snapshot
+        return snapshot
+
+    def reload(self, force: bool = False):
+        """文件变化时重新加载，原子替换快照并通知订阅者"""
+        with self._reload_lock:
+            old = self._snapshot
+            try:
+                if not force and old is not None and old.stat == self._file_stat():
+                    return
+                new = self._load_config()
+            except (OSError, YAMLHandlerException) as e:
+                logger.error(f"配置重新加载失败，继续使用旧配置: {str(e)}")
+                return
+            self._snapshot = new
+        logger.info("配置已重新加载")
+        self._notify(old, new)
+
+    def _swap(self, data: dict):
+        """使用内存中的新数据直接替换快照（热更新写入后调用）"""
+        with self._reload_lock:
+            old = self._snapshot
+            new = ConfigSnapshot(data, self._file_stat())
+            self._snapshot = new
+        self._notify(old, new)
+
+    def _notify(self, old: Optional[ConfigSnapshot], new: ConfigSnapshot):
+        for key_path, callbacks in list(self._subscribers.items()):
+            old_value = old.get(key_path) if old is not None else _MISSING
+            new_value = new.get(key_path)
+            if old_value == new_value:
+                continue
+            if new_value is _MISSING:
+                # 配置项被删除：以None通知，订阅者按默认值处理
+                new_value = None
+            for callback in list(callbacks):
+                self._dispatch(key_path, callback, new_value)
+
+    def _dispatch(self, key_path: str, callback: Callable[[Any], None], value: Any):
+        """在事件循环线程中执行回调（回调会修改连接、队列等仅由事件循环访问的对象），未指定事件循环时直接调用"""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is not loop:
+                try:
+                    loop.call_soon_threadsafe(self._invoke, key_path, callback, value)
+                    return
+                except RuntimeError:
+                    # 事件循环已关闭（进程退出中），不再应用变更
+                    return
+        self._invoke(key_path, callback, value)
 
-            for key in keys:
-                if isinstance(current, dict) and key in current:
-                    current = current[key]
-                else:
-                    return self._handle_missing_key(default, expected_type, key_path)
+    @staticmethod
+    def _invoke(key_path: str, callback: Callable[[Any], None], value: Any):
+        try:
+            callback(value)
+        except Exception as e:
+            logger.error(f"配置变更回调失败 [{key_path}]: {str(e)}")
+
+    def subscribe(self, key_path: str, callback: Callable[[Any], None]):
+        """订阅配置项变更，回调以新值调用，配置项被删除时以None调用（启动监视时指定了事件循环则在该事件循环中执行）"""
+        self._subscribers.setdefault(key_path, []).append(callback)
+
+    def start_watcher(self, poll_interval: float = 2.0, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """启动后台配置监视线程，变更回调调度到loop执行"""
+        if loop is not None:
+            self._loop = loop
+        if self._watcher is None or not self._watcher.is_alive():
+            self.snapshot()
+            self._watcher = ConfigWatcher(self, poll_interval)
+            self._watcher.start()
+
+    def stop_watcher(self):
+        """停止配置监视线程，不再调度变更回调"""
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+        self._loop = None
 
+    def get_config(self, key_path: str, default: Any = None, expected_type: type = None) -> Any:
+        """从快照中O(1)读取配置项，无文件系统调用"""
+        try:
+            current = self.snapshot().get(key_path)
+            if current is _MISSING:
+                return self._handle_missing_key(default, expected_type, key_path)
             return self._cast_value(current, expected_type) if expected_type else current
         except Exception as e:
             logger.error(f"配置获取失败 [{key_path}]: {str(e)}")
@@ -181,8 +495,23 @@ def get_config(key_path: str, default: Any = None, expected_type: type = None) -
     return ConfigManager().get_config(key_path, default, expected_type)
 
 
+def subscribe_config(key_path: str, callback: Callable[[Any], None]):
+    """订阅配置项变更"""
+    ConfigManager().subscribe(key_path, callback)
+
+
+def start_config_watcher(poll_interval: float = 2.0, loop: Optional[asyncio.AbstractEventLoop] = None):
+    """启动配置文件监视（inotify或轮询），变更后自动替换快照，订阅回调在loop中执行"""
+    ConfigManager().start_watcher(poll_interval, loop)
+
+
+def stop_config_watcher():
+    """停止配置文件监视（应用退出时调用，释放监视线程与inotify描述符）"""
+    ConfigManager().stop_watcher()
+
+
 def hot_update(key_path: str, value: Any):
-    """改进的热更新方法"""
+    """改进的热更新方法：写入文件后直接替换快照，无需重新解析"""
     try:
         manager = ConfigManager()
         current_value = manager.get_config(key_path)
@@ -207,11 +536,10 @@ def hot_update(key_path: str, value: Any):
         # 原子操作替换文件
         os.replace(backup_path, manager._config_path)
 
-        # 强制刷新缓存
-        manager._config_cache = None
-        manager._last_modified = 0
+        # 直接替换快照并通知订阅者
+        manager._swap(data)
 
         logger.info(f"配置热更新成功: {key_path} = {value}")
     except Exception as e:
         logger.error(f"热更新失败: {str(e)}")
-        raise
\ No newline at end of file
+        raise
@@ -0,0 +1,307 @@
+# WebSocket连接及其出站队列
+import asyncio
+import logging
+from collections import deque
+from time import monotonic, perf_counter
+from typing import Callable, FrozenSet, Optional
+
+from fastapi import WebSocket
+
+from src.lanes import LaneQueue, PriorityPolicy
+from src.metrics import SENDS_DROPPED, SENDS_FAILED, SENDS_OK, STAGE_SEND
+
+logger = logging.getLogger("QQwebhook")
+
+# 队列溢出策略
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_NEWEST = "drop_newest"
+OVERFLOW_DISCONNECT = "disconnect"
+OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_DISCONNECT)
+
+# 队列溢出时断开连接使用的关闭码（1013: Try Again Later）
+CLOSE_TRY_AGAIN_LATER = 1013
+# 服务重启时关闭连接使用的关闭码（1012: Service Restart）
+CLOSE_SERVICE_RESTART = 1012
+# 写任务异常退出时关闭连接使用的关闭码（1011: Internal Error）
+CLOSE_INTERNAL_ERROR = 1011
+# 排空时检查出站队列的间隔（秒）
+FLUSH_POLL_INTERVAL = 0.01
+
+# 批量推送上限
+MAX_BATCH_SIZE = 1000
+MAX_BATCH_LINGER = 1.0
+
+
+class ClientConnection:
+    """已注册的WebSocket连接，持有有界出站队列并由独立的写任务推送
+
+    使用__slots__并按需创建等待对象，大量空闲连接时每个连接只占用少量内存。
+    """
+    __slots__ = (
+        "websocket", "secret", "binary", "max_size", "overflow", "on_undelivered", "on_failed",
+        "batch_size", "batch_linger", "events", "queue", "lanes", "control", "trace",
+        "high_water", "sent", "frames", "dropped", "filtered", "received",
+        "connected_at", "last_activity", "pinged_at", "ping_answered", "closed", "_waiter", "_writer",
+    )
+
+    def __init__(self, websocket: WebSocket, secret: str, binary: bool = False,
+                 max_size: int = 1000, overflow: str = OVERFLOW_DROP_OLDEST,
+                 on_undelivered: Optional[Callable[[str, bytes], object]] = None,
+                 priority: Optional[PriorityPolicy] = None,
+                 on_failed: Optional[Callable[["ClientConnection"], object]] = None):
+        self.websocket = websocket
+        self.secret = secret
+        self.binary = binary
+        self.max_size = max(int(max_size), 1)
+        self.overflow = overflow if overflow in OVERFLOW_POLICIES else OVERFLOW_DROP_OLDEST
+        self.on_undelivered = on_undelivered
+        # 写任务异常退出时调用（从注册表注销连接）
+        self.on_failed = on_failed
+        self.batch_size = 1
+        self.batch_linger = 0.0
+        self.events: Optional[FrozenSet[str]] = None
+        # 开启优先级时出站队列按通道拆分（lanes与queue为同一对象），否则为普通deque
+        self.lanes = LaneQueue(priority) if priority is not None else None
+        self.queue = self.lanes if self.lanes is not None else deque()
+        # 信封模式的追踪状态（src.tracing.TraceSession），未开启时为None
+        self.trace = None
+        # 控制帧很少，使用列表（空deque本身即占用一个数据块）
+        self.control = []
+        self.high_water = 0
+        self.sent = 0
+        self.frames = 0
+        self.dropped = 0
+        self.filtered = 0
+        self.received = 0
+        self.connected_at = self.last_activity = monotonic()
+        # 已发送保活ping、尚未收到任何消息时为发送时间
+        self.pinged_at: Optional[float] = None
+        # 客户端回复过应用层ping（只接收事件的客户端从不回复，由协议层ping检测失效）
+        self.ping_answered = False
+        self.closed = False
+        self._waiter: Optional[asyncio.Future] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    def start(self):
+        """启动写任务"""
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._run())
+
+    def configure_batch(self, max_size: int, linger: float):
+        """协商批量推送：max_size<=1时恢复逐条推送"""
+        self.batch_size = min(max(int(max_size), 1), MAX_BATCH_SIZE)
+        self.batch_linger = min(max(float(linger), 0.0), MAX_BATCH_LINGER) if self.batch_size > 1 else 0.0
+
+    def accepts(self, event_type: Optional[str]) -> bool:
+        """是否订阅该类型的事件（未设置订阅或非分发事件时接收）"""
+        return self.events is None or event_type is None or event_type in self.events
+
+    def touch(self):
+        """收到客户端消息：刷新最后活动时间"""
+        self.last_activity = monotonic()
+        self.received += 1
+
+    def _wake(self):
+        """唤醒写任务（写任务未在等待时无操作，等待前会先检查队列）"""
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def _wait(self):
+        self._waiter = asyncio.get_running_loop().create_future()
+        try:
+            await self._waiter
+        finally:
+            self._waiter = None
+
+    def send_control(self, frame: bytes):
+        """控制帧（握手应答等）优先于事件发送，不参与批量合并"""
+        if self.closed:
+            return
+        self.control.append(frame)
+        self._wake()
+
+    def enqueue(self, body: bytes, received: Optional[float] = None, lane: Optional[int] = None) -> bool:
+        """事件入队，不等待网络发送；连接已关闭或按策略拒绝时返回False
+
+        received为收到Webhook的时间（perf_counter），仅信封模式使用，未提供时以入队时间代替，
+        与事件一同以 (body, received) 元组入队；lane为优先级通道序号，开启优先级且未指定时按事件类型分类。
+        """
+        if self.closed:
+            return False
+        if len(self.queue) >= self.max_size:
+            if self.overflow == OVERFLOW_DROP_NEWEST:
+                self.dropped += 1
+                SENDS_DROPPED.inc()
+                return False
+            if self.overflow == OVERFLOW_DISCONNECT:
+                logger.warning("推送队列溢出，断开连接: %s", self.secret)
+                asyncio.ensure_future(self.close(CLOSE_TRY_AGAIN_LATER))
+                return False
+            # 按通道拆分时丢弃最低优先级通道中最早的事件
+            if self.lanes is None:
+                self.queue.popleft()
+            else:
+                self.lanes.drop()
+            self.dropped += 1
+            SENDS_DROPPED.inc()
+        item = body if self.trace is None else (body, received if received is not None else perf_counter())
+        if self.lanes is not None:
+            self.lanes.append(item, lane)
+        else:
+            self.queue.append(item)
+        depth = len(self.queue)
+        if depth > self.high_water:
+            self.high_water = depth
+        # 批量模式下仅在批次开始与攒满时唤醒写任务，其余由等待时间触发
+        if self.batch_size <= 1 or depth == 1 or depth >= self.batch_size:
+            self._wake()
+        return True
+
+    async def send(self, body: bytes):
+        """按客户端偏好以二进制或文本帧原样推送请求体"""
+        if self.binary:
+            await self.websocket.send({"type": "websocket.send", "bytes": body})
+        else:
+            await self.websocket.send({"type": "websocket.send", "text": body.decode('utf-8')})
+
+    async def _linger(self):
+        """批量模式：等待批次攒满或达到最长等待时间"""
+        handle = asyncio.get_running_loop().call_later(self.batch_linger, self._wake)
+        try:
+            await self._wait()
+        finally:
+            handle.cancel()
+
+    def _take_batch(self) -> list:
+        queue = self.queue
+        return [queue.popleft() for _ in range(min(len(queue), self.batch_size))]
+
+    def _drop_undecodable(self, batch) -> list:
+        """文本帧连接：逐条丢弃不是有效UTF-8的事件，不影响同批次的其他事件与写任务"""
+        valid = []
+        for item in batch:
+            body = item if self.trace is None else item[0]
+            if not body.isascii():
+                try:
+                    body.decode("utf-8")
+                except UnicodeDecodeError:
+                    self.dropped += 1
+                    SENDS_DROPPED.inc()
+                    logger.warning("事件不是有效的UTF-8，无法以文本帧推送，已丢弃: %s", self.secret)
+                    continue
+            valid.append(item)
+        return valid
+
+    async def _run(self):
+        """写任务：依次取出队列中的事件推送给客户端"""
+        batch = ()
+        try:
+            while True:
+                while not self.queue and not self.control:
+                    await self._wait()
+                while self.control:
+                    await self.send(self.control.pop(0))
+                if not self.queue:
+                    continue
+                if self.batch_size > 1:
+                    if len(self.queue) < self.batch_size and self.batch_linger:
+                        await self._linger()
+                    batch = self._take_batch()
+                    if not self.binary:
+                        batch = self._drop_undecodable(batch)
+                    if not batch:
+                        continue
+                    if self.trace is not None:
+                        frame = self.trace.envelope(batch, True)
+                    else:
+                        # 合并为一个JSON数组帧，事件原始字节直接拼接
+                        frame = b"[" + b",".join(batch) + b"]"
+                else:
+                    batch = (self.queue.popleft(),)
+                    if not self.binary:
+                        batch = self._drop_undecodable(batch)
+                        if not batch:
+                            continue
+                    frame = batch[0] if self.trace is None else self.trace.envelope(batch, False)
+                started = perf_counter()
+                await self.send(frame)
+                STAGE_SEND.observe(perf_counter() - started)
+                SENDS_OK.inc(len(batch))
+                self.sent += len(batch)
+                self.frames += 1
+                batch = ()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            SENDS_FAILED.inc(len(batch) or 1)
+            logger.error("推送失败: %s - %s", self.secret, e)
+            self.closed = True
+            # 立即注销并关闭连接：后续事件不再投递到该连接，客户端重连后恢复
+            if self.on_failed is not None:
+                self.on_failed(self)
+            try:
+                await self.websocket.close(CLOSE_INTERNAL_ERROR)
+            except Exception as error:
+                logger.debug("关闭连接失败: %s - %s", self.secret, error)
+        finally:
+            # 未送达的事件交给离线缓存
+            self.queue.extendleft(reversed(batch))
+            self._hand_off()
+
+    async def flush(self, timeout: float) -> bool:
+        """等待已入队的事件与控制帧发送完毕（退出排空时使用），超时或连接已关闭时返回False"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.queue or self.control:
+            if self.closed or loop.time() >= deadline:
+                return False
+            await asyncio.sleep(FLUSH_POLL_INTERVAL)
+        return not self.closed
+
+    def _hand_off(self):
+        """将队列中剩余事件交给on_undelivered回调"""
+        if self.on_undelivered is None:
+            self.queue.clear()
+            return
+        traced = self.trace is not None
+        while self.queue:
+            item = self.queue.popleft()
+            self.on_undelivered(self.secret, item[0] if traced else item)
+
+    async def close(self, code: int = 1000):
+        """停止写任务并关闭WebSocket"""
+        self.closed = True
+        if self._writer is not None and not self._writer.done():
+            self._writer.cancel()
+        try:
+            await self.websocket.close(code)
+        except Exception as e:
+            logger.debug("关闭连接失败: %s - %s", self.secret, e)
+
+    async def stop(self):
+        """连接断开后停止写任务"""
+        self.closed = True
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "depth": len(self.queue),
+            "high_water": self.high_water,
+            "max_size": self.max_size,
+            "sent": self.sent,
+            "frames": self.frames,
+            "batch_size": self.batch_size,
+            "dropped": self.dropped,
+            "filtered": self.filtered,
+            "received": self.received,
+            "idle_s": round(monotonic() - self.last_activity, 1),
+            "events": sorted(self.events) if self.events is not None else None,
+            "lanes": self.lanes.depths() if self.lanes is not None else None,
+            "trace": self.trace.stats() if self.trace is not None else None,
+        }
@@ -0,0 +1,105 @@
+# 事件去重（平台重试的相同事件只推送一次）
+import sys
+import time
+from collections import deque
+from typing import Deque, Optional, Set
+
+from src.peek import peek_fields
+
+
+def event_key(body: bytes) -> Optional[str]:
+    """事件去重键：优先使用事件id，没有id时使用op与序号s，均不存在时返回None（不去重）
+
+    事件id位于请求体开头，单独查找可在找到后立即返回；仅在没有id时才扫描op/s。
+    """
+    event_id = peek_fields(body, ("id",)).get("id")
+    if event_id is not None:
+        return str(event_id)
+    fields = peek_fields(body, ("op", "s"))
+    if fields.get("s") is not None:
+        return f"{fields.get('op')}:{fields['s']}"
+    return None
+
+
+class DedupCache:
+    """按时间分桶的去重集合
+
+    窗口ttl平均分为若干个桶，新键写入当前桶；当前桶到期后整桶淘汰最旧的一个，淘汰为O(1)。
+    单个桶写满max_entries/桶数时提前切换到新桶（必要时提前淘汰最旧的桶），保证内存有界。
+    集合中只保存 (密钥, 去重键) 的哈希值，查询需检查全部桶，桶数固定，单次操作为O(1)。
+    """
+
+    def __init__(self, ttl: float = 300, max_entries: int = 1000000, buckets: int = 6):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.bucket_count = max(buckets, 2)
+        self.span = ttl / self.bucket_count
+        self.bucket_limit = max(max_entries // self.bucket_count, 1)
+        self._buckets: Deque[Set[int]] = deque([set()])
+        self._rotated_at = time.monotonic()
+        self._size = 0
+        self.checks = 0
+        self.duplicates = 0
+        self.evicted_early = 0
+
+    def _rotate(self, now: float):
+        """按时间推进当前桶，淘汰超出窗口的桶"""
+        elapsed = now - self._rotated_at
+        if elapsed < self.span:
+            return
+        for _ in range(min(int(elapsed / self.span), self.bucket_count)):
+            self._push()
+        self._rotated_at += int(elapsed / self.span) * self.span
+
+    def _push(self) -> bool:
+        """切换到新桶，淘汰超出桶数的最旧桶，发生淘汰时返回True"""
+        self._buckets.append(set())
+        if len(self._buckets) <= self.bucket_count:
+            return False
+        self._size -= len(self._buckets.popleft())
+        return True
+
+    def seen(self, secret: str, key: str) -> bool:
+        """检查并记录事件，窗口内已出现过时返回True"""
+        self._rotate(time.monotonic())
+        self.checks += 1
+        digest = hash((secret, key))
+        for bucket in self._buckets:
+            if digest in bucket:
+                self.duplicates += 1
+                return True
+        current = self._buckets[-1]
+        current.add(digest)
+        self._size += 1
+        if len(current) >= self.bucket_limit:
+            # 写入过快：提前切换桶，最旧的桶在到期前被淘汰
+            if self._push():
+                self.evicted_early += 1
+            self._rotated_at = time.monotonic()
+        return False
+
+    def forget(self, secret: str, key: str):
+        """撤销记录（事件未能送达时，允许平台重试再次推送）"""
+        digest = hash((secret, key))
+        for bucket in self._buckets:
+            if digest in bucket:
+                bucket.discard(digest)
+                self._size -= 1
+                return
+
+    def __len__(self) -> int:
+        return self._size
+
+    def memory_bytes(self) -> int:
+        """集合结构与哈希值对象占用的内存（估算）"""
+        return sum(sys.getsizeof(bucket) for bucket in self._buckets) + self._size * sys.getsizeof(1 << 62)
+
+    def stats(self) -> dict:
+        return {
+            "entries": self._size,
+            "memory_bytes": self.memory_bytes(),
+            "checks": self.checks,
+            "duplicates": self.duplicates,
+            "hit_rate": round(self.duplicates / self.checks, 6) if self.checks else 0.0,
+            "evicted_early": self.evicted_early,
+        }
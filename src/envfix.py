@@ -17,10 +17,137 @@ def create_config_if_not_exists():
 服务端信息:
   ip: "127.0.0.1"
   port: "8085"
+  workers: 1                 # 工作进程数（0为CPU核数，大于1时启用多进程模式，需平台支持SO_REUSEPORT）
 
 #日志等级
 日志等级:
   leave: "INFO"
+  queued: false              # 队列模式：日志由后台线程格式化并输出，不阻塞事件循环
+  queue_size: 10000          # 日志队列上限，队列满时丢弃并计数
+  format: "pretty"           # 输出格式: pretty(彩色美化) | fast(紧凑JSON Lines，适合生产环境)
+  max_body: 4096             # fast格式下单条消息的最大字符数，超出部分截断
+
+#签名校验
+签名校验:
+  enable: false         # 开启后拒绝未签名或签名错误的Webhook请求
+  cache_size: 1024      # 密钥缓存上限（按机器人密钥）
+  offload_rate: 2000    # 每秒签名/验签次数超过该值时转入线程池
+  workers: 4            # 签名线程池大小
+  max_age: 300          # X-Signature-Timestamp与本机时间允许的最大偏差（秒），超出时拒绝（防重放），0为不检查
+
+#访问控制（在读取请求体与签名校验之前执行，限流与连接数按进程计算）
+访问控制:
+  ip_whitelist: []           # 允许访问的IP/网段，如 ["192.168.1.0/24", "::1"]，为空时不限制
+  rate_limit: ""             # 每个密钥的Webhook速率，如 "1000/分钟"，为空时不限制
+  ip_rate_limit: ""          # 每个来源IP的Webhook速率，如 "50/秒"
+  ws_connect_rate: ""        # WebSocket新建连接速率（全局），如 "20/秒"
+  ws_max_connections: 0      # WebSocket最大连接数，0为不限制
+  trust_forwarded: false     # 位于反向代理之后时，使用X-Forwarded-For作为来源IP
+  trusted_hops: 1            # 可信反向代理层数，取X-Forwarded-For从右数第N个条目（靠左的条目可由客户端伪造）
+  trust_real_ip: false       # 使用X-Real-IP作为来源IP（仅在反向代理总是覆盖该请求头时开启，否则可被客户端伪造）
+
+#请求体（流式读取Webhook请求体，超过上限时应答413）
+请求体:
+  max_kb: 1024              # 单个请求体上限（KB），声明的Content-Length超限时不读取请求体
+  buffer_pool: 8            # 可复用的缓冲区个数（多个数据块的请求体在缓冲区中拼接）
+  buffer_retain_kb: 256     # 超过该大小的缓冲区用完即释放，不保留在池中
+
+#离线缓存（无活跃连接时将事件写入磁盘，重连后回放）
+离线缓存:
+  enable: false
+  path: "spool"              # 缓存目录（相对路径基于程序所在目录）
+  segment_mb: 16             # 单个分段文件大小
+  max_mb: 256                # 每个密钥的缓存上限
+  max_age: 86400             # 缓存保留时长（秒）
+  commit_records: 64         # 累计多少条事件同步一次磁盘
+  commit_interval_ms: 50     # 组提交间隔（毫秒）
+
+#事件去重（平台重试的相同事件只推送一次）
+事件去重:
+  enable: true
+  ttl: 300                   # 去重窗口（秒）
+  max_entries: 1000000       # 缓存条目上限（约80字节/条）
+
+#推送队列（每个连接独立的有界出站队列）
+推送队列:
+  max_size: 1000             # 队列上限
+  overflow: "drop_oldest"    # 溢出策略: drop_oldest | drop_newest | disconnect
+  batch_max_size: 100        # 批量推送单帧最多合并的事件数（客户端通过 ?batch 或握手消息开启）
+  batch_linger_ms: 5         # 批量推送最长等待时间（毫秒）
+
+#优先级（按事件类型t将出站队列拆分为多个通道，靠前的通道优先级高，修改enable与通道数量需重启）
+优先级:
+  enable: false
+  schedule: "weighted"       # 调度模式: strict(总是先发高优先级) | weighted(按权重轮询，低优先级仍有份额)
+  default: "normal"          # 未列出的事件类型使用的通道
+  lanes:
+    - name: "high"
+      weight: 8
+      events: ["AT_MESSAGE_CREATE", "GROUP_AT_MESSAGE_CREATE", "C2C_MESSAGE_CREATE", "DIRECT_MESSAGE_CREATE", "INTERACTION_CREATE"]
+    - name: "normal"
+      weight: 2
+      events: []
+    - name: "low"
+      weight: 1
+      events: ["GUILD_MEMBER_ADD", "GUILD_MEMBER_UPDATE", "GUILD_MEMBER_REMOVE", "MESSAGE_REACTION_ADD", "MESSAGE_REACTION_REMOVE",
+               "AUDIO_START", "AUDIO_FINISH", "AUDIO_ON_MIC", "AUDIO_OFF_MIC"]
+
+#连接管理（同一密钥的多个订阅者）
+连接管理:
+  mode: "replace"            # 投递模式: replace(仅保留最新连接) | broadcast | round_robin | least_queue
+  max_subscribers: 16        # 每个密钥的订阅者上限
+  modes: {}                  # 按密钥单独指定投递模式，如 {"机器人密钥": "broadcast"}
+
+#连接保活（应用层空闲检测，所有连接共用一个时间轮；协议层ping仍保留，修改enable需重启）
+连接保活:
+  enable: false
+  idle_timeout: 60           # 无客户端消息超过该秒数时发送 {"op": "ping"}
+  evict_timeout: 30          # 发送ping后仍无任何消息则断开（关闭码1001，仅限回复过ping的客户端）
+  tick_ms: 1000              # 时间轮精度（毫秒）
+
+#接口代理（客户端经WebSocket发送 {"op": "api"} 调用开放平台接口，共享连接池与access_token）
+接口代理:
+  enable: false
+  base_url: "https://api.sgroup.qq.com"                     # 开放平台地址（沙箱: https://sandbox.api.sgroup.qq.com）
+  token_url: "https://bots.qq.com/app/getAppAccessToken"    # access_token获取地址
+  http2: true                # 安装h2时使用HTTP/2多路复用，否则使用HTTP/1.1长连接
+  max_connections: 100       # 连接池上限
+  max_keepalive: 100         # 保持的空闲长连接数
+  keepalive_expiry: 60       # 空闲长连接保持时间（秒）
+  pool_shards: 16            # HTTP/1.1时按机器人拆分的连接池数（单个连接池的连接过多时分配请求开销大）
+  timeout: 10                # 单次请求超时（秒）
+  max_concurrency: 8         # 每个机器人的并发请求上限
+  refresh_before: 60         # access_token到期前该秒数在后台刷新
+  ca_file: ""                # 自定义CA证书（本地替身服务等），为空时使用系统证书
+
+#延迟追踪（客户端以 ?envelope=on 连接时事件包装为带中继ID与时间戳的信封，客户端发送 {"op": "ack"} 确认）
+延迟追踪:
+  enable: false              # 修改enable需重启
+  ack_timeout: 30            # 推送后超过该秒数仍未确认的事件计为未确认
+  max_pending: 10000         # 每个连接保留的未确认事件上限
+
+#平滑重启（退出时排空连接，提示客户端分散重连）
+平滑重启:
+  drain_timeout: 10          # 退出时等待连接排空的最长时间（秒）
+  reconnect_spread_ms: 3000  # 各连接的关闭时间在该范围内随机分布，并提前告知客户端
+  reuse_port: false          # 单进程模式以SO_REUSEPORT监听，新进程可在旧进程排空期间启动并接管端口
+  hold_ms: 3000              # 启动后drain_timeout秒内，等待客户端重连后再投递的最长时间，超时应答503由平台重试
+
+#监控指标（Prometheus文本格式）
+监控指标:
+  enable: true               # 开启 GET /metrics
+  admin_host: "127.0.0.1"    # 独立管理端口监听地址
+  admin_port: 0              # 大于0时 /stats 与 /metrics 在独立管理端口提供（多进程模式下各进程依次+1）
+  public: false              # 未配置admin_port时是否在Webhook端口公开 /stats 与 /metrics（位于公网时不建议开启）
+#性能分析（在运行中的进程内按需采集，仅在独立管理端口提供，需配置监控指标.admin_port，修改enable需重启）
+性能分析:
+  enable: false
+  token: ""                  # 必填，请求头 Authorization: Bearer <token>
+  output_dir: "profiles"     # 结果文件目录（pstats / 折叠栈），相对路径基于程序所在目录
+  max_seconds: 60            # 单次采集的最长时间（秒）
+  sample_interval_ms: 5      # 调用栈采样间隔（毫秒，下限1）
+  slow_callback_ms: 100      # 执行超过该时间的事件循环回调记为慢回调
+  keep_files: 20             # 保留的结果文件数
 '''
     try:
         # 写入文件，使用utf-8编码
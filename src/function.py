@@ -1,21 +1,35 @@
 # 配置签名计算函数
+import atexit
 import json
 import logging
+import queue
 import re
 import shutil
+import signal
+import weakref
 from logging import *
-from colorama import Fore, Style, init
-from cryptography.hazmat.primitives.asymmetric import ed25519
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
 import sys
 import os
 
+from src.signer import signature_engine
+
+
 def generate_signature(bot_secret, event_ts, plain_token):
-    if len(bot_secret) < 32:
-        bot_secret = (bot_secret * (32 // len(bot_secret) + 1))[:32]
+    message = f"{event_ts}{plain_token}".encode()
+    signature = signature_engine.sign(bot_secret, message)
+
+    return {
+        "plain_token": plain_token,
+        "signature": signature
+    }
 
-    private_key = ed25519.Ed25519PrivateKey.from_private_bytes(bot_secret.encode())
+
+async def generate_signature_async(bot_secret, event_ts, plain_token):
+    """异步生成回调验证签名（高负载时在线程池中运算）"""
     message = f"{event_ts}{plain_token}".encode()
-    signature = private_key.sign(message).hex()
+    signature = await signature_engine.sign_async(bot_secret, message)
 
     return {
         "plain_token": plain_token,
@@ -23,36 +37,96 @@ def generate_signature(bot_secret, event_ts, plain_token):
     }
 
 
-# 初始化colorama
-init(autoreset=True)
+def mask_secret(secret: str) -> str:
+    """脱敏显示机器人密钥"""
+    if len(secret) <= 6:
+        return secret[:1] + "***"
+    return f"{secret[:3]}***{secret[-3:]}"
+
+
+# 回调验证请求特征字段（仅在命中时才解析JSON）
+_PLAIN_TOKEN_KEY = b'"plain_token"'
+
+
+def parse_validation_request(body: bytes):
+    """快速识别回调验证请求，命中时返回其d字段，否则返回None"""
+    if _PLAIN_TOKEN_KEY not in body:
+        return None
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    d = data.get("d") if isinstance(data, dict) else None
+    if isinstance(d, dict) and "event_ts" in d and "plain_token" in d:
+        return d
+    return None
+
+
+async def verify_webhook_signature(bot_secret, signature_hex, timestamp, body: bytes) -> bool:
+    """校验Webhook请求的X-Signature-Ed25519签名（消息为时间戳+原始请求体）
+
+    X-Signature-Timestamp超出允许的时间窗口时直接拒绝，不进行密码学运算，截获的请求无法在窗口外重放。
+    """
+    if not signature_hex or not timestamp:
+        return False
+    if not signature_engine.fresh(timestamp):
+        return False
+    return await signature_engine.verify_async(bot_secret, signature_hex, timestamp.encode() + body)
+
+
+# colorama（首次输出彩色日志时导入并初始化，fast模式不加载）
+_colorama = None
+
+
+def _colors():
+    """返回colorama的(Fore, Style)，首次调用时初始化"""
+    global _colorama
+    if _colorama is None:
+        from colorama import Fore, Style, init
+        init(autoreset=True)
+        _colorama = (Fore, Style)
+    return _colorama
+
+
+class ConsoleHandler(StreamHandler):
+    """始终写入当前的sys.stdout（colorama延迟初始化后会替换sys.stdout）"""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
 
 
 class UltimateJSONFormatter(Formatter):
     """终极JSON日志格式化器（解决空行和换行问题）"""
-    COLOR_MAP = {
-        'DEBUG': Fore.LIGHTCYAN_EX,
-        'INFO': Fore.LIGHTGREEN_EX,
-        'WARNING': Fore.LIGHTYELLOW_EX,
-        'ERROR': Fore.LIGHTRED_EX,
-        'CRITICAL': Fore.LIGHTMAGENTA_EX + Style.BRIGHT
-    }
+    COLOR_MAP = None
+
+    ANSI_PATTERN = re.compile(r'\x1B\[[0-?]*[ -/]*[@-~]')
 
     def __init__(self):
         super().__init__()
-        self.terminal_width = 80
-        self.compact_threshold = 80  # 紧凑模式阈值
         self.indent_size = 2
+        self._refresh_terminal_width()
+        _watch_terminal_resize(self._refresh_terminal_width)
 
     def _get_terminal_width(self):
-        """动态获取终端宽度"""
+        """获取终端宽度"""
         try:
             return shutil.get_terminal_size().columns
         except Exception:
             return 80
 
+    def _refresh_terminal_width(self):
+        """刷新缓存的终端宽度（启动时及SIGWINCH时调用）"""
+        self.terminal_width = self._get_terminal_width()
+        self.compact_threshold = int(self.terminal_width * 0.8)  # 紧凑模式阈值
+
     def _visible_length(self, text):
         """计算可见文本长度（排除颜色码）"""
-        return len(re.sub(r'\x1B\[[0-?]*[ -/]*[@-~]', '', text))
+        return len(self.ANSI_PATTERN.sub('', text))
 
     def _format_json_value(self, value, indent_level, in_list=False):
         """智能JSON格式化核心方法"""
@@ -142,10 +216,6 @@ class UltimateJSONFormatter(Formatter):
         return f'"{indent.join(parts)}"'
 
     def format(self, record):
-        # 动态配置
-        self.terminal_width = self._get_terminal_width()
-        self.compact_threshold = int(self.terminal_width * 0.8)
-
         # 处理消息
         raw_message = record.getMessage()
         try:
@@ -155,6 +225,15 @@ class UltimateJSONFormatter(Formatter):
             formatted = raw_message
 
         # 颜色配置
+        Fore, Style = _colors()
+        if self.COLOR_MAP is None:
+            UltimateJSONFormatter.COLOR_MAP = {
+                'DEBUG': Fore.LIGHTCYAN_EX,
+                'INFO': Fore.LIGHTGREEN_EX,
+                'WARNING': Fore.LIGHTYELLOW_EX,
+                'ERROR': Fore.LIGHTRED_EX,
+                'CRITICAL': Fore.LIGHTMAGENTA_EX + Style.BRIGHT
+            }
         color = self.COLOR_MAP.get(record.levelname, Fore.WHITE)
         reset = Style.RESET_ALL
 
@@ -180,19 +259,147 @@ class UltimateJSONFormatter(Formatter):
         return '\n'.join(lines)
 
 
-def configure_logger(name: str = 'QQwebhook', level: int = logging.INFO) -> Logger:
-    """配置终极日志记录器"""
+class FastJSONFormatter(Formatter):
+    """生产环境格式化器：输出无颜色的紧凑JSON Lines，不解析消息体，超长消息截断"""
+
+    def __init__(self, max_body: int = 4096):
+        super().__init__()
+        self.max_body = max_body
+
+    def format(self, record):
+        message = record.getMessage()
+        if self.max_body and len(message) > self.max_body:
+            message = f"{message[:self.max_body]}...(截断 {len(message) - self.max_body} 字符)"
+        entry = {
+            "ts": self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": message,
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, separators=(',', ':'))
+
+
+# 终端尺寸变化回调（SIGWINCH）
+_resize_callbacks = []
+
+
+def _watch_terminal_resize(callback):
+    """注册终端尺寸变化回调（弱引用绑定方法），仅在支持SIGWINCH的平台的主线程中生效"""
+    if not hasattr(signal, "SIGWINCH"):
+        return
+    if not _resize_callbacks:
+        try:
+            previous = signal.getsignal(signal.SIGWINCH)
+
+            def handle_resize(signum, frame):
+                for ref in list(_resize_callbacks):
+                    cb = ref()
+                    if cb is None:
+                        _resize_callbacks.remove(ref)
+                    else:
+                        cb()
+                if callable(previous):
+                    previous(signum, frame)
+
+            signal.signal(signal.SIGWINCH, handle_resize)
+        except ValueError:
+            # 非主线程无法注册信号处理器
+            return
+    _resize_callbacks.append(weakref.WeakMethod(callback))
+
+
+def create_formatter(fmt: str = "pretty", max_body: int = 4096) -> Formatter:
+    """按模式创建日志格式化器：pretty（彩色美化）或 fast（紧凑JSON Lines）"""
+    if fmt == "fast":
+        return FastJSONFormatter(max_body)
+    return UltimateJSONFormatter()
+
+
+class DroppingQueueHandler(QueueHandler):
+    """非阻塞队列日志处理器：热路径只做入队，队列满时丢弃并计数"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 格式化交给后台线程，入队时不做任何处理
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# 后台日志线程
+_log_listener: Optional[QueueListener] = None
+_queue_handler: Optional[DroppingQueueHandler] = None
+
+
+def configure_logger(name: str = 'QQwebhook', level: int = logging.INFO,
+                     queued: bool = False, queue_size: int = 10000,
+                     fmt: str = None, max_body: int = 4096) -> Logger:
+    """配置终极日志记录器
+
+    queued为True时改为队列模式：记录在调用处入队，由后台线程格式化并写出；
+    fmt指定格式化模式（pretty/fast），未指定时保持当前格式化器
+    """
+    global _log_listener, _queue_handler
     logger = getLogger(name)
     logger.setLevel(level)
 
     if not logger.handlers:
-        handler = StreamHandler(sys.stdout)
-        handler.setFormatter(UltimateJSONFormatter())
+        handler = ConsoleHandler()
+        handler.setFormatter(create_formatter(fmt or "pretty", max_body))
         logger.addHandler(handler)
         logger.propagate = False
+    elif fmt is not None:
+        handlers = _log_listener.handlers if _log_listener is not None else logger.handlers
+        for handler in handlers:
+            handler.setFormatter(create_formatter(fmt, max_body))
+
+    if queued and _queue_handler is None:
+        handlers = list(logger.handlers)
+        _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+        _log_listener = QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+        for handler in handlers:
+            logger.removeHandler(handler)
+        logger.addHandler(_queue_handler)
+        _log_listener.start()
+        atexit.register(stop_logging)
 
     return logger
 
 
+def stop_logging(name: str = 'QQwebhook'):
+    """停止后台日志线程：写出队列中剩余的全部记录，并恢复同步输出"""
+    global _log_listener, _queue_handler
+    if _log_listener is None:
+        return
+    _log_listener.stop()
+    logger = getLogger(name)
+    logger.removeHandler(_queue_handler)
+    for handler in _log_listener.handlers:
+        handler.flush()
+        logger.addHandler(handler)
+    _log_listener = None
+    _queue_handler = None
+
+
+def logging_stats() -> dict:
+    """队列日志状态"""
+    if _queue_handler is None:
+        return {"queued": False}
+    return {
+        "queued": True,
+        "depth": _queue_handler.queue.qsize(),
+        "dropped": _queue_handler.dropped,
+    }
+
+
 # 初始化日志实例
 logger = configure_logger()
\ No newline at end of file
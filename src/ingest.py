@@ -0,0 +1,131 @@
+# Webhook请求体的流式读取：限制大小、复用缓冲区并统计在途字节数
+from typing import List
+
+
+class BodyTooLarge(Exception):
+    """请求体超过上限（声明的Content-Length或实际读取的字节数）"""
+
+    def __init__(self, size: int, limit: int):
+        super().__init__(f"{size} > {limit} 字节")
+        self.size = size
+        self.limit = limit
+
+
+class BufferPool:
+    """可复用的bytearray缓冲区
+
+    缓冲区只增长不收缩，写入位置由调用方记录，复用时直接覆盖原有内容而不重新分配；
+    超过retain字节的缓冲区用完即释放，池中最多保留size个，常驻内存不超过size * retain。
+    """
+
+    def __init__(self, size: int = 8, retain: int = 256 << 10):
+        self.size = size
+        self.retain = retain
+        self._free: List[bytearray] = []
+        self.allocated = 0
+
+    def acquire(self) -> bytearray:
+        if self._free:
+            return self._free.pop()
+        self.allocated += 1
+        return bytearray()
+
+    def release(self, buffer: bytearray):
+        # 超大请求体的缓冲区不保留，避免一次突发长期占用内存
+        if len(buffer) <= self.retain and len(self._free) < self.size:
+            self._free.append(buffer)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "free": len(self._free),
+            "retained_bytes": sum(len(buffer) for buffer in self._free),
+            "allocated": self.allocated,
+        }
+
+
+class BodyReader:
+    """按块读取ASGI请求体，超过max_size时立即停止读取
+
+    只有一个数据块的请求体（绝大多数事件）直接使用该块，不复制；
+    多个数据块时依次写入池中的缓冲区，读取完成后复制为bytes（入队与离线缓存需要持有请求体），缓冲区归还到池中。
+    in_flight为正在读取与处理中的请求体字节数，peak为其历史峰值。
+    """
+
+    def __init__(self, max_size: int = 1 << 20, pool: BufferPool = None):
+        self.max_size = max_size
+        self.pool = pool or BufferPool()
+        self.in_flight = 0
+        self.peak = 0
+        self.rejected = 0
+
+    def configure(self, max_size: int = None, pool_size: int = None, retain: int = None):
+        if max_size is not None:
+            self.max_size = max(int(max_size), 1)
+        if pool_size is not None:
+            self.pool.size = max(int(pool_size), 0)
+            del self.pool._free[self.pool.size:]
+        if retain is not None:
+            self.pool.retain = max(int(retain), 0)
+
+    def _reserve(self, size: int):
+        self.in_flight += size
+        if self.in_flight > self.peak:
+            self.peak = self.in_flight
+
+    def _reject(self, size: int, held: int):
+        self.in_flight -= held
+        self.rejected += 1
+        raise BodyTooLarge(size, self.max_size)
+
+    async def read(self, request) -> bytes:
+        """读取完整请求体；处理完毕后须调用 release(len(body))"""
+        limit = self.max_size
+        declared = request.headers.get("content-length")
+        if declared and declared.isdigit() and int(declared) > limit:
+            # 声明的长度已超限，不读取请求体
+            self._reject(int(declared), 0)
+
+        first = b""
+        buffer = None
+        size = 0
+        try:
+            async for chunk in request.stream():
+                if not chunk:
+                    continue
+                end = size + len(chunk)
+                if end > limit:
+                    self._reject(end, size)
+                self._reserve(len(chunk))
+                if not first:
+                    first = chunk
+                else:
+                    if buffer is None:
+                        buffer = self.pool.acquire()
+                        buffer[:len(first)] = first
+                    buffer[size:end] = chunk
+                size = end
+            if buffer is None:
+                return first
+            with memoryview(buffer) as view:
+                return bytes(view[:size])
+        except BaseException as e:
+            if not isinstance(e, BodyTooLarge):
+                # 客户端断开等读取失败时撤销计数
+                self.in_flight -= size
+            raise
+        finally:
+            if buffer is not None:
+                self.pool.release(buffer)
+
+    def release(self, size: int):
+        self.in_flight -= size
+
+    def stats(self) -> dict:
+        return {
+            "max_size": self.max_size,
+            "in_flight_bytes": self.in_flight,
+            "peak_bytes": self.peak,
+            "rejected": self.rejected,
+            "pool": self.pool.stats(),
+        }
@@ -0,0 +1,147 @@
+# 应用层连接保活：哈希时间轮统一处理空闲检测、ping与驱逐
+import asyncio
+import logging
+import math
+from time import monotonic
+from typing import Dict, List
+
+logger = logging.getLogger("QQwebhook")
+
+# 时间轮默认槽数（tick为1秒时一圈约8.5分钟，更长的定时记录剩余圈数）
+DEFAULT_SLOTS = 512
+# 驱逐空闲连接使用的关闭码（1001: Going Away）
+CLOSE_GOING_AWAY = 1001
+# 服务端发送的保活帧，客户端回复任意消息（如 {"op": "pong"}）即视为存活；从未回复的客户端不会被驱逐
+PING_FRAME = b'{"op": "ping"}'
+
+
+class TimingWheel:
+    """哈希时间轮：到期时间按tick取整后散列到固定数量的槽，每次推进只处理经过的槽
+
+    添加与取消均为O(1)，推进的开销与经过槽中的条目数成正比；每个条目同时只有一个定时。
+    到期后由调用方检查状态并按需重新加入，连接活动时只需更新时间戳，无需调整定时器。
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = DEFAULT_SLOTS):
+        self.tick = tick
+        # 槽：条目 -> 到期tick序号（超过一圈的条目在经过时保留）
+        self._slots: List[dict] = [{} for _ in range(slots)]
+        self._index: Dict[object, int] = {}
+        self._origin = monotonic()
+        self._current = 0
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def schedule(self, item, when: float):
+        """在when（monotonic时间）之后的第一个tick触发item，已有定时时替换"""
+        self.cancel(item)
+        target = max(math.ceil((when - self._origin) / self.tick), self._current + 1)
+        index = target % len(self._slots)
+        self._slots[index][item] = target
+        self._index[item] = index
+
+    def cancel(self, item):
+        index = self._index.pop(item, None)
+        if index is not None:
+            del self._slots[index][item]
+
+    def advance(self, now: float) -> list:
+        """推进到now，返回全部到期的条目（事件循环阻塞超过一圈时每个槽只处理一次）"""
+        target = int((now - self._origin) / self.tick)
+        expired = []
+        slots = self._slots
+        for tick in range(self._current + 1, min(target, self._current + len(slots)) + 1):
+            bucket = slots[tick % len(slots)]
+            if not bucket:
+                continue
+            due = [item for item, deadline in bucket.items() if deadline <= target]
+            for item in due:
+                del bucket[item]
+                del self._index[item]
+            expired.extend(due)
+        if target > self._current:
+            self._current = target
+        return expired
+
+
+class KeepaliveMonitor:
+    """所有连接共用一个时间轮与一个后台任务，替代每个连接各自的ping定时器
+
+    连接在idle_timeout内没有收到任何客户端消息时发送 {"op": "ping"}，
+    此后evict_timeout内仍无消息则视为失效（半开或无响应）并关闭连接。
+    只有回复过应用层ping的客户端才会被驱逐；只接收事件、从不发送消息的客户端
+    仍由uvicorn的协议层ping/pong检测失效，应用层ping只用于保持链路活跃。
+    """
+
+    def __init__(self, idle_timeout: float = 60.0, evict_timeout: float = 30.0, tick: float = 1.0):
+        self.idle_timeout = idle_timeout
+        self.evict_timeout = evict_timeout
+        self.wheel = TimingWheel(tick)
+        self.pings = 0
+        self.evicted = 0
+
+    def configure(self, idle_timeout: float = None, evict_timeout: float = None):
+        """调整超时时间（已在时间轮中的连接到期检查时按新值重新计算）"""
+        if idle_timeout is not None:
+            self.idle_timeout = max(float(idle_timeout), self.wheel.tick)
+        if evict_timeout is not None:
+            self.evict_timeout = max(float(evict_timeout), self.wheel.tick)
+
+    def watch(self, conn):
+        """开始监视已注册的连接"""
+        self.wheel.schedule(conn, conn.last_activity + self.idle_timeout)
+
+    def unwatch(self, conn):
+        """连接断开后移除，不再持有连接对象"""
+        self.wheel.cancel(conn)
+
+    def check(self, conn, now: float):
+        """到期检查：按最后活动时间决定重新计时、发送ping或驱逐"""
+        if conn.closed:
+            return
+        if conn.pinged_at is not None and conn.last_activity < conn.pinged_at:
+            # 已发送ping，等待客户端回复
+            deadline = conn.pinged_at + self.evict_timeout
+            if now < deadline:
+                self.wheel.schedule(conn, deadline)
+            elif conn.ping_answered:
+                self.evicted += 1
+                logger.info("连接无响应，已断开: %s", conn.secret)
+                asyncio.ensure_future(conn.close(CLOSE_GOING_AWAY))
+            else:
+                # 从未回复过ping的客户端（只接收事件）不驱逐，再空闲idle_timeout后重新发送ping
+                conn.pinged_at = None
+                self.wheel.schedule(conn, now + self.idle_timeout)
+            return
+        if conn.pinged_at is not None:
+            conn.ping_answered = True
+        conn.pinged_at = None
+        deadline = conn.last_activity + self.idle_timeout
+        if now >= deadline:
+            conn.send_control(PING_FRAME)
+            conn.pinged_at = now
+            self.pings += 1
+            self.wheel.schedule(conn, now + self.evict_timeout)
+        else:
+            self.wheel.schedule(conn, deadline)
+
+    def advance(self, now: float):
+        for conn in self.wheel.advance(now):
+            self.check(conn, now)
+
+    async def run(self):
+        """后台任务：每个tick推进一次时间轮"""
+        while True:
+            await asyncio.sleep(self.wheel.tick)
+            self.advance(monotonic())
+
+    def stats(self) -> dict:
+        return {
+            "idle_timeout": self.idle_timeout,
+            "evict_timeout": self.evict_timeout,
+            "tick": self.wheel.tick,
+            "watched": len(self.wheel),
+            "pings": self.pings,
+            "evicted": self.evicted,
+        }
@@ -0,0 +1,156 @@
+# 出站优先级通道：按事件类型t分级，每个连接的出站队列拆分为多个通道并按严格优先级或权重调度
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+from src.subscription import event_type
+
+# 调度模式：strict（总是先发送高优先级通道）、weighted（加权轮询，低优先级通道按权重保证份额）
+SCHEDULE_STRICT = "strict"
+SCHEDULE_WEIGHTED = "weighted"
+SCHEDULES = (SCHEDULE_STRICT, SCHEDULE_WEIGHTED)
+
+# 默认通道：需要及时回复的消息与交互事件优先，成员、表情表态等批量变更事件放在最后
+DEFAULT_LANES = [
+    {"name": "high", "weight": 8, "events": [
+        "AT_MESSAGE_CREATE", "GROUP_AT_MESSAGE_CREATE", "C2C_MESSAGE_CREATE",
+        "DIRECT_MESSAGE_CREATE", "INTERACTION_CREATE",
+    ]},
+    {"name": "normal", "weight": 2, "events": []},
+    {"name": "low", "weight": 1, "events": [
+        "GUILD_MEMBER_ADD", "GUILD_MEMBER_UPDATE", "GUILD_MEMBER_REMOVE",
+        "MESSAGE_REACTION_ADD", "MESSAGE_REACTION_REMOVE",
+        "AUDIO_START", "AUDIO_FINISH", "AUDIO_ON_MIC", "AUDIO_OFF_MIC",
+    ]},
+]
+
+
+class PriorityPolicy:
+    """优先级配置：通道名称与顺序（靠前的优先级高）、权重、事件类型到通道的映射
+
+    全部连接共用一个实例，热更新时原地替换映射与权重；通道数量在启动时确定。
+    """
+
+    def __init__(self, lanes: Iterable[dict] = DEFAULT_LANES, default: str = "normal",
+                 schedule: str = SCHEDULE_WEIGHTED):
+        self.names: List[str] = []
+        self.weights: List[int] = []
+        self.mapping: Dict[str, int] = {}
+        self.default = 0
+        self.strict = False
+        self.configure(lanes, default, schedule)
+
+    def configure(self, lanes: Iterable[dict], default: str = "normal", schedule: str = SCHEDULE_WEIGHTED):
+        """解析通道配置，配置有误时抛出ValueError并保留原有配置"""
+        names, weights, mapping = [], [], {}
+        for index, lane in enumerate(lanes or ()):
+            if not isinstance(lane, dict) or not lane.get("name"):
+                raise ValueError(f"第{index + 1}个通道缺少name")
+            name = str(lane["name"])
+            if name in names:
+                raise ValueError(f"通道名称重复: {name}")
+            names.append(name)
+            weights.append(max(int(lane.get("weight", 1)), 1))
+            for kind in lane.get("events") or ():
+                # 同一事件类型出现在多个通道时取优先级最高的
+                mapping.setdefault(str(kind).strip().upper(), index)
+        if not names:
+            raise ValueError("至少需要一个通道")
+        if default not in names:
+            raise ValueError(f"默认通道不存在: {default}")
+        if schedule not in SCHEDULES:
+            raise ValueError(f"未知的调度模式: {schedule}")
+        if self.names and len(names) != len(self.names):
+            raise ValueError("通道数量变更需重启生效")
+        self.names, self.weights, self.mapping = names, weights, mapping
+        self.default = names.index(default)
+        self.strict = schedule == SCHEDULE_STRICT
+
+    def lane(self, kind: Optional[str]) -> int:
+        """事件类型所属的通道序号，非分发事件与未配置的类型使用默认通道"""
+        if kind is None:
+            return self.default
+        return self.mapping.get(kind, self.default)
+
+    def classify(self, body: bytes) -> int:
+        """读取事件类型字段t（不完整解析JSON）并返回通道序号"""
+        return self.lane(event_type(body))
+
+
+class LaneQueue:
+    """按通道拆分的出站队列，提供连接写任务所需的deque接口子集
+
+    事件为请求体，信封模式下为 (请求体, 接收时间) 元组，均按请求体中的事件类型分类。
+
+    strict模式下总是取最高优先级的非空通道；weighted模式下依次轮询各非空通道，每轮最多取出与权重相同个数的事件，
+    高优先级事件最多等待其他通道各一轮的份额，低优先级事件在持续的高优先级流量下仍按权重获得发送机会。
+    """
+    __slots__ = ("policy", "lanes", "size", "_current", "_credit")
+
+    def __init__(self, policy: PriorityPolicy):
+        self.policy = policy
+        self.lanes = [deque() for _ in policy.names]
+        self.size = 0
+        # 从最后一个通道开始，首次取出时轮到最高优先级通道
+        self._current = len(self.lanes) - 1
+        self._credit = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __bool__(self) -> bool:
+        return self.size > 0
+
+    def _classify(self, item) -> int:
+        return self.policy.classify(item[0] if isinstance(item, tuple) else item)
+
+    def append(self, item, lane: Optional[int] = None):
+        """入队；未指定通道时按事件类型分类"""
+        if lane is None:
+            lane = self._classify(item)
+        self.lanes[lane].append(item)
+        self.size += 1
+
+    def popleft(self):
+        if not self.size:
+            raise IndexError("pop from an empty LaneQueue")
+        lanes = self.lanes
+        self.size -= 1
+        if self.policy.strict:
+            for lane in lanes:
+                if lane:
+                    return lane.popleft()
+        current = self._current
+        if self._credit <= 0 or not lanes[current]:
+            # 当前通道份额用完或已空：轮到下一个非空通道
+            count = len(lanes)
+            for _ in range(count):
+                current = (current + 1) % count
+                if lanes[current]:
+                    break
+            self._current = current
+            self._credit = self.policy.weights[current]
+        self._credit -= 1
+        return lanes[current].popleft()
+
+    def drop(self):
+        """队列溢出：丢弃最低优先级非空通道中最早的事件"""
+        for lane in reversed(self.lanes):
+            if lane:
+                self.size -= 1
+                return lane.popleft()
+        raise IndexError("pop from an empty LaneQueue")
+
+    def extendleft(self, items: Iterable):
+        """放回未发送的事件：重新分类后放回各自通道的最前面（与deque.extendleft相同，items按逆序给出）"""
+        lanes = self.lanes
+        for item in items:
+            lanes[self._classify(item)].appendleft(item)
+            self.size += 1
+
+    def clear(self):
+        for lane in self.lanes:
+            lane.clear()
+        self.size = 0
+
+    def depths(self) -> Dict[str, int]:
+        return {name: len(lane) for name, lane in zip(self.policy.names, self.lanes)}
@@ -0,0 +1,263 @@
+# 运行指标（Prometheus文本格式）
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# 默认延迟分桶（秒）：10µs ~ 10s
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+# 端到端延迟分桶（秒）：包含客户端处理时间，1ms ~ 120s
+TRACE_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0,
+)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """指标基类：按标签值缓存子指标，热路径只操作子指标
+
+    也可设置回调function，在抓取时计算（返回数值，或(标签值元组, 数值)的可迭代对象），不占用热路径。
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 function: Optional[Callable[[], object]] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def remove(self, *values: str):
+        self._children.pop(values, None)
+
+    def children(self) -> List[Tuple[Tuple[str, ...], object]]:
+        """当前全部(标签值元组, 子指标)"""
+        return list(self._children.items())
+
+    def set_function(self, function: Callable[[], object]):
+        self.function = function
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        if self.function is not None:
+            result = self.function()
+            if isinstance(result, (int, float)):
+                lines.append(f"{self.name} {_format_value(result)}")
+            else:
+                for values, value in result:
+                    lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}")
+            return lines
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(Metric):
+    """单调递增计数器"""
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self._children[()].inc(amount)
+
+
+class Gauge(Metric):
+    """瞬时值"""
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float):
+        self._children[()].set(value)
+
+
+class HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """记录一次观测值：一次二分查找与三次加法，无内存分配"""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """按分桶线性插值估算分位数（落在最后一个桶之外时返回最大边界）"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, self.counts):
+            if count and cumulative + count >= rank:
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = bound
+        return self.buckets[-1]
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("child", "start")
+
+    def __init__(self, child: HistogramChild):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.start)
+
+
+class Histogram(Metric):
+    """固定分桶直方图"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._children[()].observe(value)
+
+    def _render_child(self, values, child: HistogramChild) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {child.sum!r}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                function: Optional[Callable[[], object]] = None) -> Counter:
+        return self.register(Counter(name, documentation, labelnames, function))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+              function: Optional[Callable[[], object]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """生成Prometheus文本格式"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# 全局指标
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "qqwebhook_stage_seconds", "Webhook到WebSocket各阶段耗时", ("stage",))
+STAGE_READ = STAGE_SECONDS.labels("read")          # 读取请求体
+STAGE_VERIFY = STAGE_SECONDS.labels("verify")      # 入站签名校验
+STAGE_SIGN = STAGE_SECONDS.labels("sign")          # 回调验证签名
+STAGE_PARSE = STAGE_SECONDS.labels("parse")        # 回调验证请求识别
+STAGE_DEDUP = STAGE_SECONDS.labels("dedup")        # 重复事件检查
+STAGE_ROUTE = STAGE_SECONDS.labels("route")        # 查询连接并入队/跨进程转发
+STAGE_SEND = STAGE_SECONDS.labels("send")          # WebSocket发送
+STAGE_TOTAL = STAGE_SECONDS.labels("webhook")      # Webhook处理总耗时
+STAGE_API = STAGE_SECONDS.labels("api")            # 接口代理调用（含等待并发额度与获取access_token）
+
+EVENTS = registry.counter("qqwebhook_events_total", "按结果统计的事件数", ("outcome",))
+EVENTS_DELIVERED = EVENTS.labels("delivered")
+EVENTS_FORWARDED = EVENTS.labels("forwarded")
+EVENTS_SPOOLED = EVENTS.labels("spooled")
+EVENTS_UNDELIVERED = EVENTS.labels("undelivered")
+EVENTS_REJECTED = EVENTS.labels("rejected")
+EVENTS_VALIDATION = EVENTS.labels("validation")
+EVENTS_DUPLICATE = EVENTS.labels("duplicate")
+EVENTS_FILTERED = EVENTS.labels("filtered")
+EVENTS_FAILED = EVENTS.labels("failed")
+EVENTS_DEFERRED = EVENTS.labels("deferred")          # 重启期间应答503，由平台重试
+EVENTS_TOO_LARGE = EVENTS.labels("too_large")        # 请求体超过上限，应答413
+
+TRACE_SECONDS = registry.histogram(
+    "qqwebhook_trace_seconds", "信封模式连接的端到端延迟", ("secret", "stage"), buckets=TRACE_BUCKETS)
+TRACE_UNACKED = registry.counter("qqwebhook_trace_unacked_total", "超时或连接断开时仍未确认的事件数", ("secret",))
+
+SENDS = registry.counter("qqwebhook_ws_sends_total", "WebSocket发送结果", ("result",))
+SENDS_OK = SENDS.labels("ok")
+SENDS_FAILED = SENDS.labels("failed")
+SENDS_DROPPED = SENDS.labels("dropped")
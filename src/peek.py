@@ -0,0 +1,110 @@
+# 不完整解析JSON即可读取事件顶层字段
+import json
+import re
+from typing import Dict, Iterable, Optional
+
+# 结构字符：字符串起始引号与括号
+_STRUCTURAL = re.compile(rb'["{}\[\]]')
+# 非字符串的标量值
+_SCALAR = re.compile(rb'-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null')
+_CONSTANTS = {b"true": True, b"false": False, b"null": None}
+_WHITESPACE = b" \t\r\n"
+_QUOTE, _BACKSLASH, _COLON = 0x22, 0x5C, 0x3A
+_OPENING = (0x7B, 0x5B)
+
+
+def _string_end(body: bytes, start: int) -> int:
+    """字符串结束引号的位置（start为起始引号之后），长字符串由bytes.find按内存扫描速度跳过"""
+    end = body.find(b'"', start)
+    while end > 0 and body[end - 1] == _BACKSLASH:
+        # 前面有奇数个反斜杠时引号被转义
+        k = end - 1
+        while body[k] == _BACKSLASH:
+            k -= 1
+        if (end - 1 - k) % 2 == 0:
+            break
+        end = body.find(b'"', end + 1)
+    return end
+
+
+def _skip_whitespace(body: bytes, pos: int) -> int:
+    while pos < len(body) and body[pos] in _WHITESPACE:
+        pos += 1
+    return pos
+
+
+def _decode_string(raw: bytes) -> Optional[str]:
+    """解码字符串内容，转义序列无效时返回None（视为字段不存在）"""
+    if b"\\" in raw:
+        try:
+            return json.loads(b'"' + raw + b'"')
+        except ValueError:
+            return None
+    return raw.decode("utf-8", "replace")
+
+
+def _decode_scalar(raw: bytes):
+    if raw in _CONSTANTS:
+        return _CONSTANTS[raw]
+    if b"." in raw or b"e" in raw or b"E" in raw:
+        return float(raw)
+    return int(raw)
+
+
+def peek_fields(body: bytes, keys: Iterable[str]) -> Dict[str, object]:
+    """读取JSON对象顶层的标量字段（字符串/数字/布尔/null），忽略嵌套对象中的同名字段
+
+    只定位引号与括号，字符串内容整段跳过；找到全部所需字段或顶层对象结束时立即返回。
+    QQ事件的 op/id 位于请求体开头，通常只需扫描前几十个字节。
+    """
+    wanted = {key.encode() for key in keys}
+    found: Dict[str, object] = {}
+    search = _STRUCTURAL.search
+    depth = 0
+    pos = 0
+    while len(found) < len(wanted):
+        match = search(body, pos)
+        if match is None:
+            break
+        start = match.start()
+        char = body[start]
+        if char != _QUOTE:
+            pos = start + 1
+            if char in _OPENING:
+                depth += 1
+                continue
+            depth -= 1
+            if depth <= 0:
+                break
+            continue
+        end = _string_end(body, start + 1)
+        if end < 0:
+            break
+        pos = end + 1
+        if depth != 1:
+            continue
+        # 顶层键名：其后紧跟冒号
+        colon = _skip_whitespace(body, pos)
+        if colon >= len(body) or body[colon] != _COLON:
+            continue
+        key = body[start + 1:end]
+        if key not in wanted:
+            pos = colon + 1
+            continue
+        value = _skip_whitespace(body, colon + 1)
+        if value < len(body) and body[value] == _QUOTE:
+            value_end = _string_end(body, value + 1)
+            if value_end < 0:
+                break
+            text = _decode_string(body[value + 1:value_end])
+            if text is not None:
+                found[key.decode()] = text
+            pos = value_end + 1
+            continue
+        scalar = _SCALAR.match(body, value)
+        if scalar is not None:
+            found[key.decode()] = _decode_scalar(scalar.group(0))
+            pos = scalar.end()
+        else:
+            pos = value
+    return found
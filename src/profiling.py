@@ -0,0 +1,276 @@
+# 运行时性能分析：在运行中的进程内按需采集一段时间的性能数据，未采集时没有任何开销
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, List, Optional
+
+from src.metrics import DEFAULT_BUCKETS, HistogramChild
+
+logger = logging.getLogger("QQwebhook")
+
+# 采集模式：sample（定时采样全部线程的调用栈，输出折叠栈）、cpu（cProfile确定性分析事件循环线程，输出pstats）
+MODE_SAMPLE = "sample"
+MODE_CPU = "cpu"
+MODES = (MODE_SAMPLE, MODE_CPU)
+
+# 事件循环延迟探测间隔（秒）
+LAG_INTERVAL = 0.01
+# 折叠栈的最大深度
+MAX_STACK_DEPTH = 128
+# 结果中列出的慢回调与热点函数个数
+TOP_N = 20
+
+
+class ProfileBusy(Exception):
+    """已有采集在进行中"""
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _describe_callback(handle) -> str:
+    """事件循环回调的可读名称：任务步进显示协程名"""
+    callback = getattr(handle, "_callback", None)
+    owner = getattr(callback, "__self__", None)
+    if isinstance(owner, asyncio.Task):
+        coro = owner.get_coro()
+        return f"Task {getattr(coro, '__qualname__', coro)!s} ({owner.get_name()})"
+    return getattr(callback, "__qualname__", None) or repr(callback)
+
+
+class StackSampler(threading.Thread):
+    """采样线程：按固定间隔读取各线程当前调用栈并计数（开销只与采样间隔有关）"""
+
+    def __init__(self, interval: float):
+        super().__init__(name="QQwebhook-profiler", daemon=True)
+        self.interval = interval
+        self.stacks: Dict[str, int] = {}
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                key = ";".join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def collapsed(self) -> str:
+        """折叠栈格式（flamegraph.pl / speedscope 可直接读取）"""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+
+class SlowCallbackWatch:
+    """采集期间记录执行时间超过阈值的事件循环回调
+
+    仅在采集期间替换asyncio.Handle._run，结束后恢复；非默认事件循环（如uvloop）的回调无法计时，此时不记录。
+    """
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.callbacks: Dict[str, List[float]] = {}
+        self.count = 0
+        self._original = None
+
+    def start(self):
+        original = self._original = asyncio.events.Handle._run
+        threshold = self.threshold
+        callbacks = self.callbacks
+        watch = self
+
+        def _run(handle):
+            started = perf_counter()
+            try:
+                return original(handle)
+            finally:
+                elapsed = perf_counter() - started
+                watch.count += 1
+                if elapsed >= threshold:
+                    callbacks.setdefault(_describe_callback(handle), []).append(elapsed)
+
+        asyncio.events.Handle._run = _run
+
+    def stop(self):
+        if self._original is not None:
+            asyncio.events.Handle._run = self._original
+            self._original = None
+
+    def top(self) -> List[dict]:
+        ranked = sorted(self.callbacks.items(), key=lambda item: max(item[1]), reverse=True)[:TOP_N]
+        return [{
+            "callback": name,
+            "count": len(durations),
+            "max_ms": round(max(durations) * 1000, 3),
+            "total_ms": round(sum(durations) * 1000, 3),
+        } for name, durations in ranked]
+
+
+async def measure_loop_lag(lag: HistogramChild, stop: asyncio.Event) -> float:
+    """事件循环延迟：定时休眠，实际唤醒时间超出预期的部分即为被阻塞的时间，返回最大延迟"""
+    highest = 0.0
+    while not stop.is_set():
+        started = perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        delay = max(perf_counter() - started - LAG_INTERVAL, 0.0)
+        lag.observe(delay)
+        if delay > highest:
+            highest = delay
+    return highest
+
+
+class Profiler:
+    """按需性能分析：同一时间只进行一次采集，结果写入output_dir"""
+
+    def __init__(self, output_dir: str = "profiles", max_seconds: float = 60.0, sample_interval: float = 0.005,
+                 slow_callback: float = 0.1, keep_files: int = 20, prefix: str = "profile"):
+        self.output_dir = Path(output_dir)
+        self.max_seconds = max_seconds
+        self.sample_interval = sample_interval
+        self.slow_callback = slow_callback
+        self.keep_files = keep_files
+        self.prefix = prefix
+        self.captures = 0
+        self._busy = False
+
+    def configure(self, max_seconds: float = None, sample_interval: float = None, slow_callback: float = None,
+                  keep_files: int = None):
+        if max_seconds is not None:
+            self.max_seconds = max(float(max_seconds), 1.0)
+        if sample_interval is not None:
+            # 采样间隔下限1ms，限制采样线程的开销
+            self.sample_interval = max(float(sample_interval), 0.001)
+        if slow_callback is not None:
+            self.slow_callback = max(float(slow_callback), 0.001)
+        if keep_files is not None:
+            self.keep_files = max(int(keep_files), 1)
+
+    @property
+    def busy(self) -> bool:
+        return self._busy
+
+    async def capture(self, mode: str = MODE_SAMPLE, seconds: float = 10.0) -> dict:
+        """采集seconds秒（不超过max_seconds），返回摘要与结果文件路径"""
+        if mode not in MODES:
+            raise ValueError(f"未知的采集模式: {mode}")
+        if self._busy:
+            raise ProfileBusy("已有采集在进行中")
+        seconds = min(max(float(seconds), 0.1), self.max_seconds)
+        self._busy = True
+        try:
+            return await self._capture(mode, seconds)
+        finally:
+            self._busy = False
+
+    async def _capture(self, mode: str, seconds: float) -> dict:
+        logger.warning("开始性能分析: %s %.1f 秒", mode, seconds)
+        lag = HistogramChild(DEFAULT_BUCKETS)
+        stop = asyncio.Event()
+        lag_task = asyncio.ensure_future(measure_loop_lag(lag, stop))
+        watch = SlowCallbackWatch(self.slow_callback)
+        sampler = profile = None
+        if mode == MODE_SAMPLE:
+            sampler = StackSampler(self.sample_interval)
+            sampler.start()
+        else:
+            profile = cProfile.Profile()
+        watch.start()
+        if profile is not None:
+            profile.enable()
+        started = perf_counter()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            if profile is not None:
+                profile.disable()
+            watch.stop()
+            if sampler is not None:
+                sampler.stop()
+            stop.set()
+            max_lag = await lag_task
+        elapsed = perf_counter() - started
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        path = self.output_dir / f"{self.prefix}-{time.strftime('%Y%m%d-%H%M%S')}-{mode}"
+        result = {
+            "mode": mode,
+            "seconds": round(elapsed, 3),
+            "loop_lag": {
+                "count": lag.count,
+                "p50_ms": round(lag.quantile(0.5) * 1000, 3),
+                "p99_ms": round(lag.quantile(0.99) * 1000, 3),
+                "max_ms": round(max_lag * 1000, 3),
+            },
+            "callbacks": watch.count,
+            "slow_callbacks": watch.top(),
+        }
+        if sampler is not None:
+            file = path.with_suffix(".collapsed")
+            file.write_text(sampler.collapsed(), encoding="utf-8")
+            result.update(samples=sampler.samples, file=str(file))
+        else:
+            file = path.with_suffix(".pstats")
+            profile.dump_stats(str(file))
+            result.update(file=str(file), top=self._top_functions(profile))
+        self.captures += 1
+        self._prune()
+        logger.warning("性能分析完成: %s", file)
+        return result
+
+    @staticmethod
+    def _top_functions(profile: cProfile.Profile) -> List[dict]:
+        """按自身耗时排序的热点函数"""
+        stats = pstats.Stats(profile, stream=io.StringIO())
+        ranked = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:TOP_N]
+        return [{
+            "function": f"{name} ({os.path.basename(filename)}:{line})",
+            "calls": calls,
+            "self_ms": round(tottime * 1000, 3),
+            "cumulative_ms": round(cumtime * 1000, 3),
+        } for (filename, line, name), (_, calls, tottime, cumtime, _) in ranked]
+
+    def _prune(self):
+        """只保留最近keep_files个结果文件"""
+        files = sorted(self.output_dir.glob(f"{self.prefix}-*"), key=lambda file: file.stat().st_mtime)
+        for file in files[:-self.keep_files]:
+            try:
+                file.unlink()
+            except OSError as e:
+                logger.debug("删除性能分析文件失败: %s - %s", file, e)
+
+    def resolve(self, name: str) -> Optional[Path]:
+        """按文件名查找结果文件（不允许访问output_dir以外的路径）"""
+        file = self.output_dir / os.path.basename(name)
+        if not file.name.startswith(self.prefix) or not file.is_file():
+            return None
+        return file
+
+    def stats(self) -> dict:
+        return {
+            "busy": self._busy,
+            "captures": self.captures,
+            "output_dir": str(self.output_dir),
+            "files": sorted(file.name for file in self.output_dir.glob(f"{self.prefix}-*"))
+            if self.output_dir.is_dir() else [],
+        }
@@ -0,0 +1,152 @@
+# 按密钥管理的订阅者注册表
+import asyncio
+import logging
+import weakref
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src.connection import ClientConnection
+from src.subscription import event_type as peek_event_type
+
+logger = logging.getLogger("QQwebhook")
+
+# 投递模式
+MODE_REPLACE = "replace"            # 仅保留最新连接（旧行为）
+MODE_BROADCAST = "broadcast"        # 推送给全部订阅者
+MODE_ROUND_ROBIN = "round_robin"    # 订阅者间轮询
+MODE_LEAST_QUEUE = "least_queue"    # 推送给队列最短的订阅者
+DELIVERY_MODES = (MODE_REPLACE, MODE_BROADCAST, MODE_ROUND_ROBIN, MODE_LEAST_QUEUE)
+BALANCED_MODES = (MODE_ROUND_ROBIN, MODE_LEAST_QUEUE)
+
+
+class SubscriberSet:
+    """同一密钥下的订阅者集合（成员为写时复制的元组，投递时无需加锁）"""
+
+    def __init__(self, secret: str, mode: str):
+        self.secret = secret
+        self.mode = mode
+        self.members: Tuple[ClientConnection, ...] = ()
+        self.filtered = False
+        self._next = 0
+
+    def refresh_filters(self):
+        """订阅者或其订阅条件变化后调用：仅在有订阅者设置过滤时才提取事件类型"""
+        self.filtered = any(conn.events is not None for conn in self.members)
+
+    def event_type(self, body: bytes) -> Optional[str]:
+        return peek_event_type(body) if self.filtered else None
+
+    def accepts(self, event_type: Optional[str]) -> bool:
+        """是否有订阅者需要该类型的事件"""
+        if event_type is None or not self.filtered:
+            return True
+        return any(conn.accepts(event_type) for conn in self.members)
+
+    def deliver(self, body: bytes, event_type: Optional[str] = None, received: Optional[float] = None,
+                lane: Optional[int] = None) -> bool:
+        """按投递模式将事件放入订阅者队列，至少一个订阅者接收时返回True
+
+        设置了订阅过滤时只在订阅该事件类型的订阅者中投递；没有订阅者需要该事件时视为已处理，返回True。
+        received为收到Webhook的时间（perf_counter），供信封模式的连接统计端到端延迟；
+        lane为优先级通道序号，未指定时由各连接按事件类型分类。
+        """
+        members = self.members
+        if not members:
+            return False
+        if self.filtered:
+            if event_type is None:
+                event_type = self.event_type(body)
+            if event_type is not None:
+                matched = tuple(conn for conn in members if conn.accepts(event_type))
+                if len(matched) != len(members):
+                    for conn in members:
+                        if not conn.accepts(event_type):
+                            conn.filtered += 1
+                    if not matched:
+                        return True
+                    members = matched
+        if self.mode == MODE_ROUND_ROBIN:
+            count = len(members)
+            for i in range(count):
+                conn = members[(self._next + i) % count]
+                if conn.enqueue(body, received, lane):
+                    self._next = (self._next + i + 1) % count
+                    return True
+            return False
+        if self.mode == MODE_LEAST_QUEUE:
+            for conn in sorted(members, key=lambda c: len(c.queue)):
+                if conn.enqueue(body, received, lane):
+                    return True
+            return False
+        delivered = False
+        for conn in members:
+            if conn.enqueue(body, received, lane):
+                delivered = True
+        return delivered
+
+
+class ConnectionRegistry:
+    """连接注册表：密钥 -> 订阅者集合
+
+    查询与投递均为同步操作，在事件循环内天然原子，热路径无需任何锁；
+    仅同一密钥的注册流程（回放离线缓存、替换旧连接）通过按密钥的锁串行化，
+    关闭旧连接等网络操作由调用方在锁外完成。
+    """
+
+    def __init__(self, default_mode: str = MODE_REPLACE, modes: Optional[Dict[str, str]] = None,
+                 max_subscribers: int = 16):
+        self.default_mode = default_mode if default_mode in DELIVERY_MODES else MODE_REPLACE
+        self.modes = {k: v for k, v in (modes or {}).items() if v in DELIVERY_MODES}
+        self.max_subscribers = max_subscribers
+        self._sets: Dict[str, SubscriberSet] = {}
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def mode_for(self, secret: str) -> str:
+        return self.modes.get(secret, self.default_mode)
+
+    def get(self, secret: str) -> Optional[SubscriberSet]:
+        return self._sets.get(secret)
+
+    def registration_lock(self, secret: str) -> asyncio.Lock:
+        """获取密钥对应的注册锁，无人持有时自动回收"""
+        lock = self._locks.get(secret)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[secret] = lock
+        return lock
+
+    def add(self, conn: ClientConnection) -> List[ClientConnection]:
+        """注册连接，返回需要关闭的被替换连接（由调用方在注册表外关闭）"""
+        subscribers = self._sets.get(conn.secret)
+        if subscribers is None:
+            subscribers = SubscriberSet(conn.secret, self.mode_for(conn.secret))
+            self._sets[conn.secret] = subscribers
+        members = subscribers.members
+        evicted = []
+        if subscribers.mode == MODE_REPLACE:
+            evicted = list(members)
+            members = ()
+        elif len(members) >= self.max_subscribers:
+            evicted = [members[0]]
+            members = members[1:]
+        subscribers.members = members + (conn,)
+        subscribers.refresh_filters()
+        return evicted
+
+    def remove(self, conn: ClientConnection) -> bool:
+        """注销连接，连接不在注册表中时返回False"""
+        subscribers = self._sets.get(conn.secret)
+        if subscribers is None or conn not in subscribers.members:
+            return False
+        subscribers.members = tuple(c for c in subscribers.members if c is not conn)
+        if not subscribers.members:
+            del self._sets[conn.secret]
+        else:
+            subscribers.refresh_filters()
+        return True
+
+    def connections(self) -> Iterator[ClientConnection]:
+        for subscribers in self._sets.values():
+            yield from subscribers.members
+
+    def __len__(self) -> int:
+        return sum(len(s.members) for s in self._sets.values())
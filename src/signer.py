@@ -0,0 +1,153 @@
+# Ed25519签名引擎
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+# Ed25519签名固定为64字节（128个十六进制字符）
+SIGNATURE_HEX_LENGTH = 128
+# Webhook签名时间戳与本机时间允许的最大偏差（秒），超出时视为过期或重放的请求
+DEFAULT_MAX_AGE = 300
+
+
+class KeyPair:
+    """单个机器人密钥派生出的私钥/公钥对"""
+    __slots__ = ("private_key", "public_key")
+
+    def __init__(self, private_key: "Ed25519PrivateKey"):
+        self.private_key = private_key
+        self.public_key = private_key.public_key()
+
+
+class SignatureEngine:
+    """带LRU密钥缓存的签名/验签引擎，高负载时将运算转入线程池"""
+
+    def __init__(self, cache_size: int = 1024, offload_rate: int = 2000, max_workers: int = 4,
+                 max_age: float = DEFAULT_MAX_AGE):
+        self.cache_size = cache_size
+        self.offload_rate = offload_rate
+        self.max_workers = max_workers
+        self.max_age = max_age
+        self._keys: "OrderedDict[str, KeyPair]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._window_start = 0.0
+        self._window_ops = 0
+
+    def configure(self, cache_size: int = None, offload_rate: int = None, max_workers: int = None,
+                  max_age: float = None):
+        """按配置调整缓存上限、线程池参数与时间戳有效期"""
+        if max_age is not None:
+            self.max_age = max(float(max_age), 0.0)
+        if cache_size is not None:
+            self.cache_size = max(1, cache_size)
+            with self._lock:
+                while len(self._keys) > self.cache_size:
+                    self._keys.popitem(last=False)
+        if offload_rate is not None:
+            self.offload_rate = offload_rate
+        if max_workers is not None and max_workers != self.max_workers:
+            self.max_workers = max_workers
+            self.shutdown()
+
+    @staticmethod
+    def _seed(bot_secret: str) -> bytes:
+        """将机器人密钥补齐为32字节种子"""
+        if len(bot_secret) < 32:
+            bot_secret = (bot_secret * (32 // len(bot_secret) + 1))[:32]
+        return bot_secret.encode()
+
+    def get_keys(self, bot_secret: str) -> KeyPair:
+        """获取（必要时派生并缓存）密钥对"""
+        with self._lock:
+            pair = self._keys.get(bot_secret)
+            if pair is not None:
+                self._keys.move_to_end(bot_secret)
+                return pair
+
+        # cryptography在首次派生密钥时导入，缩短启动时间
+        from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+        pair = KeyPair(Ed25519PrivateKey.from_private_bytes(self._seed(bot_secret)))
+        with self._lock:
+            self._keys[bot_secret] = pair
+            self._keys.move_to_end(bot_secret)
+            if len(self._keys) > self.cache_size:
+                self._keys.popitem(last=False)
+        return pair
+
+    def evict(self, bot_secret: str):
+        """移除指定密钥的缓存"""
+        with self._lock:
+            self._keys.pop(bot_secret, None)
+
+    def clear(self):
+        """清空密钥缓存"""
+        with self._lock:
+            self._keys.clear()
+
+    def sign(self, bot_secret: str, message: bytes) -> str:
+        """同步签名，返回十六进制签名"""
+        return self.get_keys(bot_secret).private_key.sign(message).hex()
+
+    def fresh(self, timestamp: Optional[str], now: float = None) -> bool:
+        """签名时间戳（Unix秒）是否在本机时间前后max_age秒内，max_age为0时不检查；格式不合法时返回False"""
+        if not self.max_age:
+            return True
+        try:
+            value = float(timestamp)
+        except (TypeError, ValueError):
+            return False
+        now = time.time() if now is None else now
+        # NaN与任何值比较均为False，同样视为不合法
+        return abs(now - value) <= self.max_age
+
+    def verify(self, bot_secret: str, signature_hex: Optional[str], message: bytes) -> bool:
+        """同步验签，签名格式不合法时不进行任何密码学运算"""
+        if not signature_hex or len(signature_hex) != SIGNATURE_HEX_LENGTH:
+            return False
+        try:
+            signature = bytes.fromhex(signature_hex)
+        except ValueError:
+            return False
+        public_key = self.get_keys(bot_secret).public_key
+        from cryptography.exceptions import InvalidSignature
+        try:
+            public_key.verify(signature, message)
+            return True
+        except InvalidSignature:
+            return False
+
+    async def _run(self, func, *args):
+        """每秒运算次数未超过阈值时直接在事件循环中执行，否则转入线程池"""
+        now = time.monotonic()
+        if now - self._window_start >= 1.0:
+            self._window_start = now
+            self._window_ops = 0
+        self._window_ops += 1
+        if self._window_ops <= self.offload_rate:
+            return func(*args)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="signer")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def sign_async(self, bot_secret: str, message: bytes) -> str:
+        """异步签名"""
+        return await self._run(self.sign, bot_secret, message)
+
+    async def verify_async(self, bot_secret: str, signature_hex: Optional[str], message: bytes) -> bool:
+        """异步验签"""
+        if not signature_hex or len(signature_hex) != SIGNATURE_HEX_LENGTH:
+            return False
+        return await self._run(self.verify, bot_secret, signature_hex, message)
+
+    def shutdown(self):
+        """关闭线程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+# 全局签名引擎
+signature_engine = SignatureEngine()
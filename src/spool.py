@@ -0,0 +1,300 @@
+# 离线消息缓存（按密钥分段的追加日志）
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows：不支持文件锁，视为独占
+    fcntl = None
+
+logger = logging.getLogger("QQwebhook")
+
+# 记录头：负载长度(u32) + 偏移量(u64) + 写入时间(f64)，长度为0表示数据结束
+RECORD_HEADER = struct.Struct("<IQd")
+SEGMENT_SUFFIX = ".log"
+CURSOR_FILE = "cursor"
+
+
+class Segment:
+    """单个内存映射的日志分段文件"""
+
+    def __init__(self, path: Path, base_offset: int, capacity: int = 0):
+        self.path = path
+        self.base_offset = base_offset
+        self.position = 0
+        self.next_offset = base_offset
+        self.sealed = capacity == 0
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        if capacity:
+            # 新分段：预分配空间并映射
+            self._file = open(path, "w+b")
+            self._file.truncate(capacity)
+            self._map = mmap.mmap(self._file.fileno(), capacity)
+
+    @property
+    def capacity(self) -> int:
+        return len(self._map) if self._map is not None else 0
+
+    def append(self, offset: int, body: bytes, timestamp: float) -> bool:
+        """写入一条记录，空间不足时返回False"""
+        end = self.position + RECORD_HEADER.size + len(body)
+        if self._map is None or end > len(self._map):
+            return False
+        RECORD_HEADER.pack_into(self._map, self.position, len(body), offset, timestamp)
+        self._map[self.position + RECORD_HEADER.size:end] = body
+        self.position = end
+        self.next_offset = offset + 1
+        return True
+
+    def flush(self):
+        """将已写入的数据同步到磁盘"""
+        if self._map is not None and self.position:
+            self._map.flush()
+
+    def seal(self):
+        """封存分段：同步数据、解除映射并截断到实际长度"""
+        if self._map is None:
+            return
+        self._map.flush()
+        self._map.close()
+        self._map = None
+        self._file.truncate(self.position)
+        self._file.close()
+        self._file = None
+        self.sealed = True
+
+    def records(self, start_offset: int = 0) -> Iterator[Tuple[int, bytes]]:
+        """顺序读取偏移量不小于start_offset的记录"""
+        if self._map is not None:
+            yield from _scan(self._map, self.position, start_offset)
+            return
+        size = self.path.stat().st_size
+        if not size:
+            return
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as m:
+            yield from _scan(m, size, start_offset)
+
+    def recover(self):
+        """扫描已存在的分段，恢复写入位置与下一个偏移量"""
+        size = self.path.stat().st_size
+        if not size:
+            return
+        with open(self.path, "r+b") as f:
+            with mmap.mmap(f.fileno(), size) as m:
+                position = 0
+                while position + RECORD_HEADER.size <= size:
+                    length, offset, _ = RECORD_HEADER.unpack_from(m, position)
+                    if not length or position + RECORD_HEADER.size + length > size:
+                        break
+                    position += RECORD_HEADER.size + length
+                    self.next_offset = offset + 1
+            # 去掉预分配但未使用的尾部
+            if position < size:
+                f.truncate(position)
+        self.position = position
+
+
+def _scan(buf, limit: int, start_offset: int) -> Iterator[Tuple[int, bytes]]:
+    position = 0
+    while position + RECORD_HEADER.size <= limit:
+        length, offset, _ = RECORD_HEADER.unpack_from(buf, position)
+        if not length:
+            break
+        begin = position + RECORD_HEADER.size
+        position = begin + length
+        if offset >= start_offset:
+            yield offset, bytes(buf[begin:position])
+
+
+class SecretLog:
+    """单个机器人密钥的追加日志"""
+
+    def __init__(self, directory: Path, spool: "Spool"):
+        self.directory = directory
+        self.spool = spool
+        self.segments: List[Segment] = []
+        self.next_offset = 1
+        self.cursor = 0
+        self._dirty = 0
+        directory.mkdir(parents=True, exist_ok=True)
+        self._recover()
+
+    def _recover(self):
+        """从磁盘恢复分段列表与消费游标"""
+        for path in sorted(self.directory.glob(f"*{SEGMENT_SUFFIX}")):
+            segment = Segment(path, int(path.stem))
+            segment.recover()
+            if not segment.position:
+                path.unlink()
+                continue
+            self.segments.append(segment)
+        if self.segments:
+            self.next_offset = max(self.segments[-1].next_offset, self.segments[-1].base_offset)
+        cursor_path = self.directory / CURSOR_FILE
+        if cursor_path.exists():
+            try:
+                self.cursor = int(cursor_path.read_text().strip() or 0)
+            except ValueError:
+                self.cursor = 0
+        # 分段全部清理后偏移量仍需保持单调递增
+        self.next_offset = max(self.next_offset, self.cursor + 1)
+
+    def _active(self, size: int) -> Segment:
+        """获取可写入size字节的当前分段，必要时滚动新分段"""
+        active = self.segments[-1] if self.segments else None
+        if active is not None and not active.sealed and active.position + size <= active.capacity:
+            return active
+        if active is not None:
+            active.seal()
+        capacity = max(self.spool.segment_bytes, size)
+        path = self.directory / f"{self.next_offset:020d}{SEGMENT_SUFFIX}"
+        segment = Segment(path, self.next_offset, capacity)
+        self.segments.append(segment)
+        self.enforce_retention()
+        return segment
+
+    def append(self, body: bytes) -> int:
+        """追加一条事件，返回其偏移量"""
+        offset = self.next_offset
+        segment = self._active(RECORD_HEADER.size + len(body))
+        segment.append(offset, body, time.time())
+        self.next_offset = offset + 1
+        self._dirty += 1
+        if self._dirty >= self.spool.commit_records:
+            self.flush()
+        return offset
+
+    def read(self, start_offset: int, limit: int = 256) -> List[Tuple[int, bytes]]:
+        """从start_offset开始顺序读取至多limit条记录"""
+        batch = []
+        segments = self.segments
+        for index, segment in enumerate(segments):
+            following = segments[index + 1] if index + 1 < len(segments) else None
+            if following is not None and following.base_offset <= start_offset:
+                continue
+            for record in segment.records(start_offset):
+                batch.append(record)
+                if len(batch) >= limit:
+                    return batch
+        return batch
+
+    def commit_cursor(self, offset: int):
+        """记录已回放到的偏移量"""
+        if offset <= self.cursor:
+            return
+        self.cursor = offset
+        tmp_path = self.directory / f"{CURSOR_FILE}.tmp"
+        tmp_path.write_text(str(offset))
+        os.replace(tmp_path, self.directory / CURSOR_FILE)
+
+    def flush(self):
+        if self._dirty and self.segments:
+            self.segments[-1].flush()
+        self._dirty = 0
+
+    def enforce_retention(self):
+        """按总大小与时长删除最旧的已封存分段"""
+        now = time.time()
+        total = sum(s.position for s in self.segments)
+        while len(self.segments) > 1 and self.segments[0].sealed:
+            oldest = self.segments[0]
+            try:
+                expired = now - oldest.path.stat().st_mtime > self.spool.max_age
+            except FileNotFoundError:
+                expired = True
+            if total <= self.spool.max_bytes and not expired:
+                break
+            total -= oldest.position
+            self.segments.pop(0)
+            try:
+                oldest.path.unlink()
+            except FileNotFoundError:
+                pass
+            logger.info("离线缓存分段已清理: %s", oldest.path.name)
+
+    def close(self):
+        self.flush()
+        for segment in self.segments:
+            segment.seal()
+
+
+class Spool:
+    """离线消息缓存：每个密钥一个分段追加日志，按批次同步磁盘"""
+
+    def __init__(self, path: str, segment_bytes: int = 16 << 20, max_bytes: int = 256 << 20,
+                 max_age: float = 86400, commit_records: int = 64, commit_interval: float = 0.05):
+        self.root = Path(path)
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.commit_records = commit_records
+        self.commit_interval = commit_interval
+        self._logs: Dict[str, SecretLog] = {}
+        self._lock_file = None
+        self.owned = fcntl is None
+
+    def acquire(self, name: str = "spool") -> bool:
+        """尝试独占缓存目录（非阻塞）
+
+        平滑重启时新旧进程短暂共存，日志只允许单个进程写入：旧进程退出释放锁之前，新进程不读写缓存。
+        """
+        if self.owned:
+            return True
+        if self._lock_file is None:
+            self.root.mkdir(parents=True, exist_ok=True)
+            self._lock_file = open(self.root / f".{name}.lock", "a+b")
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        self.owned = True
+        return True
+
+    @staticmethod
+    def _dirname(secret: str) -> str:
+        """目录名使用密钥摘要，避免在磁盘上暴露密钥"""
+        return hashlib.sha256(secret.encode()).hexdigest()[:24]
+
+    def log(self, secret: str) -> SecretLog:
+        log = self._logs.get(secret)
+        if log is None:
+            log = SecretLog(self.root / self._dirname(secret), self)
+            self._logs[secret] = log
+        return log
+
+    def has_pending(self, secret: str) -> bool:
+        """是否存在尚未回放的事件"""
+        directory = self.root / self._dirname(secret)
+        if secret not in self._logs and not directory.exists():
+            return False
+        log = self.log(secret)
+        return log.next_offset - 1 > log.cursor
+
+    def append(self, secret: str, body: bytes) -> int:
+        return self.log(secret).append(body)
+
+    def flush_all(self):
+        """组提交：同步所有有未落盘数据的日志"""
+        for log in self._logs.values():
+            log.flush()
+
+    def enforce_retention(self):
+        for log in self._logs.values():
+            log.enforce_retention()
+
+    def close(self):
+        for log in self._logs.values():
+            log.close()
+        self._logs.clear()
+        if self._lock_file is not None:
+            # 关闭文件即释放锁
+            self._lock_file.close()
+            self._lock_file = None
+            self.owned = fcntl is None
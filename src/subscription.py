@@ -0,0 +1,80 @@
+# 按事件类型订阅（服务端过滤）
+import re
+from typing import Iterable, Optional, Union
+
+from src.peek import peek_fields
+
+# 末尾的顶层字段 ,"t":"TYPE"}（紧跟顶层对象的结束括号，不会是嵌套对象中的同名字段）
+_TAIL_TYPE = re.compile(rb',\s*"t"\s*:\s*"([A-Za-z0-9_]+)"\s*\}\s*$')
+TAIL_WINDOW = 96
+
+# QQ机器人intents与对应的事件类型
+INTENTS = {
+    "GUILDS": (1 << 0, (
+        "GUILD_CREATE", "GUILD_UPDATE", "GUILD_DELETE",
+        "CHANNEL_CREATE", "CHANNEL_UPDATE", "CHANNEL_DELETE",
+    )),
+    "GUILD_MEMBERS": (1 << 1, ("GUILD_MEMBER_ADD", "GUILD_MEMBER_UPDATE", "GUILD_MEMBER_REMOVE")),
+    "GUILD_MESSAGES": (1 << 9, ("MESSAGE_CREATE", "MESSAGE_DELETE")),
+    "GUILD_MESSAGE_REACTIONS": (1 << 10, ("MESSAGE_REACTION_ADD", "MESSAGE_REACTION_REMOVE")),
+    "DIRECT_MESSAGE": (1 << 12, ("DIRECT_MESSAGE_CREATE", "DIRECT_MESSAGE_DELETE")),
+    "GROUP_AND_C2C_EVENT": (1 << 25, (
+        "C2C_MESSAGE_CREATE", "FRIEND_ADD", "FRIEND_DEL", "C2C_MSG_REJECT", "C2C_MSG_RECEIVE",
+        "GROUP_AT_MESSAGE_CREATE", "GROUP_ADD_ROBOT", "GROUP_DEL_ROBOT", "GROUP_MSG_REJECT", "GROUP_MSG_RECEIVE",
+    )),
+    "INTERACTION": (1 << 26, ("INTERACTION_CREATE",)),
+    "MESSAGE_AUDIT": (1 << 27, ("MESSAGE_AUDIT_PASS", "MESSAGE_AUDIT_REJECT")),
+    "FORUMS_EVENT": (1 << 28, (
+        "FORUM_THREAD_CREATE", "FORUM_THREAD_UPDATE", "FORUM_THREAD_DELETE",
+        "FORUM_POST_CREATE", "FORUM_POST_DELETE", "FORUM_REPLY_CREATE", "FORUM_REPLY_DELETE",
+        "FORUM_PUBLISH_AUDIT_RESULT",
+    )),
+    "AUDIO_ACTION": (1 << 29, ("AUDIO_START", "AUDIO_FINISH", "AUDIO_ON_MIC", "AUDIO_OFF_MIC")),
+    "PUBLIC_GUILD_MESSAGES": (1 << 30, ("AT_MESSAGE_CREATE", "PUBLIC_MESSAGE_DELETE")),
+}
+
+
+def event_type(body: bytes) -> Optional[str]:
+    """读取事件顶层的类型字段t（不完整解析JSON），非分发事件返回None
+
+    平台推送的事件中t位于d之后、请求体末尾，先只匹配末尾几十个字节；不符合时再从头扫描顶层字段。
+    """
+    tail = _TAIL_TYPE.search(body, max(len(body) - TAIL_WINDOW, 0))
+    if tail is not None:
+        return tail.group(1).decode()
+    value = peek_fields(body, ("t",)).get("t")
+    return value if isinstance(value, str) else None
+
+
+def intent_events(intents: Union[int, str, Iterable[str]]) -> set:
+    """将intents（位掩码整数或名称列表）展开为事件类型集合"""
+    events = set()
+    if isinstance(intents, bool):
+        raise ValueError(f"无效的intents: {intents}")
+    if isinstance(intents, int):
+        for mask, names in INTENTS.values():
+            if intents & mask:
+                events.update(names)
+        return events
+    if isinstance(intents, str):
+        intents = [name for name in intents.split(",") if name]
+    for name in intents:
+        name = str(name).strip().upper()
+        if name not in INTENTS:
+            raise ValueError(f"未知的intent: {name}")
+        events.update(INTENTS[name][1])
+    return events
+
+
+def resolve_subscription(events=None, intents=None) -> Optional[frozenset]:
+    """合并事件类型与intents，均未指定时返回None（接收全部事件）"""
+    if events is None and intents is None:
+        return None
+    wanted = set()
+    if events is not None:
+        if isinstance(events, str):
+            events = events.split(",")
+        wanted.update(str(name).strip().upper() for name in events if str(name).strip())
+    if intents is not None:
+        wanted.update(intent_events(intents))
+    return frozenset(wanted) if wanted else None
@@ -0,0 +1,183 @@
+# 端到端延迟追踪：信封模式下为推送的事件分配中继ID与时间戳，客户端确认后统计各阶段延迟
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from time import perf_counter
+from typing import Dict, Iterable, List, Set, Tuple
+
+from src.function import mask_secret
+from src.metrics import TRACE_BUCKETS, TRACE_SECONDS, TRACE_UNACKED, HistogramChild
+
+logger = logging.getLogger("QQwebhook")
+
+# 延迟阶段：delivery（收到Webhook到推送给客户端）、processing（推送到客户端确认）、total（收到Webhook到客户端确认）
+STAGE_DELIVERY = "delivery"
+STAGE_PROCESSING = "processing"
+STAGE_TOTAL = "total"
+STAGES = (STAGE_DELIVERY, STAGE_PROCESSING, STAGE_TOTAL)
+
+
+def summarize(child: HistogramChild) -> dict:
+    return {
+        "count": child.count,
+        "p50_ms": round(child.quantile(0.5) * 1000, 3),
+        "p99_ms": round(child.quantile(0.99) * 1000, 3),
+    }
+
+
+class TraceSession:
+    """单个连接的追踪状态
+
+    事件的接收时间（perf_counter）与事件一同保存在出站队列中（(body, received) 元组），与出站队列的取出顺序无关；
+    pending按推送顺序保存尚未确认的事件：中继ID -> (接收时间, 推送时间)。
+    """
+    __slots__ = ("tracer", "secret", "label", "pending", "acked", "unacked", "processing", "histograms")
+
+    def __init__(self, tracer: "Tracer", secret: str):
+        self.tracer = tracer
+        self.secret = secret
+        self.label = mask_secret(secret)
+        self.pending: "OrderedDict[int, Tuple[float, float]]" = OrderedDict()
+        self.acked = 0
+        self.unacked = 0
+        # 本连接的处理延迟，用于找出同一密钥下较慢的工作进程
+        self.processing = HistogramChild(TRACE_BUCKETS)
+        self.histograms = tuple(TRACE_SECONDS.labels(self.label, stage) for stage in STAGES)
+
+    def envelope(self, items: Iterable[Tuple[bytes, float]], array: bool) -> bytes:
+        return self.tracer.envelope(self, items, array)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self.pending),
+            "acked": self.acked,
+            "unacked": self.unacked,
+            "processing": summarize(self.processing),
+        }
+
+
+class Tracer:
+    """全部信封模式连接共用的追踪器：分配中继ID、生成信封帧、处理确认并标记超时未确认的事件"""
+
+    def __init__(self, ack_timeout: float = 30.0, max_pending: int = 10000):
+        self.ack_timeout = ack_timeout
+        self.max_pending = max_pending
+        self.sessions: Set[TraceSession] = set()
+        self._next_rid = 0
+        self.unacked = 0
+
+    def configure(self, ack_timeout: float = None, max_pending: int = None):
+        if ack_timeout is not None:
+            self.ack_timeout = max(float(ack_timeout), 0.1)
+        if max_pending is not None:
+            self.max_pending = max(int(max_pending), 1)
+
+    def open(self, secret: str) -> TraceSession:
+        session = TraceSession(self, secret)
+        self.sessions.add(session)
+        return session
+
+    def close(self, session: TraceSession):
+        """连接断开：尚未确认的事件计为未确认"""
+        self.sessions.discard(session)
+        if session.pending:
+            logger.info("连接断开时有 %d 个事件未确认: %s", len(session.pending), session.secret)
+            self._flag(session, len(session.pending))
+            session.pending.clear()
+
+    def _flag(self, session: TraceSession, count: int):
+        session.unacked += count
+        self.unacked += count
+        TRACE_UNACKED.labels(session.label).inc(count)
+
+    def envelope(self, session: TraceSession, items: Iterable[Tuple[bytes, float]], array: bool) -> bytes:
+        """为即将推送的 (请求体, 接收时间) 事件分配中继ID并包装为信封，批量模式下合并为JSON数组帧"""
+        now = perf_counter()
+        wall = time.time() * 1000
+        delivery = session.histograms[0]
+        pending = session.pending
+        frames = []
+        for body, started in items:
+            self._next_rid += 1
+            rid = self._next_rid
+            pending[rid] = (started, now)
+            delivery.observe(now - started)
+            frames.append(b'{"op": "event", "rid": %d, "recv_ts": %.3f, "fwd_ts": %.3f, "event": %b}'
+                          % (rid, wall - (now - started) * 1000, wall, body))
+        overflow = len(pending) - self.max_pending
+        if overflow > 0:
+            # 客户端长期不确认时只保留最近的事件
+            for _ in range(overflow):
+                pending.popitem(last=False)
+            self._flag(session, overflow)
+        if array:
+            return b"[" + b",".join(frames) + b"]"
+        return frames[0]
+
+    def ack(self, session: TraceSession, rids: Iterable[int]) -> int:
+        """处理客户端确认，返回确认的事件数（未知或已超时的ID忽略）"""
+        now = perf_counter()
+        _, processing, total = session.histograms
+        acked = 0
+        for rid in rids:
+            entry = session.pending.pop(rid, None)
+            if entry is None:
+                continue
+            started, forwarded = entry
+            processing.observe(now - forwarded)
+            session.processing.observe(now - forwarded)
+            total.observe(now - started)
+            acked += 1
+        session.acked += acked
+        return acked
+
+    def sweep(self, now: float):
+        """将推送后超过ack_timeout仍未确认的事件标记为未确认"""
+        deadline = now - self.ack_timeout
+        for session in list(self.sessions):
+            pending = session.pending
+            expired = 0
+            while pending:
+                rid, (_, forwarded) = next(iter(pending.items()))
+                if forwarded > deadline:
+                    break
+                del pending[rid]
+                expired += 1
+            if expired:
+                logger.warning("%d 个事件超过 %.0f 秒未确认: %s", expired, self.ack_timeout, session.secret)
+                self._flag(session, expired)
+
+    async def run(self):
+        """后台任务：定期检查超时未确认的事件"""
+        while True:
+            await asyncio.sleep(min(max(self.ack_timeout / 4, 0.1), 1.0))
+            self.sweep(perf_counter())
+
+    def latency(self) -> Dict[str, dict]:
+        """按密钥（已脱敏）汇总的延迟分布"""
+        result: Dict[str, dict] = {}
+        for (label, stage), child in TRACE_SECONDS.children():
+            result.setdefault(label, {})[stage] = summarize(child)
+        for label, child in TRACE_UNACKED.children():
+            result.setdefault(label[0], {})["unacked"] = child.value
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "ack_timeout": self.ack_timeout,
+            "sessions": len(self.sessions),
+            "pending": sum(len(session.pending) for session in self.sessions),
+            "unacked": self.unacked,
+            "latency": self.latency(),
+        }
+
+
+def parse_rids(message: dict) -> List[int]:
+    """确认帧中的中继ID：{"op": "ack", "rid": 1} 或 {"op": "ack", "rids": [1, 2]}"""
+    rids = message.get("rids")
+    if rids is None:
+        rids = [message.get("rid")]
+    if not isinstance(rids, list):
+        raise ValueError("rids须为数组")
+    return [int(rid) for rid in rids if rid is not None]
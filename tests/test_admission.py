@@ -0,0 +1,221 @@
+import asyncio
+
+import pytest
+
+from src.admission import (AdmissionController, AdmissionMiddleware, PrefixSet, RateLimiter, REJECT_IP_RATE,
+                           REJECT_SECRET_RATE, REJECT_WHITELIST, REJECT_WS_LIMIT, parse_rate)
+
+
+def scope(*headers, client="10.0.0.1", kind="http", path="/webhook", query=b""):
+    return {"type": kind, "path": path, "query_string": query, "headers": list(headers), "client": (client, 50000)}
+
+
+# ---- parse_rate ----
+
+@pytest.mark.parametrize("value, expected", [
+    ("50/秒", (50.0, 50.0)),
+    ("1000/分钟", (1000 / 60, 1000.0)),
+    ("10/5s", (2.0, 10.0)),
+    ("7200/h", (2.0, 7200.0)),
+    ("86400/天", (1.0, 86400.0)),
+    ("20", (20.0, 20.0)),
+    (5, (5.0, 5.0)),
+    (" 3 / min ", (3 / 60, 3.0)),
+])
+def test_parse_rate(value, expected):
+    assert parse_rate(value) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("value", [None, "", 0, False])
+def test_parse_rate_unlimited(value):
+    assert parse_rate(value) is None
+
+
+@pytest.mark.parametrize("value", ["abc", "10/fortnight", "/s", "-1/s"])
+def test_parse_rate_invalid(value):
+    with pytest.raises(ValueError):
+        parse_rate(value)
+
+
+# ---- RateLimiter ----
+
+def test_rate_limiter_burst_and_refill():
+    limiter = RateLimiter(rate=2.0, burst=3)
+    assert [limiter.allow("k", 0.0) for _ in range(4)] == [True, True, True, False]
+    assert limiter.retry_after("k") == pytest.approx(0.5)
+    assert not limiter.allow("k", 0.25)
+    assert limiter.allow("k", 0.5)
+    # 长时间空闲后只补满到桶容量
+    assert [limiter.allow("k", 100.0) for _ in range(4)] == [True, True, True, False]
+
+
+def test_rate_limiter_keys_are_independent():
+    limiter = RateLimiter(rate=1.0, burst=1)
+    assert limiter.allow("a", 0.0)
+    assert not limiter.allow("a", 0.0)
+    assert limiter.allow("b", 0.0)
+    assert limiter.retry_after("missing") == 0.0
+
+
+def test_rate_limiter_bounded_keys():
+    limiter = RateLimiter(rate=1.0, burst=5, max_keys=10)
+    for i in range(10):
+        limiter.allow(f"idle-{i}", 0.0)
+    # 空闲的桶补满后在超限时清理
+    limiter.allow("new", 100.0)
+    assert len(limiter) == 1
+    for i in range(25):
+        limiter.allow(f"busy-{i}", 100.0)
+    assert len(limiter) <= 10
+
+
+# ---- PrefixSet ----
+
+def test_prefix_set_matches():
+    networks = PrefixSet(["192.168.1.0/24", "10.0.0.1", "::1", "2001:db8::/32"])
+    assert networks
+    assert "192.168.1.77" in networks
+    assert "192.168.2.1" not in networks
+    assert "10.0.0.1" in networks
+    assert "10.0.0.2" not in networks
+    assert "::1" in networks
+    assert "2001:db8:1::5" in networks
+    assert "2001:db9::1" not in networks
+    # IPv4映射的IPv6地址按IPv4匹配
+    assert "::ffff:192.168.1.5" in networks
+
+
+def test_prefix_set_invalid_input():
+    networks = PrefixSet(["0.0.0.0/0"])
+    assert "8.8.8.8" in networks
+    assert "not-an-ip" not in networks
+    assert "" not in networks
+    assert not PrefixSet([])
+    with pytest.raises(ValueError):
+        PrefixSet(["999.1.1.1"])
+
+
+# ---- client_ip ----
+
+def test_client_ip_ignores_headers_by_default():
+    controller = AdmissionController()
+    assert controller.client_ip(scope((b"x-forwarded-for", b"1.1.1.1"), (b"x-real-ip", b"2.2.2.2"))) == "10.0.0.1"
+
+
+def test_client_ip_uses_rightmost_forwarded_entry():
+    controller = AdmissionController()
+    controller.configure(trust_forwarded=True)
+    # 客户端伪造的条目在左侧，代理追加的真实地址在最右侧
+    assert controller.client_ip(scope((b"x-forwarded-for", b"6.6.6.6, 1.2.3.4"))) == "1.2.3.4"
+    assert controller.client_ip(scope()) == "10.0.0.1"
+
+
+def test_client_ip_trusted_hops():
+    controller = AdmissionController()
+    controller.configure(trust_forwarded=True, trusted_hops=2)
+    headers = ((b"x-forwarded-for", b"6.6.6.6, 1.2.3.4"), (b"x-forwarded-for", b"172.16.0.1"))
+    assert controller.client_ip(scope(*headers)) == "1.2.3.4"
+    # 条目数少于可信层数时取最左侧
+    assert controller.client_ip(scope((b"x-forwarded-for", b"1.2.3.4"))) == "1.2.3.4"
+
+
+def test_spoofed_real_ip_is_ignored_without_opt_in():
+    controller = AdmissionController()
+    controller.configure(whitelist=["1.2.3.0/24"], trust_forwarded=True)
+    spoofed = scope((b"x-real-ip", b"1.2.3.4"), (b"x-forwarded-for", b"6.6.6.6"))
+    assert controller.client_ip(spoofed) == "6.6.6.6"
+    assert controller.check_webhook(controller.client_ip(spoofed), None) == REJECT_WHITELIST
+
+
+def test_real_ip_opt_in():
+    controller = AdmissionController()
+    controller.configure(trust_forwarded=True, trust_real_ip=True)
+    assert controller.client_ip(scope((b"x-forwarded-for", b"6.6.6.6"), (b"x-real-ip", b" 1.2.3.4 "))) == "1.2.3.4"
+    assert controller.client_ip(scope((b"x-real-ip", b""), (b"x-forwarded-for", b"6.6.6.6"))) == "6.6.6.6"
+
+
+# ---- AdmissionController ----
+
+def test_check_webhook_limits():
+    controller = AdmissionController()
+    controller.configure(ip_rate_limit="2/s", rate_limit="3/s")
+    assert controller.check_webhook("1.1.1.1", "a") is None
+    assert controller.check_webhook("1.1.1.1", "a") is None
+    assert controller.check_webhook("1.1.1.1", "a") == REJECT_IP_RATE
+    assert controller.check_webhook("2.2.2.2", "a") is None
+    assert controller.check_webhook("3.3.3.3", "a") == REJECT_SECRET_RATE
+    assert controller.stats()["rejected"][REJECT_IP_RATE] == 1
+
+
+def test_configure_replaces_rules():
+    controller = AdmissionController()
+    controller.configure(whitelist=["10.0.0.0/8"])
+    assert controller.check_ip("8.8.8.8") == REJECT_WHITELIST
+    controller.configure()
+    assert controller.check_ip("8.8.8.8") is None
+    with pytest.raises(ValueError):
+        controller.configure(rate_limit="fast")
+
+
+# ---- AdmissionMiddleware ----
+
+class Recorder:
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self, scope, receive, send):
+        self.calls += 1
+
+
+def call_middleware(middleware, request_scope):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    asyncio.run(middleware(request_scope, receive, send))
+    return sent
+
+
+def test_middleware_rejects_before_app():
+    app = Recorder()
+    controller = AdmissionController()
+    controller.configure(rate_limit="1/分钟")
+    middleware = AdmissionMiddleware(app, controller)
+    assert call_middleware(middleware, scope(query=b"secret=abc")) == []
+    sent = call_middleware(middleware, scope(query=b"secret=abc"))
+    assert app.calls == 1
+    assert sent[0]["status"] == 429
+    assert dict(sent[0]["headers"])[b"retry-after"] == b"60"
+    # 其他密钥与其他路径不受影响
+    call_middleware(middleware, scope(query=b"secret=other"))
+    call_middleware(middleware, scope(path="/stats"))
+    assert app.calls == 3
+
+
+def test_middleware_whitelist_403():
+    app = Recorder()
+    controller = AdmissionController()
+    controller.configure(whitelist=["127.0.0.1"])
+    sent = call_middleware(AdmissionMiddleware(app, controller), scope())
+    assert sent[0]["status"] == 403 and app.calls == 0
+
+
+def test_middleware_websocket_connection_limit():
+    controller = AdmissionController()
+    controller.configure(ws_max_connections=1)
+    active = []
+
+    async def app(scope, receive, send):
+        active.append(controller.ws_active)
+
+    middleware = AdmissionMiddleware(app, controller)
+    call_middleware(middleware, scope(kind="websocket", path="/ws/abc"))
+    assert active == [1] and controller.ws_active == 0
+    controller.ws_active = 1
+    sent = call_middleware(middleware, scope(kind="websocket", path="/ws/abc"))
+    assert sent == [{"type": "websocket.close", "code": 1008}]
+    assert controller.stats()["rejected"][REJECT_WS_LIMIT] == 1
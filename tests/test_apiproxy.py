@@ -0,0 +1,195 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from src.apiproxy import (ApiProxy, ApiProxyError, RESULT_OK, RESULT_REJECTED, RESULT_TOKEN, error_frame,
+                          response_frame)
+
+
+class OpenApi:
+    """模拟的开放平台：签发编号递增的access_token，校验鉴权头并回显请求"""
+
+    def __init__(self, expires_in: float = 7200):
+        self.expires_in = expires_in
+        self.issued = 0
+        self.revoked = set()
+        self.requests = []
+        self.fail_token = False
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/app/getAppAccessToken":
+            if self.fail_token:
+                return httpx.Response(500, json={"message": "busy"})
+            self.issued += 1
+            return httpx.Response(200, json={"access_token": f"token-{self.issued}",
+                                             "expires_in": str(self.expires_in)})
+        self.requests.append(request)
+        token = request.headers["authorization"].split(" ", 1)[1]
+        if token in self.revoked:
+            return httpx.Response(401, json={"message": "invalid token"})
+        return httpx.Response(200, json={"path": request.url.path, "token": token,
+                                         "appid": request.headers["x-union-appid"]})
+
+
+def make_proxy(api: OpenApi, **kwargs) -> ApiProxy:
+    proxy = ApiProxy(base_url="https://api.test", token_url="https://bots.test/app/getAppAccessToken",
+                     http2=False, **kwargs)
+    proxy._clients = [httpx.AsyncClient(transport=httpx.MockTransport(api))]
+    return proxy
+
+
+class FakeConnection:
+    def __init__(self, secret="secret"):
+        self.secret = secret
+        self.controls = []
+
+    def send_control(self, frame: bytes):
+        self.controls.append(json.loads(frame))
+
+
+def test_response_frames():
+    assert json.loads(response_frame(1, 200, "application/json", b'{"a":1}')) == {
+        "op": "api", "id": 1, "status": 200, "body": {"a": 1}}
+    assert json.loads(response_frame("x", 204, "", b"")) == {"op": "api", "id": "x", "status": 204, "body": None}
+    assert json.loads(response_frame(2, 502, "text/plain", "网关".encode()))["body"] == "网关"
+    assert json.loads(error_frame(3, "失败")) == {"op": "api", "id": 3, "error": "失败"}
+
+
+def test_call_uses_cached_token():
+    async def scenario():
+        api = OpenApi()
+        proxy = make_proxy(api)
+        results = [await proxy.call("secret", "1001", "get", "/users/@me") for _ in range(3)]
+        await proxy.close()
+        return api, results
+
+    api, results = asyncio.run(scenario())
+    assert api.issued == 1
+    status, content_type, content = results[-1]
+    assert status == 200 and content_type.startswith("application/json")
+    assert json.loads(content) == {"path": "/users/@me", "token": "token-1", "appid": "1001"}
+
+
+def test_concurrent_calls_share_one_token_fetch():
+    async def scenario():
+        api = OpenApi()
+        proxy = make_proxy(api)
+        await asyncio.gather(*(proxy.call("secret", "1001", "GET", "/x") for _ in range(10)))
+        await proxy.close()
+        return api
+
+    assert asyncio.run(scenario()).issued == 1
+
+
+def test_background_refresh_before_expiry():
+    async def scenario():
+        api = OpenApi(expires_in=0.3)
+        proxy = make_proxy(api, refresh_before=0.2)
+        await proxy.call("secret", "1001", "GET", "/x")
+        # 到期前0.2秒在后台刷新，请求无需等待获取
+        await asyncio.sleep(0.15)
+        issued = api.issued
+        _, _, content = await proxy.call("secret", "1001", "GET", "/x")
+        await proxy.close()
+        return issued, json.loads(content)["token"]
+
+    issued, token = asyncio.run(scenario())
+    assert issued == 2
+    assert token == "token-2"
+
+
+def test_unused_token_is_not_renewed():
+    async def scenario():
+        api = OpenApi(expires_in=0.2)
+        proxy = make_proxy(api, refresh_before=0.1)
+        await proxy.call("secret", "1001", "GET", "/x")
+        await asyncio.sleep(0.15)
+        # 续期后的token未被使用，下次到期时不再续期
+        await asyncio.sleep(0.3)
+        issued = api.issued
+        await proxy.close()
+        return issued
+
+    assert asyncio.run(scenario()) == 2
+
+
+def test_failed_background_refresh_keeps_current_token():
+    async def scenario():
+        api = OpenApi(expires_in=0.4)
+        proxy = make_proxy(api, refresh_before=0.3)
+        await proxy.call("secret", "1001", "GET", "/x")
+        api.fail_token = True
+        await asyncio.sleep(0.15)
+        _, _, content = await proxy.call("secret", "1001", "GET", "/x")
+        await proxy.close()
+        return json.loads(content)["token"], proxy.token_fetches
+
+    token, fetches = asyncio.run(scenario())
+    assert token == "token-1" and fetches >= 2
+
+
+def test_revoked_token_is_refetched_once():
+    async def scenario():
+        api = OpenApi()
+        proxy = make_proxy(api)
+        await proxy.call("secret", "1001", "GET", "/x")
+        api.revoked.add("token-1")
+        status, _, content = await proxy.call("secret", "1001", "GET", "/x")
+        await proxy.close()
+        return api, status, json.loads(content)
+
+    api, status, body = asyncio.run(scenario())
+    assert status == 200 and body["token"] == "token-2"
+    assert api.issued == 2
+
+
+@pytest.mark.parametrize("method, path", [("TRACE", "/x"), ("GET", "https://evil.test/"), ("GET", "//evil.test"),
+                                          ("GET", None)])
+def test_rejects_invalid_requests(method, path):
+    async def scenario():
+        proxy = make_proxy(OpenApi())
+        try:
+            await proxy.call("secret", "1001", method, path)
+        finally:
+            await proxy.close()
+
+    with pytest.raises(ApiProxyError) as raised:
+        asyncio.run(scenario())
+    assert raised.value.result == RESULT_REJECTED
+
+
+def test_only_allowed_headers_are_forwarded():
+    async def scenario():
+        api = OpenApi()
+        proxy = make_proxy(api)
+        await proxy.call("secret", "1001", "POST", "/x", {"content": "你好"},
+                         {"X-Request-Id": "r1", "Authorization": "QQBot forged", "Cookie": "c"})
+        await proxy.close()
+        return api.requests[0]
+
+    request = asyncio.run(scenario())
+    assert request.headers["x-request-id"] == "r1"
+    assert request.headers["authorization"] == "QQBot token-1"
+    assert "cookie" not in request.headers
+    assert json.loads(request.content) == {"content": "你好"}
+
+
+def test_handle_sends_control_frames():
+    async def scenario():
+        api = OpenApi()
+        proxy = make_proxy(api)
+        conn = FakeConnection()
+        await proxy.handle(conn, {"op": "api", "id": 1, "path": "/x"})
+        proxy.learn_appid("secret", "1001")
+        await proxy.handle(conn, {"op": "api", "id": 2, "path": "/x"})
+        api.fail_token = True
+        await proxy.handle(FakeConnection("other"), {"op": "api", "id": 3, "appid": "1002", "path": "/x"})
+        await proxy.close()
+        return conn.controls, proxy.results
+
+    controls, results = asyncio.run(scenario())
+    assert "appid" in controls[0]["error"]
+    assert controls[1]["status"] == 200 and controls[1]["id"] == 2
+    assert results[RESULT_REJECTED] == 1 and results[RESULT_OK] == 1 and results[RESULT_TOKEN] == 1
@@ -0,0 +1,132 @@
+import asyncio
+import socket
+
+import pytest
+
+from src.cluster import (ENV_RUN_DIR, ENV_WORKER_COUNT, ENV_WORKER_ID, OP_DELIVER, OP_DEDUP, OP_EVICT,
+                         ClusterRouter, bind_reuse_port, decode_records, encode_records, port_in_use,
+                         release_worker, supports_reuse_port)
+
+requires_unix = pytest.mark.skipif(not supports_reuse_port(), reason="平台不支持SO_REUSEPORT或Unix域套接字")
+
+
+def test_records_round_trip():
+    records = [(1, b"first"), (2, b""), (2 ** 40, "中文".encode() * 100)]
+    assert decode_records(encode_records(records)) == records
+    assert decode_records(b"") == []
+
+
+def test_port_in_use():
+    with socket.socket() as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        port = server.getsockname()[1]
+        assert port_in_use("0.0.0.0", port)
+        assert port_in_use("127.0.0.1", port)
+    assert not port_in_use("127.0.0.1", port)
+
+
+@requires_unix
+def test_bind_reuse_port_allows_shared_port():
+    first = bind_reuse_port("127.0.0.1", 0)
+    try:
+        port = first.getsockname()[1]
+        second = bind_reuse_port("127.0.0.1", port)
+        assert second.getsockname()[1] == port
+        assert second.get_inheritable()
+        second.close()
+    finally:
+        first.close()
+
+
+def test_from_env(monkeypatch, tmp_path):
+    monkeypatch.delenv(ENV_WORKER_ID, raising=False)
+    monkeypatch.delenv(ENV_RUN_DIR, raising=False)
+    assert ClusterRouter.from_env() is None
+    monkeypatch.setenv(ENV_WORKER_ID, "2")
+    monkeypatch.setenv(ENV_WORKER_COUNT, "4")
+    monkeypatch.setenv(ENV_RUN_DIR, str(tmp_path))
+    router = ClusterRouter.from_env()
+    assert (router.worker_id, router.worker_count, router.run_dir) == (2, 4, tmp_path)
+
+
+def test_home_worker_is_stable_and_shared(tmp_path):
+    routers = [ClusterRouter(worker_id, 4, str(tmp_path)) for worker_id in range(4)]
+    for secret in ("a", "b", "c", "secret-with-中文"):
+        homes = {router.home_worker(secret) for router in routers}
+        assert len(homes) == 1
+        assert sum(router.is_home(secret) for router in routers) == 1
+        assert 0 <= homes.pop() < 4
+
+
+def test_owner_claims(tmp_path):
+    first = ClusterRouter(0, 3, str(tmp_path))
+    second = ClusterRouter(1, 3, str(tmp_path))
+    third = ClusterRouter(2, 3, str(tmp_path))
+    second.claim("s")
+    third.claim("s")
+    assert sorted(first.owners("s")) == [1, 2]
+    # 自身不计入归属进程
+    assert sorted(second.owners("s")) == [2]
+    assert first.owners("missing") == []
+    release_worker(tmp_path, 2)
+    first._owner_cache.clear()
+    assert first.owners("s") == [1]
+    second.release("s")
+    second.release("s")
+    first._owner_cache.clear()
+    assert first.owners("s") == []
+
+
+@requires_unix
+def test_routing_between_workers(tmp_path):
+    async def scenario():
+        first = ClusterRouter(0, 2, str(tmp_path))
+        second = ClusterRouter(1, 2, str(tmp_path))
+        received = []
+
+        async def deliver(secret, body):
+            received.append((secret, body))
+            return b"\x01"
+
+        async def broken(secret, body):
+            raise RuntimeError("boom")
+
+        second.handlers.update({OP_DELIVER: deliver, OP_DEDUP: broken})
+        await first.start()
+        await second.start()
+        try:
+            second.claim("s")
+            replies = await asyncio.gather(*(first.call(1, OP_DELIVER, "s", b"%d" % i) for i in range(5)))
+            forwarded = await first.forward("s", b"via-forward")
+            # 处理失败与未注册的操作码应答空负载，连接保持可用
+            failed = await first.call(1, OP_DEDUP, "s", b"\x01key")
+            unknown = await first.call(1, OP_EVICT, "s")
+            after = await first.call(1, OP_DELIVER, "s", b"after")
+            not_forwarded = await first.forward("nobody", b"x")
+        finally:
+            await first.stop()
+            await second.stop()
+        return received, replies, forwarded, failed, unknown, after, not_forwarded
+
+    received, replies, forwarded, failed, unknown, after, not_forwarded = asyncio.run(scenario())
+    assert replies == [b"\x01"] * 5
+    # 同一连接上的请求按顺序流水线处理
+    assert [body for _, body in received] == [b"0", b"1", b"2", b"3", b"4", b"via-forward", b"after"]
+    assert forwarded and not not_forwarded
+    assert failed == b"" and unknown == b"" and after == b"\x01"
+    assert not list(tmp_path.glob("*.sock"))
+
+
+@requires_unix
+def test_unreachable_worker(tmp_path):
+    async def scenario():
+        router = ClusterRouter(0, 2, str(tmp_path))
+        # 归属文件残留，但对端进程未在监听
+        ClusterRouter(1, 2, str(tmp_path)).claim("s")
+        with pytest.raises(OSError):
+            await router.call(1, OP_DELIVER, "s", b"x")
+        # 转发与驱逐在对端不可达时返回失败，不抛出异常
+        return await router.forward("s", b"x"), await router.evict("s")
+
+    assert asyncio.run(scenario()) == (False, 0)
@@ -0,0 +1,165 @@
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+from src.config import ENV_CACHE_DIR, ConfigManager, _cache_dir
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    """在临时目录中创建独立的配置管理器（配置文件与缓存目录均位于tmp_path）"""
+    monkeypatch.setattr(sys, "argv", [str(tmp_path / "main.py")])
+    monkeypatch.setenv(ENV_CACHE_DIR, str(tmp_path / "cache"))
+    monkeypatch.setattr(ConfigManager, "_instance", None)
+    monkeypatch.setattr(ConfigManager, "_snapshot", None)
+    (tmp_path / "config.yaml").write_text("推送队列:\n  max_size: 10\n", encoding="utf-8")
+    manager = ConfigManager()
+    yield manager
+    manager.stop_watcher()
+
+
+# ---- 解析缓存 ----
+
+def test_cache_dir_env(monkeypatch, tmp_path):
+    monkeypatch.setenv(ENV_CACHE_DIR, str(tmp_path))
+    assert _cache_dir() == tmp_path
+    for value in ("", "off", "0"):
+        monkeypatch.setenv(ENV_CACHE_DIR, value)
+        assert _cache_dir() is None
+    monkeypatch.delenv(ENV_CACHE_DIR)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    if sys.platform != "win32":
+        assert _cache_dir() == tmp_path / "qqwebhook"
+
+
+def test_cache_is_private_and_not_next_to_config(manager, tmp_path):
+    manager.snapshot()
+    cache = manager._cache_path()
+    assert cache.parent == tmp_path / "cache" and cache.exists()
+    assert not list(tmp_path.glob(".*cache*"))
+    if sys.platform != "win32":
+        assert cache.parent.stat().st_mode & 0o777 == 0o700
+        assert cache.stat().st_mode & 0o777 == 0o600
+
+
+def test_cache_is_lossless(manager, tmp_path):
+    (tmp_path / "config.yaml").write_text("映射:\n  1: 一\n  false: 否\n  2.5: [1, null]\n", encoding="utf-8")
+    parsed = manager._load_config()
+    cached = manager._read_cache(manager._file_stat())
+    assert cached == {"映射": {1: "一", False: "否", 2.5: [1, None]}}
+    assert [type(key) for key in cached["映射"]] == [int, bool, float]
+    assert manager._load_config().get("映射") == parsed.get("映射")
+
+
+def test_cache_keyed_on_stat(manager, tmp_path):
+    stat = manager._file_stat()
+    manager._load_config()
+    assert manager._read_cache(stat) is not None
+    assert manager._read_cache((stat[0] + 1, stat[1])) is None
+    (tmp_path / "config.yaml").write_text("推送队列:\n  max_size: 20\n", encoding="utf-8")
+    assert manager._load_config().get("推送队列.max_size") == 20
+
+
+def test_unmarshallable_values_are_not_cached(manager, tmp_path):
+    (tmp_path / "config.yaml").write_text("日期: 2024-01-01\n", encoding="utf-8")
+    snapshot = manager._load_config()
+    assert snapshot.get("日期").year == 2024
+    assert manager._read_cache(manager._file_stat()) is None
+
+
+def test_cache_can_be_disabled(manager, tmp_path, monkeypatch):
+    monkeypatch.setenv(ENV_CACHE_DIR, "off")
+    assert manager._load_config().get("推送队列.max_size") == 10
+    assert not (tmp_path / "cache").exists()
+
+
+def test_corrupt_cache_is_ignored(manager):
+    manager._load_config()
+    manager._cache_path().write_bytes(b"\x00garbage")
+    assert manager._load_config().get("推送队列.max_size") == 10
+
+
+# ---- 热加载 ----
+
+def write_config(tmp_path, text: str):
+    """原子替换配置文件（与编辑器保存方式一致），修改时间纳秒级变化"""
+    temp = tmp_path / "config.yaml.tmp"
+    temp.write_text(text, encoding="utf-8")
+    os.replace(temp, tmp_path / "config.yaml")
+
+
+def test_reload_notifies_changed_keys(manager, tmp_path):
+    changes = []
+    manager.subscribe("推送队列.max_size", lambda value: changes.append(("max_size", value)))
+    manager.subscribe("推送队列.overflow", lambda value: changes.append(("overflow", value)))
+    manager.snapshot()
+    write_config(tmp_path, "推送队列:\n  max_size: 10\n  overflow: drop_newest\n")
+    manager.reload()
+    assert changes == [("overflow", "drop_newest")]
+    assert manager.get_config("推送队列.overflow") == "drop_newest"
+
+
+def test_reload_notifies_removed_keys(manager, tmp_path):
+    changes = []
+    manager.subscribe("推送队列.max_size", changes.append)
+    manager.snapshot()
+    write_config(tmp_path, "推送队列: {}\n")
+    manager.reload()
+    assert changes == [None]
+    assert manager.get_config("推送队列.max_size", 1000, int) == 1000
+    # 再次加入时按新值通知
+    write_config(tmp_path, "推送队列:\n  max_size: 5\n")
+    manager.reload()
+    assert changes == [None, 5]
+
+
+def test_reload_keeps_snapshot_on_parse_error(manager, tmp_path):
+    changes = []
+    manager.subscribe("推送队列.max_size", changes.append)
+    manager.snapshot()
+    write_config(tmp_path, "推送队列: [\n")
+    manager.reload()
+    assert changes == []
+    assert manager.get_config("推送队列.max_size") == 10
+
+
+def test_callback_errors_are_isolated(manager, tmp_path):
+    changes = []
+
+    def broken(value):
+        raise RuntimeError("boom")
+
+    manager.subscribe("推送队列.max_size", broken)
+    manager.subscribe("推送队列.max_size", changes.append)
+    manager.snapshot()
+    write_config(tmp_path, "推送队列:\n  max_size: 11\n")
+    manager.reload()
+    assert changes == [11]
+
+
+def test_watcher_dispatches_to_loop_and_stops(manager, tmp_path):
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+        seen = []
+
+        def callback(value):
+            seen.append((value, threading.current_thread() is threading.main_thread()))
+            changed.set()
+
+        manager.subscribe("推送队列.max_size", callback)
+        manager.start_watcher(poll_interval=0.05, loop=loop)
+        watcher = manager._watcher
+        write_config(tmp_path, "推送队列:\n  max_size: 42\n")
+        await asyncio.wait_for(changed.wait(), 5)
+        manager.stop_watcher()
+        return seen, watcher
+
+    seen, watcher = asyncio.run(scenario())
+    # 回调在事件循环线程中执行
+    assert seen == [(42, True)]
+    assert not watcher.is_alive()
+    assert manager._watcher is None and manager._loop is None
@@ -0,0 +1,156 @@
+import asyncio
+
+from src.connection import (CLOSE_INTERNAL_ERROR, ClientConnection, OVERFLOW_DISCONNECT, OVERFLOW_DROP_NEWEST,
+                            OVERFLOW_DROP_OLDEST)
+
+
+class FakeWebSocket:
+    """记录发送的帧；fail_after次发送后抛出异常"""
+
+    def __init__(self, fail_after: int = None):
+        self.frames = []
+        self.closed_with = None
+        self.fail_after = fail_after
+
+    async def send(self, message: dict):
+        if self.fail_after is not None and len(self.frames) >= self.fail_after:
+            raise ConnectionResetError("connection lost")
+        self.frames.append(message.get("text", message.get("bytes")))
+
+    async def close(self, code: int = 1000):
+        self.closed_with = code
+
+
+async def settle(conn: ClientConnection):
+    for _ in range(20):
+        await asyncio.sleep(0)
+    await conn.flush(1.0)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_events_are_sent_in_order():
+    async def scenario():
+        ws = FakeWebSocket()
+        conn = ClientConnection(ws, "s")
+        conn.start()
+        for i in range(5):
+            assert conn.enqueue(b'{"id":%d}' % i)
+        await settle(conn)
+        await conn.stop()
+        return ws.frames, conn.sent
+
+    frames, sent = run(scenario())
+    assert frames == ['{"id":%d}' % i for i in range(5)]
+    assert sent == 5
+
+
+def test_binary_frames():
+    async def scenario():
+        ws = FakeWebSocket()
+        conn = ClientConnection(ws, "s", binary=True)
+        conn.start()
+        conn.enqueue(b"\xff\xfe")
+        await settle(conn)
+        await conn.stop()
+        return ws.frames
+
+    assert run(scenario()) == [b"\xff\xfe"]
+
+
+def test_undecodable_body_is_dropped_without_killing_writer():
+    async def scenario():
+        ws = FakeWebSocket()
+        undelivered = []
+        failed = []
+        conn = ClientConnection(ws, "s", on_undelivered=lambda secret, body: undelivered.append(body),
+                                on_failed=failed.append)
+        conn.start()
+        conn.enqueue(b'{"id":"\xff"}')
+        conn.enqueue('{"id":"中文"}'.encode())
+        await settle(conn)
+        closed = conn.closed
+        await conn.stop()
+        return ws, conn, undelivered, failed, closed
+
+    ws, conn, undelivered, failed, closed = run(scenario())
+    assert ws.frames == ['{"id":"中文"}']
+    assert conn.dropped == 1
+    assert not closed and ws.closed_with is None
+    # 无效事件不再交给离线缓存，重连后不会再次卡住连接
+    assert undelivered == [] and failed == []
+
+
+def test_undecodable_body_in_batch():
+    async def scenario():
+        ws = FakeWebSocket()
+        conn = ClientConnection(ws, "s")
+        conn.configure_batch(10, 0)
+        conn.enqueue(b'{"id":1}')
+        conn.enqueue(b'{"id":"\xc3"}')
+        conn.enqueue(b'{"id":3}')
+        conn.start()
+        await settle(conn)
+        await conn.stop()
+        return ws.frames, conn.dropped
+
+    frames, dropped = run(scenario())
+    assert frames == ['[{"id":1},{"id":3}]']
+    assert dropped == 1
+
+
+def test_send_failure_closes_and_deregisters():
+    async def scenario():
+        ws = FakeWebSocket(fail_after=1)
+        undelivered = []
+        failed = []
+        conn = ClientConnection(ws, "s", on_undelivered=lambda secret, body: undelivered.append(body),
+                                on_failed=failed.append)
+        conn.start()
+        for i in range(3):
+            conn.enqueue(b'{"id":%d}' % i)
+        await settle(conn)
+        accepted = conn.enqueue(b'{"id":9}')
+        return ws, conn, undelivered, failed, accepted
+
+    ws, conn, undelivered, failed, accepted = run(scenario())
+    assert ws.frames == ['{"id":0}']
+    assert conn.closed and not accepted
+    assert ws.closed_with == CLOSE_INTERNAL_ERROR
+    assert failed == [conn]
+    # 未送达的事件按顺序交给离线缓存
+    assert undelivered == [b'{"id":1}', b'{"id":2}']
+
+
+def test_overflow_policies():
+    conn = ClientConnection(FakeWebSocket(), "s", max_size=2, overflow=OVERFLOW_DROP_OLDEST)
+    for i in range(3):
+        assert conn.enqueue(b"%d" % i)
+    assert list(conn.queue) == [b"1", b"2"] and conn.dropped == 1
+
+    conn = ClientConnection(FakeWebSocket(), "s", max_size=2, overflow=OVERFLOW_DROP_NEWEST)
+    assert [conn.enqueue(b"%d" % i) for i in range(3)] == [True, True, False]
+    assert list(conn.queue) == [b"0", b"1"]
+
+
+def test_overflow_disconnect():
+    async def scenario():
+        ws = FakeWebSocket()
+        conn = ClientConnection(ws, "s", max_size=1, overflow=OVERFLOW_DISCONNECT)
+        results = [conn.enqueue(b"0"), conn.enqueue(b"1")]
+        await asyncio.sleep(0)
+        return results, ws.closed_with
+
+    results, closed_with = run(scenario())
+    assert results == [True, False]
+    assert closed_with == 1013
+
+
+def test_max_size_is_clamped():
+    for max_size in (0, -5):
+        conn = ClientConnection(FakeWebSocket(), "s", max_size=max_size)
+        assert conn.max_size == 1
+        assert conn.enqueue(b"0") and conn.enqueue(b"1")
+        assert list(conn.queue) == [b"1"] and conn.dropped == 1
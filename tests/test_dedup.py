@@ -0,0 +1,106 @@
+import json
+
+import pytest
+
+import src.dedup
+from src.dedup import DedupCache, event_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(src.dedup.time, "monotonic", clock)
+    return clock
+
+
+# ---- event_key ----
+
+def test_event_key_prefers_id():
+    assert event_key(json.dumps({"op": 0, "id": "evt-1", "s": 5, "d": {"id": "inner"}}).encode()) == "evt-1"
+    assert event_key(b'{"id":42}') == "42"
+
+
+def test_event_key_falls_back_to_op_and_seq():
+    assert event_key(b'{"op":0,"s":7,"d":{"id":"inner"}}') == "0:7"
+    assert event_key(b'{"s":3}') == "None:3"
+
+
+@pytest.mark.parametrize("body", [b'{"op":13,"d":{}}', b'{"s":null}', b'', b'not json'])
+def test_event_key_none(body):
+    assert event_key(body) is None
+
+
+# ---- DedupCache ----
+
+def test_seen_marks_duplicates(clock):
+    cache = DedupCache(ttl=60)
+    assert not cache.seen("a", "1")
+    assert cache.seen("a", "1")
+    # 不同密钥的相同事件互不影响
+    assert not cache.seen("b", "1")
+    assert len(cache) == 2
+    stats = cache.stats()
+    assert stats["checks"] == 3 and stats["duplicates"] == 1
+    assert stats["hit_rate"] == pytest.approx(1 / 3, abs=1e-6)
+
+
+def test_entries_expire_after_window(clock):
+    cache = DedupCache(ttl=60, buckets=6)
+    cache.seen("a", "old")
+    clock.now += 30
+    cache.seen("a", "new")
+    clock.now += 35
+    # old所在的桶已淘汰，new仍在窗口内
+    assert not cache.seen("a", "old")
+    assert cache.seen("a", "new")
+    clock.now += 3600
+    assert not cache.seen("a", "new")
+    assert len(cache) == 1
+
+
+def test_bucket_rotation_keeps_window(clock):
+    cache = DedupCache(ttl=60, buckets=6)
+    cache.seen("a", "1")
+    clock.now += 50
+    assert cache.seen("a", "1")
+    assert len(cache._buckets) == 6
+
+
+def test_full_bucket_rotates_early(clock):
+    cache = DedupCache(ttl=60, max_entries=4, buckets=2)
+    for i in range(5):
+        assert not cache.seen("a", str(i))
+    # 每桶最多2个：写满后提前切换，最旧的桶在到期前被淘汰
+    assert cache.evicted_early == 1
+    assert len(cache) <= 4
+    assert not cache.seen("a", "0")
+    assert cache.seen("a", "4")
+
+
+def test_forget(clock):
+    cache = DedupCache(ttl=60)
+    cache.seen("a", "1")
+    clock.now += 20
+    cache.seen("a", "2")
+    cache.forget("a", "1")
+    assert len(cache) == 1
+    assert not cache.seen("a", "1")
+    # 撤销不存在的键无影响
+    cache.forget("a", "missing")
+    assert len(cache) == 2
+
+
+def test_memory_bytes_grows(clock):
+    cache = DedupCache(ttl=60)
+    empty = cache.memory_bytes()
+    for i in range(100):
+        cache.seen("a", str(i))
+    assert cache.memory_bytes() > empty
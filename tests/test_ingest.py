@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from src.ingest import BodyReader, BodyTooLarge, BufferPool
+
+
+class FakeRequest:
+    def __init__(self, chunks, content_length=None, fail_after=None):
+        self.chunks = chunks
+        self.headers = {} if content_length is None else {"content-length": str(content_length)}
+        self.fail_after = fail_after
+        self.consumed = 0
+
+    async def stream(self):
+        for index, chunk in enumerate(self.chunks):
+            if index == self.fail_after:
+                raise ConnectionResetError("客户端断开")
+            self.consumed += 1
+            yield chunk
+
+
+def read(reader: BodyReader, request: FakeRequest) -> bytes:
+    return asyncio.run(reader.read(request))
+
+
+def test_single_chunk_is_returned_without_copy():
+    reader = BodyReader()
+    chunk = b'{"op":0}'
+    body = read(reader, FakeRequest([b"", chunk]))
+    assert body is chunk
+    assert reader.pool.allocated == 0
+    assert reader.in_flight == len(chunk)
+    reader.release(len(body))
+    assert reader.in_flight == 0 and reader.peak == len(chunk)
+
+
+def test_multiple_chunks_reuse_pooled_buffer():
+    reader = BodyReader()
+    assert read(reader, FakeRequest([b"abcdef", b"gh", b"ijkl"])) == b"abcdefghijkl"
+    # 复用的缓冲区比本次请求体长，返回值只包含本次写入的部分
+    assert read(reader, FakeRequest([b"xy", b"z"])) == b"xyz"
+    assert reader.pool.allocated == 1
+    assert reader.pool.stats()["free"] == 1
+
+
+def test_declared_length_over_limit_is_rejected_without_reading():
+    reader = BodyReader(max_size=10)
+    request = FakeRequest([b"x" * 20], content_length=20)
+    with pytest.raises(BodyTooLarge) as raised:
+        read(reader, request)
+    assert (raised.value.size, raised.value.limit) == (20, 10)
+    assert request.consumed == 0
+    assert reader.rejected == 1 and reader.in_flight == 0
+
+
+def test_streamed_body_over_limit_stops_reading():
+    reader = BodyReader(max_size=10)
+    request = FakeRequest([b"x" * 6, b"x" * 6, b"x" * 6])
+    with pytest.raises(BodyTooLarge) as raised:
+        read(reader, request)
+    assert raised.value.size == 12
+    assert request.consumed == 2
+    assert reader.rejected == 1 and reader.in_flight == 0 and reader.peak == 6
+
+
+def test_failed_read_releases_in_flight_bytes():
+    reader = BodyReader()
+    with pytest.raises(ConnectionResetError):
+        read(reader, FakeRequest([b"abc", b"def", b"ghi"], fail_after=2))
+    assert reader.in_flight == 0 and reader.rejected == 0
+    assert reader.pool.stats()["free"] == 1
+
+
+def test_pool_drops_oversized_and_surplus_buffers():
+    pool = BufferPool(size=1, retain=4)
+    small, large, extra = pool.acquire(), pool.acquire(), pool.acquire()
+    small[:] = b"ab"
+    large[:] = b"abcdefgh"
+    pool.release(large)
+    pool.release(small)
+    pool.release(extra)
+    assert pool.stats() == {"size": 1, "free": 1, "retained_bytes": 2, "allocated": 3}
+    assert pool.acquire() is small
+
+
+def test_configure_clamps_and_trims_pool():
+    reader = BodyReader(pool=BufferPool(size=4))
+    for buffer in [reader.pool.acquire() for _ in range(3)]:
+        reader.pool.release(buffer)
+    reader.configure(max_size=0, pool_size=1, retain=-1)
+    assert reader.max_size == 1
+    assert reader.pool.size == 1 and reader.pool.retain == 0
+    assert reader.stats()["pool"]["free"] == 1
@@ -0,0 +1,157 @@
+import asyncio
+
+import pytest
+
+from src.keepalive import CLOSE_GOING_AWAY, KeepaliveMonitor, PING_FRAME, TimingWheel
+
+
+def wheel_at_zero(tick=1.0, slots=8) -> TimingWheel:
+    wheel = TimingWheel(tick, slots)
+    wheel._origin = 0.0
+    return wheel
+
+
+class FakeConnection:
+    def __init__(self, secret="s", now=0.0):
+        self.secret = secret
+        self.last_activity = now
+        self.pinged_at = None
+        self.ping_answered = False
+        self.closed = False
+        self.controls = []
+        self.closed_with = None
+
+    def send_control(self, frame: bytes):
+        self.controls.append(frame)
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+        self.closed_with = code
+
+
+def monitor_at_zero(idle=10.0, evict=5.0) -> KeepaliveMonitor:
+    monitor = KeepaliveMonitor(idle, evict)
+    monitor.wheel._origin = 0.0
+    return monitor
+
+
+# ---- TimingWheel ----
+
+def test_wheel_fires_after_deadline():
+    wheel = wheel_at_zero()
+    wheel.schedule("a", 2.5)
+    wheel.schedule("b", 4.0)
+    assert wheel.advance(2.0) == []
+    assert wheel.advance(3.0) == ["a"]
+    assert wheel.advance(4.0) == ["b"]
+    assert len(wheel) == 0
+
+
+def test_wheel_reschedule_and_cancel():
+    wheel = wheel_at_zero()
+    wheel.schedule("a", 2.0)
+    wheel.schedule("a", 5.0)
+    assert len(wheel) == 1
+    assert wheel.advance(3.0) == []
+    wheel.schedule("b", 4.0)
+    wheel.cancel("b")
+    wheel.cancel("missing")
+    assert wheel.advance(5.0) == ["a"]
+
+
+def test_wheel_past_deadline_fires_next_tick():
+    wheel = wheel_at_zero()
+    wheel.advance(5.0)
+    wheel.schedule("a", 1.0)
+    assert wheel.advance(5.5) == []
+    assert wheel.advance(6.0) == ["a"]
+
+
+def test_wheel_multiple_rounds():
+    wheel = wheel_at_zero(slots=8)
+    wheel.schedule("far", 20.0)
+    # 同一槽位经过两次但未到期的条目保留
+    assert wheel.advance(12.0) == []
+    assert wheel.advance(19.0) == []
+    assert wheel.advance(20.0) == ["far"]
+
+
+def test_wheel_stalled_loop_processes_each_slot_once():
+    wheel = wheel_at_zero(slots=8)
+    for i in range(1, 6):
+        wheel.schedule(i, float(i))
+    assert sorted(wheel.advance(100.0)) == [1, 2, 3, 4, 5]
+
+
+# ---- KeepaliveMonitor ----
+
+def test_active_connection_is_rescheduled():
+    monitor = monitor_at_zero()
+    conn = FakeConnection()
+    monitor.watch(conn)
+    conn.last_activity = 8.0
+    monitor.advance(10.0)
+    assert conn.controls == [] and len(monitor.wheel) == 1
+    monitor.advance(18.0)
+    assert conn.controls == [PING_FRAME] and conn.pinged_at == 18.0
+
+
+def test_answered_ping_then_silence_is_evicted():
+    async def scenario():
+        monitor = monitor_at_zero()
+        conn = FakeConnection()
+        monitor.watch(conn)
+        monitor.advance(10.0)
+        assert conn.controls == [PING_FRAME]
+        conn.last_activity = 12.0  # 客户端回复pong
+        monitor.advance(15.0)
+        assert conn.ping_answered and conn.pinged_at is None
+        monitor.advance(22.0)
+        assert conn.controls == [PING_FRAME, PING_FRAME]
+        monitor.advance(27.0)
+        await asyncio.sleep(0)
+        return monitor, conn
+
+    monitor, conn = asyncio.run(scenario())
+    assert conn.closed_with == CLOSE_GOING_AWAY
+    assert monitor.pings == 2 and monitor.evicted == 1
+
+
+def test_receive_only_client_is_not_evicted():
+    async def scenario():
+        monitor = monitor_at_zero()
+        conn = FakeConnection()
+        monitor.watch(conn)
+        for now in range(1, 60):
+            monitor.advance(float(now))
+        await asyncio.sleep(0)
+        return monitor, conn
+
+    monitor, conn = asyncio.run(scenario())
+    # 从不回复ping的客户端由协议层ping检测失效，应用层只周期性发送ping
+    assert not conn.closed and monitor.evicted == 0
+    assert monitor.pings >= 3
+    assert len(monitor.wheel) == 1
+
+
+def test_closed_and_unwatched_connections_are_dropped():
+    monitor = monitor_at_zero()
+    closed = FakeConnection("closed")
+    gone = FakeConnection("gone")
+    monitor.watch(closed)
+    monitor.watch(gone)
+    closed.closed = True
+    monitor.unwatch(gone)
+    monitor.advance(10.0)
+    assert closed.controls == [] and gone.controls == []
+    assert len(monitor.wheel) == 0
+
+
+def test_configure_clamps_to_tick():
+    monitor = KeepaliveMonitor(tick=1.0)
+    monitor.configure(idle_timeout=0.1, evict_timeout=30)
+    assert monitor.idle_timeout == 1.0 and monitor.evict_timeout == 30.0
+    stats = monitor.stats()
+    assert stats["watched"] == 0 and stats["pings"] == 0
+    with pytest.raises(ValueError):
+        monitor.configure(idle_timeout="x")
@@ -0,0 +1,150 @@
+import json
+
+import pytest
+
+from src.lanes import LaneQueue, PriorityPolicy, SCHEDULE_STRICT, SCHEDULE_WEIGHTED
+
+LANES = [
+    {"name": "high", "weight": 3, "events": ["AT_MESSAGE_CREATE"]},
+    {"name": "normal", "weight": 2, "events": []},
+    {"name": "low", "weight": 1, "events": ["GUILD_MEMBER_ADD"]},
+]
+
+
+def event(kind: str, index: int) -> bytes:
+    return json.dumps({"op": 0, "id": f"{kind}-{index}", "d": {}, "t": kind}).encode()
+
+
+def fill(queue: LaneQueue, count: int = 6):
+    for i in range(count):
+        queue.append(f"h{i}".encode(), 0)
+        queue.append(f"n{i}".encode(), 1)
+        queue.append(f"l{i}".encode(), 2)
+
+
+def drain(queue: LaneQueue) -> list:
+    return [queue.popleft().decode() for _ in range(len(queue))]
+
+
+def test_policy_classify():
+    policy = PriorityPolicy(LANES)
+    assert policy.classify(event("AT_MESSAGE_CREATE", 0)) == 0
+    assert policy.classify(event("GUILD_MEMBER_ADD", 0)) == 2
+    assert policy.classify(event("UNLISTED", 0)) == 1
+    assert policy.classify(b'{"op":11}') == 1
+
+
+def test_policy_first_lane_wins_for_duplicate_event():
+    policy = PriorityPolicy([
+        {"name": "a", "events": ["x"]},
+        {"name": "b", "events": ["X"]},
+    ], default="b")
+    assert policy.lane("X") == 0
+
+
+@pytest.mark.parametrize("lanes, default, schedule", [
+    ([], "normal", SCHEDULE_WEIGHTED),
+    ([{"name": "a"}, {"name": "a"}], "a", SCHEDULE_WEIGHTED),
+    ([{"events": []}], "normal", SCHEDULE_WEIGHTED),
+    (LANES, "missing", SCHEDULE_WEIGHTED),
+    (LANES, "normal", "fifo"),
+])
+def test_policy_rejects_invalid_config(lanes, default, schedule):
+    with pytest.raises(ValueError):
+        PriorityPolicy(lanes, default, schedule)
+
+
+def test_policy_reconfigure_keeps_lane_count():
+    policy = PriorityPolicy(LANES)
+    with pytest.raises(ValueError):
+        policy.configure(LANES[:2])
+    assert policy.names == ["high", "normal", "low"]
+    policy.configure([dict(lane, weight=1) for lane in LANES], schedule=SCHEDULE_STRICT)
+    assert policy.weights == [1, 1, 1] and policy.strict
+
+
+def test_strict_order():
+    queue = LaneQueue(PriorityPolicy(LANES, schedule=SCHEDULE_STRICT))
+    fill(queue, 2)
+    assert drain(queue) == ["h0", "h1", "n0", "n1", "l0", "l1"]
+    assert not queue
+
+
+def test_weighted_order():
+    queue = LaneQueue(PriorityPolicy(LANES, schedule=SCHEDULE_WEIGHTED))
+    fill(queue)
+    assert drain(queue) == [
+        "h0", "h1", "h2", "n0", "n1", "l0",
+        "h3", "h4", "h5", "n2", "n3", "l1",
+        "n4", "n5", "l2", "l3", "l4", "l5",
+    ]
+
+
+def test_weighted_skips_empty_lanes():
+    queue = LaneQueue(PriorityPolicy(LANES))
+    for i in range(4):
+        queue.append(f"l{i}".encode(), 2)
+    queue.append(b"h0", 0)
+    # 空通道不占用份额，最高优先级通道在下一轮立即得到发送机会
+    assert drain(queue) == ["h0", "l0", "l1", "l2", "l3"]
+
+
+def test_append_classifies_by_event_type():
+    queue = LaneQueue(PriorityPolicy(LANES, schedule=SCHEDULE_STRICT))
+    low, high = event("GUILD_MEMBER_ADD", 0), event("AT_MESSAGE_CREATE", 0)
+    queue.append(low)
+    queue.append(high)
+    assert queue.depths() == {"high": 1, "normal": 0, "low": 1}
+    assert queue.popleft() == high
+
+
+def test_drop_lowest_lane_first():
+    queue = LaneQueue(PriorityPolicy(LANES))
+    queue.append(b"h0", 0)
+    queue.append(b"n0", 1)
+    queue.append(b"l0", 2)
+    queue.append(b"l1", 2)
+    assert [queue.drop() for _ in range(4)] == [b"l0", b"l1", b"n0", b"h0"]
+    assert len(queue) == 0
+    with pytest.raises(IndexError):
+        queue.drop()
+
+
+def test_extendleft_puts_back_in_front():
+    queue = LaneQueue(PriorityPolicy(LANES, schedule=SCHEDULE_STRICT))
+    high, normal, low = event("AT_MESSAGE_CREATE", 0), event("GUILD_CREATE", 0), event("GUILD_MEMBER_ADD", 0)
+    for body in (high, normal, low):
+        queue.append(body)
+    taken = [queue.popleft(), queue.popleft()]
+    assert taken == [high, normal]
+    # 写任务放回未发送的批次：按原顺序放在最前面
+    queue.extendleft(reversed(taken))
+    assert len(queue) == 3
+    assert [queue.popleft() for _ in range(3)] == [high, normal, low]
+
+
+def test_extendleft_restores_each_lane():
+    queue = LaneQueue(PriorityPolicy(LANES))
+    later = [event("GUILD_MEMBER_ADD", 9), event("AT_MESSAGE_CREATE", 9)]
+    for body in later:
+        queue.append(body)
+    batch = [event("GUILD_MEMBER_ADD", 0), event("AT_MESSAGE_CREATE", 0), event("GUILD_CREATE", 0),
+             event("GUILD_MEMBER_ADD", 1)]
+    queue.extendleft(reversed(batch))
+    assert len(queue) == 6
+    # 放回的事件回到各自通道，低优先级事件不会插到高优先级通道里
+    assert [list(lane) for lane in queue.lanes] == [
+        [batch[1], later[1]],
+        [batch[2]],
+        [batch[0], batch[3], later[0]],
+    ]
+    assert queue.depths() == {"high": 2, "normal": 1, "low": 3}
+
+
+def test_popleft_empty():
+    queue = LaneQueue(PriorityPolicy(LANES))
+    with pytest.raises(IndexError):
+        queue.popleft()
+    queue.append(b"x", 1)
+    queue.clear()
+    assert len(queue) == 0 and queue.depths() == {"high": 0, "normal": 0, "low": 0}
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from src.peek import peek_fields
+
+
+def test_top_level_scalars():
+    body = b'{"op": 0, "id": "evt-1", "s": 42, "ratio": -1.5e3, "ok": true, "bad": false, "none": null}'
+    assert peek_fields(body, ("op", "id", "s", "ratio", "ok", "bad", "none")) == {
+        "op": 0, "id": "evt-1", "s": 42, "ratio": -1500.0, "ok": True, "bad": False, "none": None,
+    }
+
+
+def test_missing_keys_are_absent():
+    assert peek_fields(b'{"op":0}', ("op", "id")) == {"op": 0}
+    assert peek_fields(b'{}', ("id",)) == {}
+    assert peek_fields(b'', ("id",)) == {}
+
+
+def test_nested_objects_with_same_key_are_ignored():
+    body = b'{"d":{"id":"inner","t":"NESTED","list":[{"id":"deep"}]},"id":"outer","t":"TOP"}'
+    assert peek_fields(body, ("id", "t")) == {"id": "outer", "t": "TOP"}
+
+
+def test_nested_only():
+    assert peek_fields(b'{"d":{"id":"inner"},"op":0}', ("id",)) == {}
+
+
+def test_object_values_are_not_scalars():
+    body = b'{"id":{"x":1},"t":["a"],"op":7}'
+    assert peek_fields(body, ("id", "t", "op")) == {"op": 7}
+
+
+def test_escaped_quotes():
+    body = json.dumps({"d": {"content": 'say "id":"fake"'}, "id": 'a"b\\c', "t": "X"}).encode()
+    assert peek_fields(body, ("id", "t")) == {"id": 'a"b\\c', "t": "X"}
+
+
+def test_backslash_before_closing_quote():
+    body = json.dumps({"content": "ends with \\", "id": "real"}).encode()
+    assert peek_fields(body, ("content", "id")) == {"content": "ends with \\", "id": "real"}
+
+
+def test_key_inside_string_value():
+    body = b'{"content":"{\\"id\\":\\"fake\\"}","id":"real"}'
+    assert peek_fields(body, ("id",)) == {"id": "real"}
+
+
+def test_unicode_escape():
+    body = json.dumps({"id": "中文"}).encode()
+    assert peek_fields(body, ("id",)) == {"id": "中文"}
+
+
+def test_invalid_escape_is_treated_as_missing():
+    assert peek_fields(b'{"id":"\\x","op":0}', ("id", "op")) == {"op": 0}
+
+
+def test_truncated_body():
+    assert peek_fields(b'{"op":0,"id":"unterminated', ("op", "id")) == {"op": 0}
+
+
+@pytest.mark.parametrize("body", [
+    b'{"op":1,"d":{"op":2},"s":3}',
+    b'{ "op" : 1 , "s" : 3 }',
+    b'{\n  "op": 1,\n  "s": 3\n}',
+])
+def test_whitespace_and_order(body):
+    assert peek_fields(body, ("op", "s")) == {"op": 1, "s": 3}
@@ -0,0 +1,149 @@
+import asyncio
+
+from src.connection import ClientConnection, OVERFLOW_DROP_NEWEST
+from src.registry import (ConnectionRegistry, MODE_BROADCAST, MODE_LEAST_QUEUE, MODE_REPLACE, MODE_ROUND_ROBIN)
+
+AT_MESSAGE = b'{"op":0,"d":{},"t":"AT_MESSAGE_CREATE"}'
+GUILD_CREATE = b'{"op":0,"d":{},"t":"GUILD_CREATE"}'
+
+
+class FakeWebSocket:
+    async def send(self, message: dict):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def connection(secret="s", **kwargs) -> ClientConnection:
+    return ClientConnection(FakeWebSocket(), secret, **kwargs)
+
+
+def queued(conn: ClientConnection) -> list:
+    return list(conn.queue)
+
+
+def test_replace_mode_evicts_previous_connection():
+    registry = ConnectionRegistry()
+    first, second = connection(), connection()
+    assert registry.add(first) == []
+    assert registry.add(second) == [first]
+    assert registry.get("s").members == (second,)
+    assert len(registry) == 1
+
+
+def test_modes_per_secret():
+    registry = ConnectionRegistry(MODE_BROADCAST, {"rr": MODE_ROUND_ROBIN, "bad": "unknown"})
+    assert registry.mode_for("rr") == MODE_ROUND_ROBIN
+    assert registry.mode_for("bad") == MODE_BROADCAST
+    assert registry.mode_for("other") == MODE_BROADCAST
+    assert ConnectionRegistry("unknown").default_mode == MODE_REPLACE
+
+
+def test_broadcast_delivers_to_all():
+    registry = ConnectionRegistry(MODE_BROADCAST)
+    members = [connection() for _ in range(3)]
+    for conn in members:
+        assert registry.add(conn) == []
+    assert registry.get("s").deliver(b"e1")
+    assert [queued(conn) for conn in members] == [[b"e1"]] * 3
+
+
+def test_round_robin_rotates_and_skips_full_members():
+    registry = ConnectionRegistry(MODE_ROUND_ROBIN)
+    full = connection(max_size=1, overflow=OVERFLOW_DROP_NEWEST)
+    members = [connection(), full, connection()]
+    for conn in members:
+        registry.add(conn)
+    subscribers = registry.get("s")
+    for i in range(4):
+        assert subscribers.deliver(b"%d" % i)
+    assert [queued(conn) for conn in members] == [[b"0", b"3"], [b"1"], [b"2"]]
+    # full已满：轮到它时交给下一个订阅者
+    assert subscribers.deliver(b"4")
+    assert queued(members[2]) == [b"2", b"4"]
+    assert queued(full) == [b"1"]
+
+
+def test_least_queue_prefers_shortest_queue():
+    registry = ConnectionRegistry(MODE_LEAST_QUEUE)
+    busy, idle = connection(), connection()
+    registry.add(busy)
+    registry.add(idle)
+    busy.enqueue(b"backlog")
+    assert registry.get("s").deliver(b"e")
+    assert queued(idle) == [b"e"]
+
+
+def test_max_subscribers_evicts_oldest():
+    registry = ConnectionRegistry(MODE_BROADCAST, max_subscribers=2)
+    members = [connection() for _ in range(3)]
+    registry.add(members[0])
+    registry.add(members[1])
+    assert registry.add(members[2]) == [members[0]]
+    assert registry.get("s").members == (members[1], members[2])
+
+
+def test_subscription_filters():
+    registry = ConnectionRegistry(MODE_BROADCAST)
+    everything = connection()
+    mentions = connection()
+    mentions.events = frozenset({"AT_MESSAGE_CREATE"})
+    registry.add(everything)
+    assert not registry.get("s").filtered
+    registry.add(mentions)
+    subscribers = registry.get("s")
+    assert subscribers.filtered
+    assert subscribers.deliver(AT_MESSAGE)
+    assert subscribers.deliver(GUILD_CREATE)
+    assert queued(everything) == [AT_MESSAGE, GUILD_CREATE]
+    assert queued(mentions) == [AT_MESSAGE]
+    assert mentions.filtered == 1
+    registry.remove(everything)
+    # 没有订阅者需要的事件视为已处理
+    assert not subscribers.accepts("GUILD_CREATE")
+    assert subscribers.deliver(GUILD_CREATE)
+    assert queued(mentions) == [AT_MESSAGE]
+
+
+def test_remove_and_connections():
+    registry = ConnectionRegistry(MODE_BROADCAST)
+    a, b, other = connection(), connection(), connection("t")
+    for conn in (a, b, other):
+        registry.add(conn)
+    assert set(registry.connections()) == {a, b, other}
+    assert registry.remove(a)
+    assert not registry.remove(a)
+    assert registry.remove(b)
+    assert registry.get("s") is None
+    assert registry.get("t").deliver(b"x")
+    assert len(registry) == 1
+
+
+def test_deliver_without_members():
+    registry = ConnectionRegistry()
+    conn = connection()
+    registry.add(conn)
+    subscribers = registry.get("s")
+    registry.remove(conn)
+    assert not subscribers.deliver(b"x")
+
+
+def test_registration_lock_is_shared_per_secret():
+    async def scenario():
+        registry = ConnectionRegistry()
+        lock = registry.registration_lock("s")
+        assert registry.registration_lock("s") is lock
+        assert registry.registration_lock("t") is not lock
+        order = []
+
+        async def register(name):
+            async with registry.registration_lock("s"):
+                order.append(f"{name}-start")
+                await asyncio.sleep(0)
+                order.append(f"{name}-end")
+
+        await asyncio.gather(register("a"), register("b"))
+        return order
+
+    assert asyncio.run(scenario()) == ["a-start", "a-end", "b-start", "b-end"]
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.function import verify_webhook_signature
+from src.signer import SIGNATURE_HEX_LENGTH, SignatureEngine, signature_engine
+
+SECRET = "DG5g3B4j9X2KOErG"
+
+
+def test_sign_and_verify():
+    engine = SignatureEngine()
+    signature = engine.sign(SECRET, b"1700000000body")
+    assert len(signature) == SIGNATURE_HEX_LENGTH
+    assert engine.verify(SECRET, signature, b"1700000000body")
+    assert not engine.verify(SECRET, signature, b"1700000000tampered")
+    assert not engine.verify("another-secret-value", signature, b"1700000000body")
+
+
+@pytest.mark.parametrize("signature", [None, "", "ab", "zz" * 64, "00" * 63])
+def test_malformed_signatures_are_rejected(signature):
+    assert not SignatureEngine().verify(SECRET, signature, b"message")
+
+
+def test_short_secrets_are_padded():
+    engine = SignatureEngine()
+    assert engine._seed("abc") == b"abc" * 10 + b"ab"
+    assert engine.verify("abc", engine.sign("abc", b"m"), b"m")
+
+
+def test_key_cache_is_lru():
+    engine = SignatureEngine(cache_size=2)
+    first = engine.get_keys("secret-a")
+    engine.get_keys("secret-b")
+    assert engine.get_keys("secret-a") is first
+    engine.get_keys("secret-c")
+    # secret-b最久未使用，被淘汰
+    assert list(engine._keys) == ["secret-a", "secret-c"]
+    engine.configure(cache_size=1)
+    assert list(engine._keys) == ["secret-c"]
+    engine.evict("secret-c")
+    assert not engine._keys
+
+
+def test_offload_to_thread_pool():
+    async def scenario(engine):
+        message = b"payload"
+        signature = engine.sign(SECRET, message)
+        threads = set()
+        original = engine.verify
+
+        def recording_verify(*args):
+            threads.add(threading.current_thread().name)
+            return original(*args)
+
+        engine.verify = recording_verify
+        results = await asyncio.gather(*(engine.verify_async(SECRET, signature, message) for _ in range(5)))
+        return results, threads
+
+    engine = SignatureEngine(offload_rate=2, max_workers=2)
+    try:
+        results, threads = asyncio.run(scenario(engine))
+    finally:
+        engine.shutdown()
+    assert results == [True] * 5
+    # 每秒前2次在事件循环中执行，其余转入线程池
+    assert threading.main_thread().name in threads
+    assert any(name.startswith("signer") for name in threads)
+
+
+def test_verify_async_skips_malformed_without_offload():
+    engine = SignatureEngine(offload_rate=0)
+    assert not asyncio.run(engine.verify_async(SECRET, "bad", b"m"))
+    assert engine._executor is None
+
+
+@pytest.mark.parametrize("timestamp, expected", [
+    ("1700000000", True),
+    ("1700000299", True),
+    ("1699999701", True),
+    ("1700000301", False),
+    ("1699999000", False),
+    ("not-a-number", False),
+    ("nan", False),
+    (None, False),
+])
+def test_timestamp_freshness(timestamp, expected):
+    engine = SignatureEngine(max_age=300)
+    assert engine.fresh(timestamp, now=1700000000.0) is expected
+
+
+def test_freshness_can_be_disabled():
+    engine = SignatureEngine()
+    engine.configure(max_age=0)
+    assert engine.fresh("0", now=1700000000.0)
+    engine.configure(max_age=-5)
+    assert engine.max_age == 0.0
+
+
+def test_verify_webhook_signature_rejects_stale_timestamps(monkeypatch):
+    body = b'{"op":0,"d":{}}'
+    fresh = str(int(time.time()))
+    stale = str(int(time.time()) - 3600)
+    monkeypatch.setattr(signature_engine, "max_age", 300)
+
+    def check(timestamp, signed_timestamp=None):
+        signature = signature_engine.sign(SECRET, (signed_timestamp or timestamp).encode() + body)
+        return asyncio.run(verify_webhook_signature(SECRET, signature, timestamp, body))
+
+    assert check(fresh)
+    # 截获的旧请求签名有效，但时间戳超出窗口
+    assert not check(stale)
+    assert not check(fresh, signed_timestamp=stale)
+    assert not asyncio.run(verify_webhook_signature(SECRET, None, fresh, body))
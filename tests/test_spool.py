@@ -0,0 +1,177 @@
+import os
+import time
+
+import pytest
+
+from src.spool import CURSOR_FILE, RECORD_HEADER, SEGMENT_SUFFIX, Spool, fcntl
+
+
+def crash(spool: Spool):
+    """模拟进程崩溃：不封存分段，直接释放映射（预分配的尾部保留在磁盘上）"""
+    for log in spool._logs.values():
+        for segment in log.segments:
+            if segment._map is not None:
+                segment._map.close()
+                segment._file.close()
+                segment._map = segment._file = None
+    spool._logs.clear()
+
+
+def segment_files(spool: Spool, secret: str) -> list:
+    return sorted((spool.root / spool._dirname(secret)).glob(f"*{SEGMENT_SUFFIX}"))
+
+
+def test_append_assigns_increasing_offsets(tmp_path):
+    spool = Spool(str(tmp_path))
+    offsets = [spool.append("a", f"event-{i}".encode()) for i in range(5)]
+    assert offsets == [1, 2, 3, 4, 5]
+    assert spool.append("b", b"other") == 1
+    assert spool.log("a").read(1) == [(i + 1, f"event-{i}".encode()) for i in range(5)]
+    assert spool.log("a").read(4) == [(4, b"event-3"), (5, b"event-4")]
+    assert spool.has_pending("a")
+    assert not spool.has_pending("missing")
+    spool.close()
+
+
+def test_read_limit(tmp_path):
+    spool = Spool(str(tmp_path))
+    for i in range(10):
+        spool.append("a", b"x")
+    assert [offset for offset, _ in spool.log("a").read(1, limit=3)] == [1, 2, 3]
+    spool.close()
+
+
+def test_roll_to_new_segment(tmp_path):
+    body = b"x" * 100
+    record = RECORD_HEADER.size + len(body)
+    spool = Spool(str(tmp_path), segment_bytes=record * 3)
+    for _ in range(7):
+        spool.append("a", body)
+    log = spool.log("a")
+    assert [segment.base_offset for segment in log.segments] == [1, 4, 7]
+    assert all(segment.sealed for segment in log.segments[:-1])
+    assert [offset for offset, _ in log.read(1)] == list(range(1, 8))
+    # 从分段中间开始读取
+    assert [offset for offset, _ in log.read(5)] == [5, 6, 7]
+    spool.close()
+    # 封存后截断到实际长度
+    assert [path.stat().st_size for path in segment_files(spool, "a")] == [record * 3, record * 3, record]
+
+
+def test_oversized_record_gets_own_segment(tmp_path):
+    spool = Spool(str(tmp_path), segment_bytes=64)
+    spool.append("a", b"small")
+    spool.append("a", b"y" * 200)
+    assert spool.log("a").read(1) == [(1, b"small"), (2, b"y" * 200)]
+    spool.close()
+
+
+def test_recover_after_crash_with_preallocated_tail(tmp_path):
+    spool = Spool(str(tmp_path), segment_bytes=4096)
+    for i in range(3):
+        spool.append("a", f"event-{i}".encode())
+    spool.flush_all()
+    crash(spool)
+    (path,) = segment_files(spool, "a")
+    assert path.stat().st_size == 4096
+
+    recovered = Spool(str(tmp_path), segment_bytes=4096)
+    log = recovered.log("a")
+    assert log.read(1) == [(1, b"event-0"), (2, b"event-1"), (3, b"event-2")]
+    assert log.next_offset == 4
+    # 预分配但未使用的尾部被截掉
+    assert path.stat().st_size == sum(RECORD_HEADER.size + len(f"event-{i}") for i in range(3))
+    assert recovered.append("a", b"after") == 4
+    assert [offset for offset, _ in log.read(1)] == [1, 2, 3, 4]
+    recovered.close()
+
+
+def test_recover_drops_empty_segment(tmp_path):
+    spool = Spool(str(tmp_path), segment_bytes=4096)
+    spool.log("a")._active(16)
+    crash(spool)
+    recovered = Spool(str(tmp_path))
+    assert recovered.log("a").segments == []
+    assert segment_files(recovered, "a") == []
+    assert recovered.append("a", b"first") == 1
+    recovered.close()
+
+
+def test_cursor_commit_persists(tmp_path):
+    spool = Spool(str(tmp_path))
+    for i in range(4):
+        spool.append("a", b"x")
+    log = spool.log("a")
+    log.commit_cursor(2)
+    log.commit_cursor(1)
+    assert log.cursor == 2
+    assert (log.directory / CURSOR_FILE).read_text() == "2"
+    assert spool.has_pending("a")
+    spool.close()
+
+    reopened = Spool(str(tmp_path))
+    log = reopened.log("a")
+    assert log.cursor == 2
+    assert [offset for offset, _ in log.read(log.cursor + 1)] == [3, 4]
+    log.commit_cursor(4)
+    assert not reopened.has_pending("a")
+    reopened.close()
+
+
+def test_offsets_stay_monotonic_after_segments_removed(tmp_path):
+    spool = Spool(str(tmp_path))
+    for i in range(3):
+        spool.append("a", b"x")
+    spool.log("a").commit_cursor(3)
+    spool.close()
+    for path in segment_files(spool, "a"):
+        path.unlink()
+    reopened = Spool(str(tmp_path))
+    assert reopened.append("a", b"y") == 4
+    reopened.close()
+
+
+def test_retention_by_size(tmp_path):
+    body = b"x" * 100
+    record = RECORD_HEADER.size + len(body)
+    spool = Spool(str(tmp_path), segment_bytes=record * 2, max_bytes=record * 4)
+    for _ in range(10):
+        spool.append("a", body)
+    log = spool.log("a")
+    # 滚动新分段时删除最旧的已封存分段，直到总大小不超过上限
+    assert [segment.base_offset for segment in log.segments] == [5, 7, 9]
+    assert len(segment_files(spool, "a")) == len(log.segments)
+    assert log.read(1)[-1][0] == 10
+    spool.close()
+
+
+def test_retention_by_age(tmp_path):
+    body = b"x" * 100
+    record = RECORD_HEADER.size + len(body)
+    spool = Spool(str(tmp_path), segment_bytes=record * 2, max_age=3600)
+    for _ in range(5):
+        spool.append("a", body)
+    log = spool.log("a")
+    assert len(log.segments) == 3
+    expired = time.time() - 7200
+    os.utime(log.segments[0].path, (expired, expired))
+    spool.enforce_retention()
+    assert [segment.base_offset for segment in log.segments] == [3, 5]
+    # 当前分段即使过期也保留
+    for segment in log.segments:
+        os.utime(segment.path, (expired, expired))
+    spool.enforce_retention()
+    assert [segment.base_offset for segment in log.segments] == [5]
+    spool.close()
+
+
+@pytest.mark.skipif(fcntl is None, reason="平台不支持文件锁")
+def test_acquire_is_exclusive(tmp_path):
+    first = Spool(str(tmp_path))
+    second = Spool(str(tmp_path))
+    assert first.acquire()
+    assert first.acquire()
+    assert not second.acquire()
+    first.close()
+    assert second.acquire()
+    second.close()
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from src.subscription import TAIL_WINDOW, event_type, intent_events, resolve_subscription
+
+
+def test_tail_fast_path():
+    body = json.dumps({"op": 0, "id": "1", "d": {"content": "x" * 2000}, "s": 1, "t": "AT_MESSAGE_CREATE"}).encode()
+    assert event_type(body) == "AT_MESSAGE_CREATE"
+
+
+def test_tail_with_whitespace():
+    assert event_type(b'{"op":0,"d":{},"t" : "GUILD_CREATE" }\n') == "GUILD_CREATE"
+
+
+def test_nested_t_at_end_is_not_top_level():
+    body = b'{"op":0,"d":{"id":"1","t":"NESTED"}}'
+    assert event_type(body) is None
+
+
+def test_nested_t_with_top_level_t_first():
+    body = b'{"op":0,"t":"TOP","d":{"id":"1","t":"NESTED"}}'
+    assert event_type(body) == "TOP"
+
+
+def test_t_inside_string_value():
+    body = json.dumps({"op": 0, "d": {"content": ',"t":"FAKE"}'}}).encode()
+    assert event_type(body) is None
+
+
+def test_fallback_when_t_is_not_last():
+    body = json.dumps({"op": 0, "t": "C2C_MESSAGE_CREATE", "d": {"content": "y" * (TAIL_WINDOW * 4)}}).encode()
+    assert event_type(body) == "C2C_MESSAGE_CREATE"
+
+
+@pytest.mark.parametrize("body", [
+    b'{"op":11}',
+    b'{"op":0,"t":null}',
+    b'{"op":0,"t":5}',
+    b'not json',
+])
+def test_non_dispatch_events(body):
+    assert event_type(body) is None
+
+
+def test_intent_events():
+    assert intent_events(1 << 30) == {"AT_MESSAGE_CREATE", "PUBLIC_MESSAGE_DELETE"}
+    assert "GUILD_CREATE" in intent_events("GUILDS")
+
+
+def test_resolve_subscription():
+    assert resolve_subscription() is None
+    assert resolve_subscription(events="at_message_create", intents="INTERACTION") == frozenset(
+        {"AT_MESSAGE_CREATE", "INTERACTION_CREATE"})
+
+
+def test_unknown_intent():
+    with pytest.raises(ValueError):
+        intent_events("NOT_AN_INTENT")
@@ -0,0 +1,127 @@
+import asyncio
+import json
+from time import perf_counter
+
+import pytest
+
+from src.connection import ClientConnection
+from src.lanes import LaneQueue, PriorityPolicy
+from src.tracing import Tracer, parse_rids
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def send(self, message: dict):
+        self.frames.append(message.get("text", message.get("bytes")))
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def test_envelope_wraps_events_with_rids():
+    tracer = Tracer()
+    session = tracer.open("envelope-secret")
+    now = perf_counter()
+    frame = json.loads(session.envelope([(b'{"id":"a"}', now - 0.5)], False))
+    assert frame["op"] == "event" and frame["event"] == {"id": "a"}
+    # 接收时间取自入队时随事件保存的时间戳
+    assert frame["fwd_ts"] - frame["recv_ts"] == pytest.approx(500, abs=50)
+    frames = json.loads(session.envelope([(b'{"id":"b"}', now), (b'{"id":"c"}', now)], True))
+    assert [item["event"]["id"] for item in frames] == ["b", "c"]
+    assert [item["rid"] for item in frames] == [frame["rid"] + 1, frame["rid"] + 2]
+    assert list(session.pending) == [frame["rid"], frame["rid"] + 1, frame["rid"] + 2]
+
+
+def test_ack_records_latency_and_ignores_unknown_rids():
+    tracer = Tracer()
+    session = tracer.open("ack-secret")
+    frames = json.loads(session.envelope([(b"{}", perf_counter()), (b"{}", perf_counter())], True))
+    rids = [item["rid"] for item in frames]
+    assert tracer.ack(session, [rids[0], rids[0], 999999]) == 1
+    assert session.acked == 1 and list(session.pending) == [rids[1]]
+    assert session.stats()["processing"]["count"] == 1
+
+
+def test_max_pending_flags_oldest():
+    tracer = Tracer(max_pending=2)
+    session = tracer.open("overflow-secret")
+    now = perf_counter()
+    session.envelope([(b"{}", now)] * 3, True)
+    assert len(session.pending) == 2
+    assert session.unacked == 1 and tracer.unacked == 1
+
+
+def test_sweep_flags_expired_events():
+    tracer = Tracer(ack_timeout=10)
+    session = tracer.open("sweep-secret")
+    session.envelope([(b"{}", perf_counter())], False)
+    started = perf_counter()
+    session.envelope([(b"{}", started)], False)
+    rids = list(session.pending)
+    session.pending[rids[0]] = (started - 20, started - 20)
+    tracer.sweep(started + 1)
+    assert list(session.pending) == rids[1:]
+    assert session.unacked == 1
+    tracer.sweep(started + 11)
+    assert not session.pending and session.unacked == 2
+
+
+def test_close_flags_pending():
+    tracer = Tracer()
+    session = tracer.open("close-secret")
+    session.envelope([(b"{}", perf_counter())], False)
+    tracer.close(session)
+    assert session not in tracer.sessions
+    assert session.unacked == 1 and not session.pending
+
+
+def test_parse_rids():
+    assert parse_rids({"op": "ack", "rid": 3}) == [3]
+    assert parse_rids({"op": "ack", "rids": [1, "2", None]}) == [1, 2]
+    assert parse_rids({"op": "ack"}) == []
+    with pytest.raises(ValueError):
+        parse_rids({"op": "ack", "rids": "1,2"})
+
+
+def test_connection_carries_received_time_with_queued_event():
+    async def scenario():
+        tracer = Tracer()
+        ws = FakeWebSocket()
+        conn = ClientConnection(ws, "conn-secret", max_size=2)
+        conn.trace = tracer.open("conn-secret")
+        received = perf_counter() - 1.0
+        conn.enqueue(b'{"id":"dropped"}', received)
+        conn.enqueue(b'{"id":"a"}', received)
+        # 溢出丢弃最早的事件，时间戳随事件一同丢弃
+        conn.enqueue(b'{"id":"b"}')
+        assert [body for body, _ in conn.queue] == [b'{"id":"a"}', b'{"id":"b"}']
+        conn.start()
+        for _ in range(10):
+            await asyncio.sleep(0)
+        await conn.stop()
+        return ws.frames
+
+    first, second = [json.loads(frame) for frame in asyncio.run(scenario())]
+    assert first["event"] == {"id": "a"} and second["event"] == {"id": "b"}
+    assert first["fwd_ts"] - first["recv_ts"] >= 1000
+    assert second["fwd_ts"] - second["recv_ts"] < 1000
+
+
+def test_traced_events_keep_their_lane_and_are_handed_off_as_bodies():
+    policy = PriorityPolicy([{"name": "high", "events": ["AT_MESSAGE_CREATE"]}, {"name": "normal"}], "normal")
+    undelivered = []
+    conn = ClientConnection(FakeWebSocket(), "lane-secret", priority=policy,
+                            on_undelivered=lambda secret, body: undelivered.append(body))
+    conn.trace = Tracer().open("lane-secret")
+    high = b'{"op":0,"t":"AT_MESSAGE_CREATE"}'
+    normal = b'{"op":0,"t":"GUILD_CREATE"}'
+    conn.enqueue(normal)
+    conn.enqueue(high)
+    assert isinstance(conn.queue, LaneQueue) and conn.lanes.depths() == {"high": 1, "normal": 1}
+    taken = [conn.queue.popleft(), conn.queue.popleft()]
+    conn.queue.extendleft(reversed(taken))
+    assert conn.lanes.depths() == {"high": 1, "normal": 1}
+    conn._hand_off()
+    assert undelivered == [high, normal]